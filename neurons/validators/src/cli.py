@@ -1,4 +1,5 @@
 import asyncio
+import json
 import logging
 import random
 import time
@@ -7,17 +8,25 @@ import uuid
 import click
 from datura.requests.miner_requests import ExecutorSSHInfo
 
+from core.config import settings
 from core.utils import configure_logs_of_other_modules
 from core.validator import Validator
-from services.ioc import ioc
-from services.miner_service import MinerService
-from services.docker_service import DockerService, REPOSITORYS
-from services.file_encrypt_service import FileEncryptService
 from payload_models.payloads import (
-    MinerJobRequestPayload,
     ContainerCreateRequest,
     CustomOptions,
+    MinerJobRequestPayload,
+)
+from services.docker_service import REPOSITORYS, DockerService
+from services.file_encrypt_service import FileEncryptService
+from services.hashcat_calibration import (
+    MIN_CALIBRATION_SAMPLES,
+    HashcatTimings,
+    calibrate,
+    load_hashcat_configs,
 )
+from services.ioc import ioc
+from services.miner_service import MinerService
+from services.redis_service import RedisService
 
 configure_logs_of_other_modules()
 logger = logging.getLogger(__name__)
@@ -128,10 +137,150 @@ def debug_send_machine_specs_to_connector():
 def debug_set_weights():
     """Debug setting weights"""
     validator = Validator()
-    subtensor = validator.get_subtensor()
+    asyncio.run(_debug_set_weights(validator))
+
+
+async def _debug_set_weights(validator: Validator):
     # fetch miners
-    miners = validator.fetch_miners(subtensor)
-    asyncio.run(validator.set_weights(miners=miners, subtensor=subtensor))
+    miners = await validator.fetch_miners()
+    await validator.set_weights(miners=miners)
+
+
+@cli.command()
+@click.option("--output", default="hashcat_configs.json", help="File to write the timing table to")
+@click.option(
+    "--min_samples",
+    type=int,
+    default=MIN_CALIBRATION_SAMPLES,
+    help="Job times a gpu count needs before its timing is replaced",
+)
+def calibrate_hashcat(output: str, min_samples: int):
+    """Derive the hashcat timing table from the job times recorded in redis, to review before loading"""
+    asyncio.run(_calibrate_hashcat(output, min_samples))
+
+
+async def _calibrate_hashcat(output: str, min_samples: int):
+    base_configs = load_hashcat_configs(settings.HASHCAT_CONFIGS_PATH)
+    samples = await HashcatTimings(RedisService()).load()
+    configs = calibrate(samples, base_configs=base_configs, min_samples=min_samples)
+
+    for gpu_model, config in configs.items():
+        calibration = config.get("calibration")
+        if not calibration:
+            continue
+        previous = (base_configs.get(gpu_model) or {}).get("average_time") or []
+        for index, count in enumerate(calibration["samples"]):
+            if count:
+                before = previous[index] if index < len(previous) else None
+                print(f"{gpu_model} x{index + 1}: {before} -> {config['average_time'][index]} ({count} samples)")
+
+    with open(output, "w") as file:
+        json.dump(configs, file, indent=4)
+    print(
+        f"Timing table written to {output}, review the changes above before loading it with "
+        f"HASHCAT_CONFIGS_PATH={output}"
+    )
+
+
+@cli.command()
+@click.option("--cycles", type=int, default=5, help="Number of sync cycles")
+@click.option("--latency", type=float, default=0.05, help="Chain round trip latency in seconds")
+@click.option("--neurons", type=int, default=256, help="Number of neurons in the subnet")
+def benchmark_sync_stall(cycles: int, latency: float, neurons: int):
+    """Benchmark event-loop stall of sync loop chain access against a local chain"""
+    from testing.benchmarks import benchmark_sync_stall
+
+    report = asyncio.run(benchmark_sync_stall(cycles=cycles, latency=latency, neurons=neurons))
+    for name, result in report.items():
+        print(name, result)
+
+
+@cli.command()
+@click.option("--sizes", default="256,1024,4096", help="Comma separated subnet sizes")
+@click.option("--repeats", type=int, default=20, help="Runs per size, the best one is reported")
+def benchmark_weights(sizes: str, repeats: int):
+    """Benchmark the score to weights transform against the per-miner loop"""
+    from testing.benchmarks import benchmark_weights
+
+    report = benchmark_weights(
+        sizes=tuple(int(size) for size in sizes.split(",")), repeats=repeats
+    )
+    for n, result in report.items():
+        print(n, result)
+
+
+@cli.command()
+@click.option("--latency", type=float, default=0.1, help="Round trip latency to the ssh server in seconds")
+@click.option("--bandwidth", type=float, default=None, help="Link bandwidth in Mbit/s, unlimited if empty")
+@click.option("--size_mb", type=int, default=32, help="Size of the uploaded files")
+@click.option("--repeats", type=int, default=3, help="Runs per mode, the best one is reported")
+def benchmark_transfer(latency: float, bandwidth: float | None, size_mb: int, repeats: int):
+    """Benchmark job file uploads over a local ssh server with injected latency"""
+    from testing.benchmarks import benchmark_transfer
+
+    report = asyncio.run(
+        benchmark_transfer(
+            latency=latency, bandwidth_mbps=bandwidth, size_mb=size_mb, repeats=repeats
+        )
+    )
+    for mode, result in report.items():
+        print(mode, result)
+
+
+@cli.command()
+@click.option("--bandwidth", type=float, default=100, help="Link bandwidth in Mbit/s")
+@click.option("--latency", type=float, default=0.05, help="Round trip latency to the ssh server in seconds")
+@click.option("--size_mb", type=int, default=16, help="Size of the probe payload each way")
+@click.option("--repeats", type=int, default=5, help="Network probes to run")
+def benchmark_throughput(bandwidth: float, latency: float, size_mb: int, repeats: int):
+    """Benchmark network probe accuracy and repeatability over a local bandwidth limited ssh server"""
+    from testing.benchmarks import benchmark_throughput
+
+    report = asyncio.run(
+        benchmark_throughput(bandwidth_mbps=bandwidth, latency=latency, size_mb=size_mb, repeats=repeats)
+    )
+    for name, result in report.items():
+        print(name, result)
+
+
+@cli.command()
+@click.option("--gpu_count", type=int, default=14, help="GPUs the challenges are made for")
+@click.option("--num_digits", type=int, default=11, help="Digits of the challenge passwords")
+@click.option("--count", type=int, default=50, help="Challenges per mode")
+def benchmark_challenges(gpu_count: int, num_digits: int, count: int):
+    """Benchmark event-loop time per hashcat challenge, inline, in a thread and from the pool"""
+    from testing.benchmarks import benchmark_challenges
+
+    report = asyncio.run(benchmark_challenges(gpu_count=gpu_count, num_digits=num_digits, count=count))
+    for mode, result in report.items():
+        print(mode, result)
+
+
+@cli.command()
+@click.option("--miners", type=int, default=256, help="Number of fake miners")
+@click.option("--executors", type=int, default=8, help="Executors per fake miner")
+@click.option("--job_time", type=float, default=1.0, help="Seconds the fake hashcat takes")
+@click.option("--gpu_count", type=int, default=1, help="GPUs per fake executor")
+@click.option(
+    "--redis_url",
+    default=None,
+    help="Redis to use, a local redis-server, or fakeredis without one, is started if empty",
+)
+def load_test(miners: int, executors: int, job_time: float, gpu_count: int, redis_url: str | None):
+    """Run the validator's sync cycle against local fake miners, executors, chain and redis"""
+    from testing.load_test import run_load_test
+
+    report = run_load_test(
+        miners=miners,
+        executors_per_miner=executors,
+        job_time=job_time,
+        gpu_count=gpu_count,
+        redis_url=redis_url,
+    )
+    stages = report.pop("stages")
+    print(report)
+    for stage, result in stages.items():
+        print(stage, result)
 
 
 @cli.command()
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import bittensor
+
+from core.metrics import CHAIN_ROUND_TRIP_SECONDS
+from core.utils import _m
+
+logger = logging.getLogger(__name__)
+
+BLOCK_TIME = 12
+
+
+class SubtensorClient:
+    """Long-lived chain client shared by the validator process.
+
+    Substrate queries are blocking websocket calls, so every call is executed on a
+    single dedicated worker thread (the substrate connection is not thread-safe) and
+    awaited from the event loop. Hyperparameters are cached per epoch and the current
+    block is read at most once per cycle.
+    """
+
+    def __init__(
+        self,
+        config: bittensor.config | None,
+        netuid: int,
+        subtensor_factory: Callable[[], Any] | None = None,
+        block_max_age: float = BLOCK_TIME,
+    ):
+        self.config = config
+        self.netuid = netuid
+        self.block_max_age = block_max_age
+        self._subtensor_factory = subtensor_factory or self._create_subtensor
+        self._subtensor = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="subtensor")
+
+        self._block: int | None = None
+        self._block_fetched_at: float = 0
+        self._epoch: int | None = None
+        self._hyperparameters: dict[str, int | float] = {}
+
+        self.default_extra = {"netuid": netuid}
+
+    def _create_subtensor(self):
+        # runs on the chain thread, where there is no current task to describe
+        logger.info(_m('Getting subtensor', extra=self.default_extra))
+        return bittensor.subtensor(config=self.config)
+
+    def _get_subtensor(self):
+        if self._subtensor is None:
+            self._subtensor = self._subtensor_factory()
+        return self._subtensor
+
+    def _call_sync(self, fn: Callable, *args, **kwargs):
+        try:
+            return fn(self._get_subtensor(), *args, **kwargs)
+        except Exception:
+            # drop the connection so that the next call reconnects
+            self._subtensor = None
+            raise
+
+    async def call(self, fn: Callable, *args, **kwargs):
+        """Run fn(subtensor, *args, **kwargs) on the chain thread."""
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        result = await loop.run_in_executor(
+            self._executor, lambda: self._call_sync(fn, *args, **kwargs)
+        )
+        CHAIN_ROUND_TRIP_SECONDS.set(time.perf_counter() - started_at)
+        return result
+
+    async def query(self, module: str, storage_function: str, params: list, block_hash=None):
+        return await self.call(
+            lambda subtensor: subtensor.substrate.query(
+                module, storage_function, params, block_hash=block_hash
+            ).value
+        )
+
+    def observe_block(self, block: int):
+        """Record a block seen by a block source, saving a chain read."""
+        self._block = block
+        self._block_fetched_at = time.monotonic()
+        self._rollover_epoch(block)
+
+    async def refresh_block(self) -> int:
+        block = await self.query("System", "Number", [])
+        self.observe_block(block)
+        return block
+
+    async def get_current_block(self) -> int:
+        """Return the current block, reading the chain at most once per cycle."""
+        if self._block is None or time.monotonic() - self._block_fetched_at >= self.block_max_age:
+            return await self.refresh_block()
+        return self._block
+
+    def _epoch_of(self, block: int, tempo: int) -> int:
+        return (block + self.netuid + 1) // (tempo + 1)
+
+    def _rollover_epoch(self, block: int):
+        tempo = self._hyperparameters.get("tempo")
+        if tempo is None:
+            return
+        epoch = self._epoch_of(block, tempo)
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._hyperparameters = {}
+
+    async def _get_hyperparameter(self, name: str, fetch: Callable) -> int | float:
+        if name not in self._hyperparameters:
+            self._hyperparameters[name] = await self.call(fetch)
+            if name == "tempo" and self._block is not None:
+                self._epoch = self._epoch_of(self._block, self._hyperparameters[name])
+        return self._hyperparameters[name]
+
+    async def get_tempo(self) -> int:
+        return await self._get_hyperparameter(
+            "tempo", lambda subtensor: subtensor.tempo(self.netuid)
+        )
+
+    async def get_weights_rate_limit(self) -> int:
+        return await self._get_hyperparameter(
+            "weights_rate_limit",
+            lambda subtensor: subtensor.substrate.query(
+                "SubtensorModule", "WeightsSetRateLimit", [self.netuid]
+            ).value,
+        )
+
+    async def get_min_allowed_weights(self) -> int:
+        return await self._get_hyperparameter(
+            "min_allowed_weights", lambda subtensor: subtensor.min_allowed_weights(netuid=self.netuid)
+        )
+
+    async def get_max_weight_limit(self) -> float:
+        return await self._get_hyperparameter(
+            "max_weight_limit", lambda subtensor: subtensor.max_weight_limit(netuid=self.netuid)
+        )
+
+    async def get_last_update(self) -> list[int]:
+        return await self.query("SubtensorModule", "LastUpdate", [self.netuid])
+
+    async def get_metagraph(self):
+        return await self.call(lambda subtensor: subtensor.metagraph(netuid=self.netuid))
+
+    async def get_block_hash(self, block: int) -> str:
+        return await self.call(lambda subtensor: subtensor.substrate.get_block_hash(block))
+
+    async def get_block_timestamp(self, block: int) -> int:
+        block_hash = await self.get_block_hash(block)
+        return await self.query("Timestamp", "Now", [], block_hash=block_hash)
+
+    async def is_hotkey_registered(self, hotkey_ss58: str) -> bool:
+        return await self.call(
+            lambda subtensor: subtensor.is_hotkey_registered(
+                netuid=self.netuid, hotkey_ss58=hotkey_ss58
+            )
+        )
+
+    async def set_weights(self, wallet, uids, weights) -> tuple[bool, str]:
+        return await self.call(
+            lambda subtensor: subtensor.set_weights(
+                wallet=wallet,
+                netuid=self.netuid,
+                uids=uids,
+                weights=weights,
+                wait_for_finalization=False,
+                wait_for_inclusion=False,
+            )
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,6 @@
-from typing import TYPE_CHECKING
 import argparse
 import pathlib
+from typing import TYPE_CHECKING
 
 import bittensor
 from pydantic import Field
@@ -31,6 +31,34 @@ class Settings(BaseSettings):
 
     INTERNAL_PORT: int = Field(env="INTERNAL_PORT", default=8000)
     BLOCKS_FOR_JOB: int = 50
+    # "subscription" pushes new block headers, "polling" reads the block once per block time
+    BLOCK_SOURCE: str = Field(env="BLOCK_SOURCE", default="subscription")
+    # "local" runs miner jobs in the validator process, "workers" shards them over
+    # worker processes (src/worker.py) through redis
+    JOB_DISPATCH: str = Field(env="JOB_DISPATCH", default="local")
+    JOB_WORKER_CONCURRENCY: int = Field(env="JOB_WORKER_CONCURRENCY", default=4)
+
+    # executors validated at once per stage: spec scrape, docker probe and hashcat run
+    EXECUTOR_SCRAPE_CONCURRENCY: int = Field(env="EXECUTOR_SCRAPE_CONCURRENCY", default=512)
+    EXECUTOR_DOCKER_CONCURRENCY: int = Field(env="EXECUTOR_DOCKER_CONCURRENCY", default=128)
+    EXECUTOR_HASHCAT_CONCURRENCY: int = Field(env="EXECUTOR_HASHCAT_CONCURRENCY", default=1024)
+    EXECUTOR_PIPELINE_QUEUE_SIZE: int = Field(env="EXECUTOR_PIPELINE_QUEUE_SIZE", default=256)
+    # hashcat challenges kept ready per gpu count and digits, see services/challenge_pool.py
+    HASHCAT_CHALLENGE_POOL_SIZE: int = Field(env="HASHCAT_CHALLENGE_POOL_SIZE", default=32)
+    HASHCAT_CHALLENGE_WORKERS: int = Field(env="HASHCAT_CHALLENGE_WORKERS", default=2)
+    # timing table made by `cli.py calibrate-hashcat`, the built-in HASHCAT_CONFIGS if empty
+    HASHCAT_CONFIGS_PATH: str | None = Field(env="HASHCAT_CONFIGS_PATH", default=None)
+    # most random bytes sent each way to measure executor speeds, see services/throughput_probe.py
+    NETWORK_PROBE_BYTES: int = Field(env="NETWORK_PROBE_BYTES", default=16 * 2**20)
+    # network probes run at once, they share the validator's uplink
+    NETWORK_PROBE_CONCURRENCY: int = Field(env="NETWORK_PROBE_CONCURRENCY", default=4)
+
+    # job file uploads to executors, see services/sftp_transfer.py
+    UPLOAD_BLOCK_SIZE: int = Field(env="UPLOAD_BLOCK_SIZE", default=256 * 1024)
+    UPLOAD_MAX_REQUESTS: int = Field(env="UPLOAD_MAX_REQUESTS", default=64)
+    UPLOAD_CHANNELS: int = Field(env="UPLOAD_CHANNELS", default=2)
+    # needs the zstandard package on the validator and zstd on executors
+    UPLOAD_COMPRESSION: bool = Field(env="UPLOAD_COMPRESSION", default=False)
 
     REDIS_HOST: str = Field(env="REDIS_HOST", default="localhost")
     REDIS_PORT: int = Field(env="REDIS_PORT", default=6379)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from clients.subtensor_client import BLOCK_TIME, SubtensorClient
+from core.utils import _m, get_extra_info
+
+logger = logging.getLogger(__name__)
+
+METAGRAPH_MAX_BLOCK_AGE = 5
+METAGRAPH_TTL = METAGRAPH_MAX_BLOCK_AGE * BLOCK_TIME
+
+
+class MetagraphSnapshot:
+    """A metagraph downloaded at a given block, with a hotkey to uid index."""
+
+    def __init__(self, metagraph: Any, block: int):
+        self.metagraph = metagraph
+        self.block = block
+        self.fetched_at = time.monotonic()
+        self.uid_by_hotkey: dict[str, int] = {
+            hotkey: uid for uid, hotkey in enumerate(metagraph.hotkeys)
+        }
+
+    @property
+    def hotkeys(self) -> list[str]:
+        return self.metagraph.hotkeys
+
+    @property
+    def neurons(self) -> list:
+        return self.metagraph.neurons
+
+    def get_uid(self, hotkey: str) -> int | None:
+        return self.uid_by_hotkey.get(hotkey)
+
+
+class MetagraphCache:
+    """Share one metagraph download between all the steps of a cycle.
+
+    A snapshot is reused while all of the following hold:
+    - it is younger than ``ttl`` seconds,
+    - it was taken at most ``max_block_age`` blocks before the current block,
+    - it has not been invalidated, which the validator does on epoch boundaries.
+
+    A hotkey missing from the index triggers one more download, in case it has just
+    registered. Concurrent callers wait for the download in flight instead of
+    starting their own.
+    """
+
+    def __init__(
+        self,
+        subtensor_client: SubtensorClient,
+        ttl: float = METAGRAPH_TTL,
+        max_block_age: int = METAGRAPH_MAX_BLOCK_AGE,
+    ):
+        self.subtensor_client = subtensor_client
+        self.ttl = ttl
+        self.max_block_age = max_block_age
+        self._snapshot: MetagraphSnapshot | None = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _is_fresh(self, snapshot: MetagraphSnapshot | None, block: int) -> bool:
+        return (
+            snapshot is not None
+            and time.monotonic() - snapshot.fetched_at < self.ttl
+            and block - snapshot.block <= self.max_block_age
+        )
+
+    async def get(self, force: bool = False) -> MetagraphSnapshot:
+        async with self._lock:
+            block = await self.subtensor_client.get_current_block()
+            if not force and self._is_fresh(self._snapshot, block):
+                return self._snapshot
+
+            metagraph = await self.subtensor_client.get_metagraph()
+            self._snapshot = MetagraphSnapshot(metagraph, block)
+            logger.info(
+                _m(
+                    '[MetagraphCache] Downloaded metagraph',
+                    extra=get_extra_info({
+                        "block": block,
+                        "neurons": len(self._snapshot.hotkeys),
+                    }),
+                ),
+            )
+            return self._snapshot
+
+    async def get_uid(self, hotkey: str) -> int | None:
+        """Look a hotkey up, downloading again once if the snapshot predates its registration."""
+        uid = (await self.get()).get_uid(hotkey)
+        if uid is None:
+            uid = (await self.get(force=True)).get_uid(hotkey)
+        return uid
@@ -0,0 +1,208 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Metrics are only ever updated from the event loop, so samples are plain numbers
+without locks, and a labelled child is looked up once and kept by its callers on
+the hot path. Rendering walks every sample and only happens on a scrape.
+"""
+import abc
+import math
+import time
+from bisect import bisect_left
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_registry: list["_Metric"] = []
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _init_children(self):
+        # metrics without labels are exported from the start
+        if not self.labelnames:
+            self.labels()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A child holding the samples of one set of label values."""
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterator[str]:
+        """The exposition lines of every child."""
+
+    def render(self) -> str:
+        documentation = self.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        lines = [f"# HELP {self.name} {documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._init_children()
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _Observations:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # per bucket, not cumulative, plus one for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = STAGE_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._init_children()
+
+    def _new_child(self):
+        return _Observations(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        for values, child in self._children.items():
+            labelnames = (*self.labelnames, "le")
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), child.counts):
+                cumulative += count
+                labels = _format_labels(labelnames, (*values, _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+EXECUTOR_STAGE_SECONDS = Histogram(
+    "validator_executor_stage_seconds",
+    "Time spent on each step of validating an executor.",
+    ("stage",),
+)
+SSH_CONNECT_SECONDS = EXECUTOR_STAGE_SECONDS.labels("ssh_connect")
+UPLOAD_SECONDS = EXECUTOR_STAGE_SECONDS.labels("upload")
+MACHINE_SCRAPE_SECONDS = EXECUTOR_STAGE_SECONDS.labels("machine_scrape")
+NETWORK_PROBE_SECONDS = EXECUTOR_STAGE_SECONDS.labels("network_probe")
+DOCKER_PROBE_SECONDS = EXECUTOR_STAGE_SECONDS.labels("docker_probe")
+HASHCAT_SECONDS = EXECUTOR_STAGE_SECONDS.labels("hashcat")
+EXECUTOR_TOTAL_SECONDS = EXECUTOR_STAGE_SECONDS.labels("executor_total")
+
+EXECUTOR_FAILURES = Counter(
+    "validator_executor_failures_total",
+    "Executors that did not pass validation, by reason.",
+    ("reason",),
+)
+
+MINERS_IN_FLIGHT = Gauge("validator_miners_in_flight", "Miner job requests in progress.")
+EXECUTORS_IN_FLIGHT = Gauge("validator_executors_in_flight", "Executor validations in progress.")
+REDIS_ROUND_TRIP_SECONDS = Gauge(
+    "validator_redis_round_trip_seconds", "Round trip of the last Redis ping."
+)
+CHAIN_ROUND_TRIP_SECONDS = Gauge(
+    "validator_chain_round_trip_seconds", "Round trip of the last chain call."
+)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, Generic, TypeVar
+
+from core.utils import _m, get_extra_info
+
+logger = logging.getLogger(__name__)
+
+Job = TypeVar("Job")
+
+
+@dataclass
+class Stage(Generic[Job]):
+    name: str
+    # returns None to pass the job on to the next stage, anything else is its result
+    handler: Callable[[Job], Awaitable[Any]]
+    concurrency: int
+
+
+@dataclass
+class StageStats:
+    queued: int = 0
+    running: int = 0
+    processed: int = 0
+    failed: int = 0
+
+
+class StagedPipeline(Generic[Job]):
+    """Run jobs through stages, each with its own number of workers.
+
+    Stages are connected by queues of at most ``queue_size`` jobs, so a slow stage
+    holds the ones before it back instead of piling jobs up. A job leaves the
+    pipeline as soon as a stage returns a result, or raises, in which case
+    ``on_error`` turns the exception into the result. ``on_finish`` runs for every
+    job that leaves, after its result is handed over, including the ones whose
+    caller stopped waiting, which are dropped before their next stage.
+
+    Workers are started by the first submit, on the running event loop.
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage[Job]],
+        queue_size: int,
+        on_error: Callable[[Job, Exception], Awaitable[Any]],
+        on_finish: Callable[[Job], Awaitable[None]] | None = None,
+    ):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.on_finish = on_finish
+        self.stats = {stage.name: StageStats() for stage in stages}
+        self._queues: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._workers = [
+            asyncio.create_task(self._work(index))
+            for index, stage in enumerate(self.stages)
+            for _ in range(stage.concurrency)
+        ]
+
+    async def submit(self, job: Job) -> Any:
+        self._start()
+        future = self._loop.create_future()
+        await self._put(0, job, future)
+        return await future
+
+    async def _put(self, index: int, job: Job, future: asyncio.Future):
+        self.stats[self.stages[index].name].queued += 1
+        await self._queues[index].put((job, future))
+
+    async def _finish(self, job: Job):
+        if self.on_finish is None:
+            return
+        try:
+            await self.on_finish(job)
+        except Exception as e:
+            logger.error(
+                _m("[StagedPipeline] Finishing job failed", extra=get_extra_info({"error": str(e)})),
+                exc_info=True,
+            )
+
+    @staticmethod
+    def _fail(future: asyncio.Future, stage_name: str, error: BaseException):
+        if future.done():
+            return
+        if isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # the caller gets an error to handle, not a cancellation of its own
+            future.set_exception(RuntimeError(f"{stage_name} stage was interrupted: {error!r}"))
+
+    async def _work(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats[stage.name]
+        queue = self._queues[index]
+
+        while True:
+            job, future = await queue.get()
+            stats.queued -= 1
+            leaves = True
+            try:
+                # the caller stopped waiting, e.g. its miner timed out
+                if not future.done():
+                    stats.running += 1
+                    try:
+                        result = await stage.handler(job)
+                    except Exception as e:
+                        stats.failed += 1
+                        result = await self.on_error(job, e)
+                    finally:
+                        stats.running -= 1
+                        stats.processed += 1
+
+                    if result is None and index + 1 < len(self.stages):
+                        await self._put(index + 1, job, future)
+                        leaves = False
+                    elif not future.done():
+                        future.set_result(result)
+            except BaseException as e:
+                self._fail(future, stage.name, e)
+                # a handler's own cancellation costs the job, not the worker; the
+                # worker only stops when it is cancelled itself, on close
+                if not isinstance(e, Exception) and (
+                    not isinstance(e, asyncio.CancelledError) or asyncio.current_task().cancelling()
+                ):
+                    raise
+            finally:
+                queue.task_done()
+
+            # the caller has its result already, it does not wait for the cleanup
+            if leaves:
+                await self._finish(job)
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
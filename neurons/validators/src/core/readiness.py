@@ -0,0 +1,64 @@
+"""Wait for something to become ready by probing it, instead of sleeping for a fixed time.
+
+Probes are retried with exponential backoff, starting at a few milliseconds so
+that whatever is ready almost at once is not held up, until a deadline.
+"""
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+READINESS_INITIAL_DELAY = 0.01
+READINESS_MAX_DELAY = 0.5
+READINESS_BACKOFF = 2
+# an ssh server sends its banner first, before the client says anything
+SSH_BANNER_PREFIX = b"SSH-"
+SSH_BANNER_TIMEOUT = 2
+
+
+async def wait_until(
+    probe: Callable[[], Awaitable[bool]],
+    timeout: float,
+    initial_delay: float = READINESS_INITIAL_DELAY,
+    max_delay: float = READINESS_MAX_DELAY,
+) -> bool:
+    """Run probe until it returns True, or give up once timeout seconds have passed.
+
+    A probe that raises is not ready yet. Every attempt is cut short by the deadline.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            if await asyncio.wait_for(probe(), timeout=remaining):
+                return True
+        except Exception:
+            pass
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * READINESS_BACKOFF, max_delay)
+
+
+async def probe_ssh(host: str, port: int) -> bool:
+    """Whether an ssh server answers on host:port.
+
+    Checks for the ssh banner rather than just a TCP connect, as docker's port
+    proxy accepts connections before the server in the container listens.
+    """
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), SSH_BANNER_TIMEOUT)
+        banner = await asyncio.wait_for(reader.readline(), SSH_BANNER_TIMEOUT)
+        return banner.startswith(SSH_BANNER_PREFIX)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def wait_for_ssh(host: str, port: int, timeout: float) -> bool:
+    return await wait_until(lambda: probe_ssh(host, port), timeout)
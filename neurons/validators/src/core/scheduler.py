@@ -0,0 +1,192 @@
+import abc
+import asyncio
+import logging
+import threading
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+
+from clients.subtensor_client import BLOCK_TIME, SubtensorClient
+from core.utils import _m, get_extra_info
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_WINDOW_BLOCKS = 20
+
+
+def scoring_epoch(block: int, netuid: int, tempo: int) -> int:
+    """The epoch whose weights the job scores of block count toward.
+
+    Once the weights window of an epoch opens, scores count toward the next one.
+    """
+    return (block + WEIGHTS_WINDOW_BLOCKS + netuid + 1) // (tempo + 1)
+
+
+@dataclass(frozen=True)
+class BlockEvent:
+    block: int
+
+
+@dataclass(frozen=True)
+class EpochBoundary(BlockEvent):
+    epoch: int
+
+
+@dataclass(frozen=True)
+class WeightsWindowOpened(BlockEvent):
+    """A block of the weights window, sent until weights of the epoch are confirmed set."""
+    epoch: int
+    blocks_till_epoch: int
+
+
+@dataclass(frozen=True)
+class JobWindowOpened(BlockEvent):
+    job_block: int
+
+
+class BlockSource(abc.ABC):
+    @abc.abstractmethod
+    def blocks(self) -> AsyncIterator[int]:
+        """Yield block numbers as the chain produces them."""
+
+
+class SubtensorBlockSource(BlockSource):
+    """Push new block headers from a substrate subscription.
+
+    The subscription blocks its caller, so it runs on its own thread with its own
+    chain connection and hands block numbers over to the event loop.
+    """
+
+    def __init__(self, subtensor_factory: Callable, reconnect_delay: float = 5):
+        self.subtensor_factory = subtensor_factory
+        self.reconnect_delay = reconnect_delay
+
+    async def blocks(self) -> AsyncIterator[int]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        stopped = threading.Event()
+
+        def handler(obj, update_nr, subscription_id):
+            if stopped.is_set():
+                # returning a value ends the subscription
+                return True
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, int(obj["header"]["number"]))
+            except RuntimeError:
+                return True
+
+        def subscribe():
+            while not stopped.is_set():
+                try:
+                    subtensor = self.subtensor_factory()
+                    subtensor.substrate.subscribe_block_headers(handler)
+                except Exception as e:
+                    logger.error(
+                        _m(
+                            '[SubtensorBlockSource] Block header subscription failed',
+                            extra={"error": str(e)},
+                        ),
+                    )
+                    stopped.wait(self.reconnect_delay)
+
+        thread = threading.Thread(target=subscribe, name="block-subscription", daemon=True)
+        thread.start()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            stopped.set()
+
+
+class PollingBlockSource(BlockSource):
+    """Poll the current block once per block time, for nodes without subscriptions."""
+
+    def __init__(self, subtensor_client: SubtensorClient, interval: float = BLOCK_TIME):
+        self.subtensor_client = subtensor_client
+        self.interval = interval
+
+    async def blocks(self) -> AsyncIterator[int]:
+        last_block = None
+        while True:
+            try:
+                block = await self.subtensor_client.refresh_block()
+                if block != last_block:
+                    last_block = block
+                    yield block
+            except Exception as e:
+                logger.error(
+                    _m(
+                        '[PollingBlockSource] Getting current block failed',
+                        extra=get_extra_info({"error": str(e)}),
+                    ),
+                )
+            await asyncio.sleep(self.interval)
+
+
+class BlockScheduler:
+    """Turn a stream of blocks into typed validator events.
+
+    Windows are tracked by index rather than by exact block, so a block that is
+    skipped by the source never makes a window go unnoticed.
+    """
+
+    def __init__(
+        self,
+        block_source: BlockSource,
+        subtensor_client: SubtensorClient,
+        netuid: int,
+        blocks_for_job: int,
+        weights_window: int = WEIGHTS_WINDOW_BLOCKS,
+    ):
+        self.block_source = block_source
+        self.subtensor_client = subtensor_client
+        self.netuid = netuid
+        self.blocks_for_job = blocks_for_job
+        self.weights_window = weights_window
+
+        self._job_window: int | None = None
+        self._epoch: int | None = None
+        self._weights_set_epoch: int | None = None
+
+    async def events_for_block(self, block: int) -> list[BlockEvent]:
+        events = []
+
+        tempo = await self.subtensor_client.get_tempo()
+        epoch = (block + self.netuid + 1) // (tempo + 1)
+        blocks_till_epoch = tempo - (block + self.netuid + 1) % (tempo + 1)
+
+        if self._epoch is not None and epoch != self._epoch:
+            events.append(EpochBoundary(block=block, epoch=epoch))
+        self._epoch = epoch
+
+        if blocks_till_epoch < self.weights_window and self._weights_set_epoch != epoch:
+            events.append(
+                WeightsWindowOpened(block=block, epoch=epoch, blocks_till_epoch=blocks_till_epoch)
+            )
+
+        job_window = block // self.blocks_for_job
+        if job_window != self._job_window:
+            self._job_window = job_window
+            events.append(JobWindowOpened(block=block, job_block=job_window * self.blocks_for_job))
+
+        return events
+
+    def weights_set(self, epoch: int):
+        """Stop sending the weights window of epoch, weights were set in it."""
+        self._weights_set_epoch = epoch
+
+    async def events(self) -> AsyncIterator[BlockEvent]:
+        async for block in self.block_source.blocks():
+            self.subtensor_client.observe_block(block)
+            try:
+                events = await self.events_for_block(block)
+            except Exception as e:
+                logger.error(
+                    _m(
+                        '[BlockScheduler] Failed to compute events for block',
+                        extra=get_extra_info({"block": block, "error": str(e)}),
+                    ),
+                )
+                continue
+
+            for event in events:
+                yield event
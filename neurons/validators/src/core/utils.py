@@ -70,7 +70,11 @@ def get_extra_info(extra: dict) -> dict:
 
 
 def configure_logs_of_other_modules():
-    validator_hotkey = settings.get_bittensor_wallet().get_hotkey().ss58_address
+    try:
+        validator_hotkey = settings.get_bittensor_wallet().get_hotkey().ss58_address
+    except Exception:
+        # commands such as the load test run without a wallet, the validator itself fails on start
+        validator_hotkey = "no wallet"
 
     logging.basicConfig(
         level=logging.INFO,
@@ -1,41 +1,64 @@
-from typing import TYPE_CHECKING
 import asyncio
-import json
 import logging
+import time
+from collections.abc import AsyncIterator
+from dataclasses import asdict
 from datetime import datetime
+from typing import TYPE_CHECKING
 
 import bittensor
 import numpy as np
-from bittensor.utils.weight_utils import (
-    convert_weights_and_uids_for_emit,
-    process_weights_for_netuid,
-)
-from payload_models.payloads import MinerJobRequestPayload
 
+from clients.subtensor_client import SubtensorClient
 from core.config import settings
+from core.metagraph_cache import MetagraphCache
+from core.scheduler import (
+    BlockEvent,
+    BlockScheduler,
+    BlockSource,
+    EpochBoundary,
+    JobWindowOpened,
+    PollingBlockSource,
+    SubtensorBlockSource,
+    WeightsWindowOpened,
+    scoring_epoch,
+)
 from core.utils import _m, get_extra_info
-from services.docker_service import DockerService, REPOSITORYS
+from core.weights import WeightsEngine, convert_weights_for_emit
+from payload_models.payloads import MinerJobEnryptedFiles, MinerJobRequestPayload
+from services.docker_service import REPOSITORYS, DockerService
+from services.file_encrypt_service import FileEncryptService
+from services.job_dispatch_service import JobDispatchService
 from services.miner_service import MinerService
-from services.redis_service import RedisService, EXECUTOR_COUNT_PREFIX
+from services.redis_service import RedisService
+from services.ssh_pool import SSHConnectionPool
 from services.ssh_service import SSHService
 from services.task_service import TaskService
-from services.file_encrypt_service import FileEncryptService
 
 if TYPE_CHECKING:
     from bittensor_wallet import Wallet
 
 logger = logging.getLogger(__name__)
 
-SYNC_CYCLE = 12
 WEIGHT_MAX_COUNTER = 6
-MINER_SCORES_KEY = "miner_scores"
+# job results are persisted in chunks, once this many are pending or the oldest
+# has waited this long
+JOB_RESULTS_FLUSH_COUNT = 32
+JOB_RESULTS_FLUSH_SECONDS = 1
+# redis health is sampled once every this many blocks
+REDIS_PING_BLOCKS = 10
 
 
 class Validator:
     wallet: "Wallet"
     netuid: int
 
-    def __init__(self, debug_miner=None):
+    def __init__(
+        self,
+        debug_miner=None,
+        block_source: BlockSource | None = None,
+        subtensor_client: SubtensorClient | None = None,
+    ):
         self.config = settings.get_bittensor_config()
 
         self.wallet = settings.get_bittensor_wallet()
@@ -45,27 +68,46 @@ class Validator:
         self.is_running = False
         self.last_job_run_blocks = 0
         self.default_extra = {}
+        self.block_source = block_source
+        self.scheduler: BlockScheduler | None = None
+        self.job_batch_task: asyncio.Task | None = None
+        self.pending_job_block: int | None = None
+        self.last_redis_ping_block = 0
+        # held while a job score is committed and while scores are rolled over
+        self.miner_scores_lock = asyncio.Lock()
+        # (miner hotkey, job batch id, score, executor counts) of results not persisted yet
+        self.pending_job_results: list[tuple[str, str, float, dict | None]] = []
+        self.pending_since: float | None = None
+
+        self.subtensor_client = subtensor_client or SubtensorClient(
+            config=self.config, netuid=self.netuid
+        )
+        self.metagraph_cache = MetagraphCache(self.subtensor_client)
+        self.weights_engine = WeightsEngine()
 
-        subtensor = self.get_subtensor()
+        loop = asyncio.get_event_loop()
 
         # check registered
-        self.check_registered(subtensor)
+        loop.run_until_complete(self.check_registered())
 
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.initiate_services(subtensor))
+        loop.run_until_complete(self.initiate_services())
 
         self.debug_miner = debug_miner
 
-    async def initiate_services(self, subtensor: bittensor.subtensor):
+    async def initiate_services(self):
         ssh_service = SSHService()
         self.redis_service = RedisService()
+        self.ssh_pool = SSHConnectionPool()
         task_service = TaskService(
             ssh_service=ssh_service,
             redis_service=self.redis_service,
+            ssh_pool=self.ssh_pool,
         )
+        task_service.warm_challenge_pool()
         self.docker_service = DockerService(
             ssh_service=ssh_service,
             redis_service=self.redis_service,
+            ssh_pool=self.ssh_pool,
         )
         self.miner_service = MinerService(
             ssh_service=ssh_service,
@@ -75,43 +117,46 @@ class Validator:
         self.file_encrypt_service = FileEncryptService(
             ssh_service=ssh_service
         )
+        self.job_dispatch_service = JobDispatchService(
+            miner_service=self.miner_service,
+            redis_service=self.redis_service,
+        )
 
-        # init miner_scores
+        # init miner_scores, the weights check at start consumes them if weights are due
         try:
-            if await self.should_set_weights(subtensor):
-                self.miner_scores = {}
+            current_block = await self.get_current_block()
+            await self.redis_service.migrate_legacy_keys(epoch=current_block)
+            epoch, self.miner_scores = await self.redis_service.get_miner_scores()
+            logger.info(
+                _m(
+                    '[initiate_services] Loaded persisted miner_scores',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "epoch": epoch,
+                        "miners": len(self.miner_scores),
+                    }),
+                ),
+            )
 
-                # clear executor_counts
-                try:
-                    await self.redis_service.clear_all_executor_counts()
-                    logger.info(
-                        _m(
-                            '[initiate_services] Cleared executor_counts',
-                            extra=get_extra_info(self.default_extra),
-                        ),
-                    )
-                except Exception as e:
-                    logger.error(
-                        _m(
-                            '[initiate_services] Failed to clear executor_counts',
-                            extra=get_extra_info({
-                                **self.default_extra,
-                                "error": str(e)
-                            }),
-                        ),
-                    )
-            else:
-                miner_scores_json = await self.redis_service.get(MINER_SCORES_KEY)
-                if miner_scores_json is None:
-                    logger.info(
-                        _m(
-                            '[initiate_services] No data found in Redis for MINER_SCORES_KEY, initializing empty miner_scores.',
-                            extra=get_extra_info(self.default_extra),
-                        ),
-                    )
-                    self.miner_scores = {}
-                else:
-                    self.miner_scores = json.loads(miner_scores_json)
+            # the epoch is the block of the last rollover, scores left from before the
+            # weights window the validator was down for are out of date
+            tempo = await self.get_tempo()
+            if scoring_epoch(int(epoch), self.netuid, tempo) != scoring_epoch(
+                current_block, self.netuid, tempo
+            ):
+                logger.info(
+                    _m(
+                        '[initiate_services] Dropped miner_scores of a past epoch',
+                        extra=get_extra_info({
+                            **self.default_extra,
+                            "epoch": epoch,
+                            "current_block": current_block,
+                            "miners": len(self.miner_scores),
+                        }),
+                    ),
+                )
+                await self.redis_service.rollover_miner_scores(epoch=current_block)
+                self.miner_scores = {}
 
             await self.redis_service.clear_all_ssh_ports()
         except Exception as e:
@@ -136,41 +181,27 @@ class Validator:
             ),
         )
 
-    def get_subtensor(self):
-        logger.info(
-            _m(
-                'Getting subtensor',
-                extra=get_extra_info(self.default_extra),
-            ),
-        )
-        return bittensor.subtensor(config=self.config)
-
-    def get_metagraph(self, subtensor: bittensor.subtensor):
-        return subtensor.metagraph(netuid=self.netuid)
+    async def get_metagraph(self):
+        return (await self.metagraph_cache.get()).metagraph
 
-    def get_node(self, subtensor: bittensor.subtensor):
-        # return SubstrateInterface(url=self.config.subtensor.chain_endpoint)
-        return subtensor.substrate
+    async def get_current_block(self):
+        return await self.subtensor_client.get_current_block()
 
-    def get_current_block(self, subtensor: bittensor.subtensor):
-        node = self.get_node(subtensor)
-        return node.query("System", "Number", []).value
+    async def get_weights_rate_limit(self):
+        return await self.subtensor_client.get_weights_rate_limit()
 
-    def get_weights_rate_limit(self, subtensor: bittensor.subtensor):
-        node = self.get_node(subtensor)
-        return node.query("SubtensorModule", "WeightsSetRateLimit", [self.netuid]).value
+    async def get_my_uid(self):
+        uid = await self.metagraph_cache.get_uid(self.wallet.hotkey.ss58_address)
+        if uid is None:
+            raise ValueError(f"{self.wallet.hotkey.ss58_address} is not registered in the metagraph")
+        return uid
 
-    def get_my_uid(self, subtensor: bittensor.subtensor):
-        metagraph = self.get_metagraph(subtensor)
-        return metagraph.hotkeys.index(self.wallet.hotkey.ss58_address)
+    async def get_tempo(self):
+        return await self.subtensor_client.get_tempo()
 
-    def get_tempo(self, subtensor: bittensor.subtensor):
-        return subtensor.tempo(self.netuid)
-
-    def check_registered(self, subtensor: bittensor.subtensor):
+    async def check_registered(self):
         try:
-            if not subtensor.is_hotkey_registered(
-                netuid=self.netuid,
+            if not await self.subtensor_client.is_hotkey_registered(
                 hotkey_ss58=self.wallet.get_hotkey().ss58_address,
             ):
                 logger.error(
@@ -197,7 +228,7 @@ class Validator:
                 ),
             )
 
-    def fetch_miners(self, subtensor: bittensor.subtensor):
+    async def fetch_miners(self):
         logger.info(
             _m(
                 '[fetch_miners] Fetching miners',
@@ -208,7 +239,7 @@ class Validator:
         if self.debug_miner:
             miners = [self.debug_miner]
         else:
-            metagraph = self.get_metagraph(subtensor)
+            metagraph = await self.get_metagraph()
             miners = [
                 neuron
                 for neuron in metagraph.neurons
@@ -227,7 +258,7 @@ class Validator:
         )
         return miners
 
-    async def set_weights(self, miners, subtensor: bittensor.subtensor):
+    async def set_weights(self, miners) -> bool:
         logger.info(
             _m(
                 '[set_weights] scores',
@@ -245,28 +276,28 @@ class Validator:
                     extra=get_extra_info(self.default_extra),
                 ),
             )
-            return
+            return False
+
+        # results keep arriving while weights are set, they are left for the next epoch
+        miner_scores = dict(self.miner_scores)
 
-        uids = np.zeros(len(miners), dtype=np.int64)
-        weights = np.zeros(len(miners), dtype=np.float32)
-        for ind, miner in enumerate(miners):
-            uids[ind] = miner.uid
-            weights[ind] = self.miner_scores.get(miner.hotkey, 0.0)
+        metagraph = await self.get_metagraph()
+        self.weights_engine.sync_metagraph(
+            metagraph.hotkeys,
+            active_uids=np.fromiter((miner.uid for miner in miners), dtype=np.int64, count=len(miners)),
+        )
+        self.weights_engine.load_scores(miner_scores)
 
         logger.info(
             _m(
-                f'[set_weights] uids: {uids} weights: {weights}',
+                f'[set_weights] scores: {self.weights_engine.scores}',
                 extra=get_extra_info(self.default_extra),
             ),
         )
 
-        metagraph = self.get_metagraph(subtensor)
-        processed_uids, processed_weights = process_weights_for_netuid(
-            uids=uids,
-            weights=weights,
-            netuid=self.netuid,
-            subtensor=subtensor,
-            metagraph=metagraph,
+        processed_uids, processed_weights = self.weights_engine.compute(
+            min_allowed_weights=await self.subtensor_client.get_min_allowed_weights(),
+            max_weight_limit=await self.subtensor_client.get_max_weight_limit(),
         )
 
         logger.info(
@@ -276,7 +307,7 @@ class Validator:
             ),
         )
 
-        uint_uids, uint_weights = convert_weights_and_uids_for_emit(
+        uint_uids, uint_weights = convert_weights_for_emit(
             uids=processed_uids, weights=processed_weights
         )
 
@@ -287,13 +318,10 @@ class Validator:
             ),
         )
 
-        result, msg = subtensor.set_weights(
+        result, msg = await self.subtensor_client.set_weights(
             wallet=self.wallet,
-            netuid=self.netuid,
             uids=uint_uids,
             weights=uint_weights,
-            wait_for_finalization=False,
-            wait_for_inclusion=False,
         )
         if result is True:
             logger.info(
@@ -313,37 +341,41 @@ class Validator:
                 ),
             )
 
-        self.miner_scores = {}
-
-        # clear executor_counts
-        try:
-            await self.redis_service.clear_all_executor_counts()
-            logger.info(
-                _m(
-                    '[set_weights] Cleared executor_counts',
-                    extra=get_extra_info(self.default_extra),
-                ),
-            )
-        except Exception as e:
-            logger.error(
-                _m(
-                    '[set_weights] Failed to clear executor_counts',
-                    extra=get_extra_info({
-                        **self.default_extra,
-                        "error": str(e),
-                    }),
-                ),
-            )
+        if result is True:
+            await self.rollover_miner_scores(miner_scores)
+
+        return result is True
+
+    async def rollover_miner_scores(self, used_scores: dict[str, float]):
+        """Start a new scoring epoch with the scores that arrived after used_scores were taken."""
+        async with self.miner_scores_lock:
+            # pending results are in used_scores or carried, either way they are settled here
+            await self._flush_job_results()
+            self.pending_job_results, self.pending_since = [], None
+            carried = {
+                miner_hotkey: score - used_scores.get(miner_hotkey, 0)
+                for miner_hotkey, score in self.miner_scores.items()
+                if score != used_scores.get(miner_hotkey)
+            }
+            try:
+                epoch = await self.get_current_block()
+                await self.redis_service.rollover_miner_scores(epoch=epoch, carried=carried)
+            except Exception as e:
+                logger.error(
+                    _m(
+                        '[set_weights] Failed to roll over miner_scores',
+                        extra=get_extra_info({
+                            **self.default_extra,
+                            "error": str(e),
+                        }),
+                    ),
+                )
+            self.miner_scores = carried
 
-    def get_last_update(self, subtensor: bittensor.subtensor, block):
+    async def get_last_update(self, block):
         try:
-            node = self.get_node(subtensor)
-            last_update_blocks = (
-                block
-                - node.query("SubtensorModule", "LastUpdate", [self.netuid]).value[
-                    self.get_my_uid(subtensor)
-                ]
-            )
+            last_update = await self.subtensor_client.get_last_update()
+            last_update_blocks = block - last_update[await self.get_my_uid()]
         except Exception as e:
             logger.error(
                 _m(
@@ -365,13 +397,13 @@ class Validator:
         )
         return last_update_blocks
 
-    async def should_set_weights(self, subtensor: bittensor.subtensor) -> bool:
+    async def should_set_weights(self) -> bool:
         """Check if current block is for setting weights."""
         try:
-            current_block = self.get_current_block(subtensor)
-            last_update = self.get_last_update(subtensor, current_block)
-            tempo = self.get_tempo(subtensor)
-            weights_rate_limit = self.get_weights_rate_limit(subtensor)
+            current_block = await self.get_current_block()
+            last_update = await self.get_last_update(current_block)
+            tempo = await self.get_tempo()
+            weights_rate_limit = await self.get_weights_rate_limit()
 
             blocks_till_epoch = tempo - (current_block + self.netuid + 1) % (tempo + 1)
 
@@ -406,16 +438,13 @@ class Validator:
             )
             return False
 
-    async def get_time_from_block(self, subtensor: bittensor.subtensor, block: int):
+    async def get_time_from_block(self, block: int):
         max_retries = 3
         retries = 0
         while retries < max_retries:
             try:
-                node = self.get_node(subtensor)
-                block_hash = node.get_block_hash(block)
-                return datetime.fromtimestamp(
-                    node.query("Timestamp", "Now", block_hash=block_hash).value / 1000
-                ).strftime("%Y-%m-%d %H:%M:%S")
+                timestamp = await self.subtensor_client.get_block_timestamp(block)
+                return datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d %H:%M:%S")
             except Exception as e:
                 logger.error(
                     _m(
@@ -430,239 +459,268 @@ class Validator:
                 retries += 1
         return "Unknown"
 
-    async def sync(self):
+    async def try_set_weights(self) -> bool:
+        """Set weights if they are due, returning whether they were set."""
         try:
-            subtensor = self.get_subtensor()
-            logger.info(
+            if await self.should_set_weights():
+                miners = await self.fetch_miners()
+                return await self.set_weights(miners=miners)
+        except Exception as e:
+            logger.error(
                 _m(
-                    '[sync] Syncing at subtensor',
-                    extra=get_extra_info(self.default_extra),
+                    '[try_set_weights] Unknown error',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "error": str(e),
+                    }),
+                ),
+            )
+        return False
+
+    async def run_miner_jobs(
+        self,
+        miners,
+        job_batch_id: str,
+        encypted_files: MinerJobEnryptedFiles,
+        docker_hub_digests: dict[str, str],
+    ) -> AsyncIterator[tuple[str, dict | None]]:
+        """Yield (miner_hotkey, result) as miners finish, in process or on the workers."""
+        payloads = [
+            MinerJobRequestPayload(
+                job_batch_id=job_batch_id,
+                miner_hotkey=miner.hotkey,
+                miner_address=miner.axon_info.ip,
+                miner_port=miner.axon_info.port,
+            )
+            for miner in miners
+        ]
+
+        if settings.JOB_DISPATCH == "workers":
+            async for finished in self.job_dispatch_service.dispatch(
+                job_batch_id=job_batch_id,
+                payloads=payloads,
+                encypted_files=encypted_files,
+                docker_hub_digests=docker_hub_digests,
+            ):
+                yield finished
+            return
+
+        # every miner runs under its own deadline and is scored as soon as it finishes
+        jobs = asyncio.as_completed([
+            self.miner_service.request_job_with_deadline(
+                payload=payload,
+                encypted_files=encypted_files,
+                docker_hub_digests=docker_hub_digests,
+            )
+            for payload in payloads
+        ])
+        for job in jobs:
+            finished = await job
+            if finished is not None:
+                yield finished
+
+    async def handle_job_result(self, miner_hotkey: str, job_batch_id: str, result: dict | None):
+        if not result:
+            logger.error(
+                _m(
+                    '[sync] No_Job_Result',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "miner_hotkey": miner_hotkey,
+                        "job_batch_id": job_batch_id,
+                    }),
+                ),
+            )
+            return
+
+        logger.info(
+            _m(
+                '[sync] Job_Result',
+                extra=get_extra_info({
+                    **self.default_extra,
+                    "result": result,
+                }),
+            ),
+        )
+        job_score = result.get("score")
+
+        # a rollover sees the score both in memory and in redis, or in neither
+        async with self.miner_scores_lock:
+            if miner_hotkey in self.miner_scores:
+                self.miner_scores[miner_hotkey] += job_score
+            else:
+                self.miner_scores[miner_hotkey] = job_score
+
+            self.pending_job_results.append(
+                (miner_hotkey, job_batch_id, job_score, result.get("executor_counts"))
+            )
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+            if (
+                len(self.pending_job_results) >= JOB_RESULTS_FLUSH_COUNT
+                or time.monotonic() - self.pending_since >= JOB_RESULTS_FLUSH_SECONDS
+            ):
+                await self._flush_job_results()
+
+    async def flush_job_results(self):
+        async with self.miner_scores_lock:
+            await self._flush_job_results()
+
+    async def _flush_job_results(self):
+        """Persist the pending job results in one round trip, called with miner_scores_lock held."""
+        if not self.pending_job_results:
+            return
+
+        scores = {}
+        executor_counts = []
+        for miner_hotkey, job_batch_id, score, counts in self.pending_job_results:
+            scores[miner_hotkey] = scores.get(miner_hotkey, 0) + score
+            if counts:
+                executor_counts.append((miner_hotkey, job_batch_id, counts))
+
+        try:
+            rollups = await self.redis_service.record_job_results(scores, executor_counts)
+        except Exception as e:
+            # kept pending, the next flush tries again
+            logger.error(
+                _m(
+                    '[sync] Failed to persist job results',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "results": len(self.pending_job_results),
+                        "error": str(e),
+                    }),
                 ),
             )
+            return
+        self.pending_job_results, self.pending_since = [], None
 
-            # fetch miners
-            miners = self.fetch_miners(subtensor)
+        for miner_hotkey, job_batch_id, counts in executor_counts:
+            logger.info(
+                _m(
+                    '[sync] executor counts',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "miner_hotkey": miner_hotkey,
+                        "job_batch_id": job_batch_id,
+                        **counts,
+                        **rollups.get(miner_hotkey, {}),
+                    }),
+                ),
+            )
 
-            if await self.should_set_weights(subtensor):
-                await self.set_weights(miners=miners, subtensor=subtensor)
+    async def run_job_batch(self, job_block: int):
+        try:
+            miners = await self.fetch_miners()
+            current_block = await self.get_current_block()
+            job_batch_id = await self.get_time_from_block(job_block)
 
-            current_block = self.get_current_block(subtensor)
             logger.info(
                 _m(
-                    '[sync] Current block',
+                    '[sync] Send jobs to miners',
                     extra=get_extra_info({
                         **self.default_extra,
+                        "miners": len(miners),
                         "current_block": current_block,
+                        "job_batch_id": job_batch_id,
                     }),
                 ),
             )
 
-            if current_block - self.last_job_run_blocks >= settings.BLOCKS_FOR_JOB:
-                job_block = (current_block // settings.BLOCKS_FOR_JOB) * settings.BLOCKS_FOR_JOB
-                job_batch_id = await self.get_time_from_block(subtensor, job_block)
+            self.last_job_run_blocks = current_block
 
-                logger.info(
-                    _m(
-                        '[sync] Send jobs to miners',
-                        extra=get_extra_info({
-                            **self.default_extra,
-                            "miners": len(miners),
-                            "current_block": current_block,
+            docker_hub_digests = await self.docker_service.get_docker_hub_digests(REPOSITORYS)
+            logger.info(
+                _m(
+                    "Docker Hub Digests",
+                    extra=get_extra_info(
+                        {
                             "job_batch_id": job_batch_id,
-                        }),
+                            "docker_hub_digests": docker_hub_digests
+                        }
                     ),
-                )
-
-                self.last_job_run_blocks = current_block
-
-                docker_hub_digests = await self.docker_service.get_docker_hub_digests(REPOSITORYS)
-                logger.info(
-                    _m(
-                        "Docker Hub Digests",
-                        extra=get_extra_info(
-                            {
-                                "job_batch_id": job_batch_id,
-                                "docker_hub_digests": docker_hub_digests
-                            }
-                        ),
-                    ),
-                )
-
-                encypted_files = self.file_encrypt_service.ecrypt_miner_job_files()
-
-                task_info = {}
-
-                # request jobs
-                jobs = [
-                    asyncio.create_task(
-                        self.miner_service.request_job_to_miner(
-                            payload=MinerJobRequestPayload(
-                                job_batch_id=job_batch_id,
-                                miner_hotkey=miner.hotkey,
-                                miner_address=miner.axon_info.ip,
-                                miner_port=miner.axon_info.port,
-                            ),
-                            encypted_files=encypted_files,
-                            docker_hub_digests=docker_hub_digests,
-                        )
-                    )
-                    for miner in miners
-                ]
+                ),
+            )
 
-                for miner, job in zip(miners, jobs):
-                    task_info[job] = {
-                        "miner_hotkey": miner.hotkey,
-                        "miner_address": miner.axon_info.ip,
-                        "miner_port": miner.axon_info.port,
-                        "job_batch_id": job_batch_id
-                    }
+            encypted_files = self.file_encrypt_service.ecrypt_miner_job_files()
+            # built again in the same directory
+            self.miner_service.task_service.artifact_cache.invalidate(encypted_files.tmp_directory)
 
+            async for miner_hotkey, result in self.run_miner_jobs(
+                miners=miners,
+                job_batch_id=job_batch_id,
+                encypted_files=encypted_files,
+                docker_hub_digests=docker_hub_digests,
+            ):
                 try:
-                    # Run all jobs with asyncio.wait and set a timeout
-                    done, pending = await asyncio.wait(jobs, timeout=60 * 10)
-
-                    # Process completed jobs
-                    for task in done:
-                        try:
-                            result = task.result()
-                            if result:
-                                logger.info(
-                                    _m(
-                                        '[sync] Job_Result',
-                                        extra=get_extra_info({
-                                            **self.default_extra,
-                                            "result": result,
-                                        }),
-                                    ),
-                                )
-                                miner_hotkey = result.get("miner_hotkey")
-                                job_score = result.get("score")
-
-                                key = f"{EXECUTOR_COUNT_PREFIX}:{miner_hotkey}"
-
-                                try:
-                                    executor_counts = await self.redis_service.hgetall(key)
-                                    parsed_counts = [
-                                        {
-                                            "job_batch_id": job_id.decode('utf-8'),
-                                            **json.loads(data.decode('utf-8')),
-                                        }
-                                        for job_id, data in executor_counts.items()
-                                    ]
-
-                                    if parsed_counts:
-                                        logger.info(
-                                            _m(
-                                                '[sync] executor counts list',
-                                                extra=get_extra_info({
-                                                    **self.default_extra,
-                                                    "miner_hotkey": miner_hotkey,
-                                                    "parsed_counts": parsed_counts,
-                                                }),
-                                            ),
-                                        )
-
-                                        max_executors = max(parsed_counts, key=lambda x: x['total'])['total']
-                                        min_executors = min(parsed_counts, key=lambda x: x['total'])['total']
-
-                                        logger.info(
-                                            _m(
-                                                '[sync] executor counts',
-                                                extra=get_extra_info({
-                                                    **self.default_extra,
-                                                    "miner_hotkey": miner_hotkey,
-                                                    "job_batch_id": job_batch_id,
-                                                    "max_executors": max_executors,
-                                                    "min_executors": min_executors,
-                                                }),
-                                            ),
-                                        )
-
-                                except Exception as e:
-                                    logger.error(
-                                        _m(
-                                            '[sync] Get executor counts error',
-                                            extra=get_extra_info({
-                                                **self.default_extra,
-                                                "miner_hotkey": miner_hotkey,
-                                                "job_batch_id": job_batch_id,
-                                                "error": str(e),
-                                            }),
-                                        ),
-                                    )
-
-                                if miner_hotkey in self.miner_scores:
-                                    self.miner_scores[miner_hotkey] += job_score
-                                else:
-                                    self.miner_scores[miner_hotkey] = job_score
-                            else:
-                                info = task_info.get(task, {})
-                                miner_hotkey = info.get("miner_hotkey", "unknown")
-                                job_batch_id = info.get("job_batch_id", "unknown")
-                                logger.error(
-                                    _m(
-                                        '[sync] No_Job_Result',
-                                        extra=get_extra_info({
-                                            **self.default_extra,
-                                            "miner_hotkey": miner_hotkey,
-                                            "job_batch_id": job_batch_id,
-                                        }),
-                                    ),
-                                )
-
-                        except Exception as e:
-                            logger.error(
-                                _m(
-                                    '[sync] Error processing job result',
-                                    extra=get_extra_info({
-                                        **self.default_extra,
-                                        "job_batch_id": job_batch_id,
-                                        "error": str(e),
-                                    }),
-                                ),
-                            )
-
-                    # Handle pending jobs (those that did not complete within the timeout)
-                    if pending:
-                        for task in pending:
-                            info = task_info.get(task, {})
-                            miner_hotkey = info.get("miner_hotkey", "unknown")
-                            job_batch_id = info.get("job_batch_id", "unknown")
-
-                            logger.error(
-                                _m(
-                                    '[sync] Job_Timeout',
-                                    extra=get_extra_info({
-                                        **self.default_extra,
-                                        "miner_hotkey": miner_hotkey,
-                                        "job_batch_id": job_batch_id,
-                                    }),
-                                ),
-                            )
-                            task.cancel()
-
-                    logger.info(
-                        _m(
-                            '[sync] All Jobs finished',
-                            extra=get_extra_info({
-                                **self.default_extra,
-                                "job_batch_id": job_batch_id,
-                                "miner_scores": self.miner_scores,
-                            }),
-                        ),
-                    )
-
+                    await self.handle_job_result(miner_hotkey, job_batch_id, result)
                 except Exception as e:
                     logger.error(
                         _m(
-                            '[sync] Unexpected error',
+                            '[sync] Error processing job result',
                             extra=get_extra_info({
                                 **self.default_extra,
+                                "miner_hotkey": miner_hotkey,
                                 "job_batch_id": job_batch_id,
                                 "error": str(e),
                             }),
                         ),
                     )
+
+            logger.info(
+                _m(
+                    '[sync] All Jobs finished',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "job_batch_id": job_batch_id,
+                        "miner_scores": self.miner_scores,
+                    }),
+                ),
+            )
+        except Exception as e:
+            logger.error(
+                _m(
+                    '[run_job_batch] Unknown error',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "job_block": job_block,
+                        "error": str(e),
+                    }),
+                ),
+            )
+        finally:
+            # a batch cut short keeps what it got
+            await self.flush_job_results()
+            await self.miner_service.task_service.flush_hashcat_timings()
+
+    async def sync(self):
+        """Run one weights check and, if a job window is open, one job batch."""
+        try:
+            # one block read per pass, every later lookup is served from cache
+            await self.subtensor_client.refresh_block()
+            logger.info(
+                _m(
+                    '[sync] Syncing at subtensor',
+                    extra=get_extra_info(self.default_extra),
+                ),
+            )
+
+            await self.try_set_weights()
+
+            current_block = await self.get_current_block()
+            logger.info(
+                _m(
+                    '[sync] Current block',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "current_block": current_block,
+                    }),
+                ),
+            )
+
+            if current_block - self.last_job_run_blocks >= settings.BLOCKS_FOR_JOB:
+                job_block = (current_block // settings.BLOCKS_FOR_JOB) * settings.BLOCKS_FOR_JOB
+                await self.run_job_batch(job_block)
             else:
                 remaining_blocks = (
                     current_block // settings.BLOCKS_FOR_JOB + 1
@@ -690,6 +748,72 @@ class Validator:
                 ),
             )
 
+    def get_block_source(self) -> BlockSource:
+        if self.block_source:
+            return self.block_source
+        if settings.BLOCK_SOURCE == "polling":
+            return PollingBlockSource(self.subtensor_client)
+        return SubtensorBlockSource(
+            subtensor_factory=lambda: bittensor.subtensor(config=self.config)
+        )
+
+    def schedule_job_batch(self, job_block: int):
+        if self.job_batch_task and not self.job_batch_task.done():
+            # run the latest missed window as soon as the current batch finishes
+            self.pending_job_block = job_block
+            logger.info(
+                _m(
+                    '[schedule_job_batch] Previous job batch is still running',
+                    extra=get_extra_info({
+                        **self.default_extra,
+                        "job_block": job_block,
+                    }),
+                ),
+            )
+            return
+
+        self.job_batch_task = asyncio.create_task(self._run_job_batches(job_block))
+
+    async def _run_job_batches(self, job_block: int):
+        while job_block is not None:
+            await self.run_job_batch(job_block)
+            job_block, self.pending_job_block = self.pending_job_block, None
+
+    async def handle_event(self, event: BlockEvent):
+        logger.info(
+            _m(
+                f'[handle_event] {type(event).__name__}',
+                extra=get_extra_info({
+                    **self.default_extra,
+                    **asdict(event),
+                }),
+            ),
+        )
+
+        if event.block - self.last_redis_ping_block >= REDIS_PING_BLOCKS:
+            self.last_redis_ping_block = event.block
+            try:
+                await self.redis_service.ping()
+            except Exception as e:
+                logger.warning(
+                    _m(
+                        '[handle_event] Redis ping failed',
+                        extra=get_extra_info({**self.default_extra, "error": str(e)}),
+                    ),
+                )
+
+        if isinstance(event, EpochBoundary):
+            # every epoch starts from a fresh metagraph
+            self.metagraph_cache.invalidate()
+            if await self.try_set_weights() and self.scheduler:
+                self.scheduler.weights_set(event.epoch)
+        elif isinstance(event, WeightsWindowOpened):
+            # until confirmed, every block of the window tries again
+            if await self.try_set_weights() and self.scheduler:
+                self.scheduler.weights_set(event.epoch)
+        elif isinstance(event, JobWindowOpened):
+            self.schedule_job_batch(event.job_block)
+
     async def start(self):
         logger.info(
             _m(
@@ -697,12 +821,20 @@ class Validator:
                 extra=get_extra_info(self.default_extra),
             ),
         )
+        self.scheduler = scheduler = BlockScheduler(
+            block_source=self.get_block_source(),
+            subtensor_client=self.subtensor_client,
+            netuid=self.netuid,
+            blocks_for_job=settings.BLOCKS_FOR_JOB,
+        )
         try:
-            while not self.should_exit:
-                await self.sync()
+            # weights may be overdue from before a restart
+            await self.try_set_weights()
 
-                # sync every 12 seconds
-                await asyncio.sleep(SYNC_CYCLE)
+            async for event in scheduler.events():
+                if self.should_exit:
+                    break
+                await self.handle_event(event)
 
         except KeyboardInterrupt:
             logger.info(
@@ -722,6 +854,14 @@ class Validator:
                     }),
                 ),
             )
+        finally:
+            if self.job_batch_task:
+                self.pending_job_block = None
+                await self.job_batch_task
+            await self.miner_service.task_service.pipeline.close()
+            await self.miner_service.task_service.challenge_pool.close()
+            await self.ssh_pool.close()
+            self.subtensor_client.close()
 
     async def stop(self):
         logger.info(
@@ -731,17 +871,4 @@ class Validator:
             ),
         )
 
-        try:
-            await self.redis_service.set(MINER_SCORES_KEY, json.dumps(self.miner_scores))
-        except Exception as e:
-            logger.info(
-                _m(
-                    '[stop] Failed to save miner_scores',
-                    extra=get_extra_info({
-                        **self.default_extra,
-                        "error": str(e)
-                    }),
-                ),
-            )
-
         self.should_exit = True
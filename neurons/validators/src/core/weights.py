@@ -0,0 +1,177 @@
+"""Vectorized scoring to weights.
+
+Mirrors ``process_weights_for_netuid`` / ``convert_weights_and_uids_for_emit`` from
+``bittensor.utils.weight_utils``, without per-element Python loops and without
+touching the chain: the chain parameters are passed in, so a what-if can be
+recomputed as often as needed.
+"""
+from collections.abc import Sequence
+
+import numpy as np
+
+U16_MAX = 65535
+NORMALIZE_EPSILON = 1e-7
+
+
+def normalize_max_weight(x: np.ndarray, limit: float) -> np.ndarray:
+    """Normalize x so that it sums to 1 and no value is greater than limit."""
+    weights = x.copy()
+    values = np.sort(weights)
+
+    if x.sum() == 0 or x.shape[0] * limit <= 1:
+        return np.ones_like(x) / x.shape[0]
+
+    estimation = values / values.sum()
+    if estimation.max() <= limit:
+        return weights / weights.sum()
+
+    cumsum = np.cumsum(estimation, 0)
+    estimation_sum = (len(values) - np.arange(len(values)) - 1) * estimation
+    n_values = (estimation / (estimation_sum + cumsum + NORMALIZE_EPSILON) < limit).sum()
+
+    cutoff_scale = (limit * cumsum[n_values - 1] - NORMALIZE_EPSILON) / (
+        1 - (limit * (len(estimation) - n_values))
+    )
+    cutoff = cutoff_scale * values.sum()
+    weights[weights > cutoff] = cutoff
+
+    return weights / weights.sum()
+
+
+def process_weights(
+    uids: np.ndarray,
+    weights: np.ndarray,
+    n: int,
+    min_allowed_weights: int,
+    max_weight_limit: float,
+    exclude_quantile: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Apply the subnet weight constraints, uids and weights being aligned by uid."""
+    weights = weights.astype(np.float32)
+
+    non_zero = weights > 0
+    non_zero_weight_uids = uids[non_zero]
+    non_zero_weights = weights[non_zero]
+
+    if non_zero_weights.size == 0 or n < min_allowed_weights:
+        return np.arange(n), np.ones(n, dtype=np.int64) / n
+
+    if non_zero_weights.size < min_allowed_weights:
+        # minimum even non-zero weights for everybody
+        padded = np.ones(n, dtype=np.int64) * 1e-5
+        padded[non_zero_weight_uids] += non_zero_weights
+        return np.arange(n), normalize_max_weight(padded, limit=max_weight_limit)
+
+    max_exclude = max(0, non_zero_weights.size - min_allowed_weights) / non_zero_weights.size
+    lowest_quantile = np.quantile(non_zero_weights, min(exclude_quantile / U16_MAX, max_exclude))
+    keep = lowest_quantile <= non_zero_weights
+
+    return non_zero_weight_uids[keep], normalize_max_weight(
+        non_zero_weights[keep], limit=max_weight_limit
+    )
+
+
+def convert_weights_for_emit(
+    uids: np.ndarray, weights: np.ndarray
+) -> tuple[list[int], list[int]]:
+    """Scale weights to u16 with the max at U16_MAX, dropping the ones that round to 0."""
+    if uids.size != weights.size:
+        raise ValueError(
+            f"Passed weights and uids must have the same length, got {uids.size} and {weights.size}"
+        )
+    if uids.size == 0:
+        return [], []
+    if weights.min() < 0:
+        raise ValueError(f"Passed weight is negative cannot exist on chain {weights}")
+    if uids.min() < 0:
+        raise ValueError(f"Passed uid is negative cannot exist on chain {uids}")
+
+    weights = weights.astype(np.float64)
+    if weights.sum() == 0:
+        return [], []
+
+    uint16_vals = np.round(weights / weights.max() * U16_MAX).astype(np.int64)
+    keep = uint16_vals != 0
+    return uids[keep].tolist(), uint16_vals[keep].tolist()
+
+
+class WeightsEngine:
+    """Miner scores kept in arrays indexed by uid, aligned with the metagraph.
+
+    The hotkey index is only rebuilt when the metagraph hotkeys change; scores of
+    hotkeys that keep their uid are carried over.
+    """
+
+    def __init__(self):
+        self.hotkeys: list[str] = []
+        self.uid_by_hotkey: dict[str, int] = {}
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.active = np.zeros(0, dtype=bool)
+
+    @property
+    def n(self) -> int:
+        return len(self.hotkeys)
+
+    def sync_metagraph(self, hotkeys: Sequence[str], active_uids: Sequence[int] | None = None):
+        hotkeys = list(hotkeys)
+        if hotkeys != self.hotkeys:
+            scores = np.zeros(len(hotkeys), dtype=np.float32)
+            common = min(len(hotkeys), self.n)
+            if common:
+                same_uid = np.array(hotkeys[:common], dtype=object) == np.array(
+                    self.hotkeys[:common], dtype=object
+                )
+                scores[:common][same_uid] = self.scores[:common][same_uid]
+
+            self.hotkeys = hotkeys
+            self.uid_by_hotkey = {hotkey: uid for uid, hotkey in enumerate(hotkeys)}
+            self.scores = scores
+
+        self.active = np.zeros(self.n, dtype=bool)
+        if active_uids is None:
+            self.active[:] = True
+        else:
+            self.active[np.asarray(active_uids, dtype=np.int64)] = True
+
+    def _index(self, miner_scores: dict[str, float]) -> tuple[np.ndarray, np.ndarray]:
+        uids = np.fromiter(
+            (self.uid_by_hotkey.get(hotkey, -1) for hotkey in miner_scores),
+            dtype=np.int64,
+            count=len(miner_scores),
+        )
+        values = np.fromiter(miner_scores.values(), dtype=np.float32, count=len(miner_scores))
+        known = uids >= 0
+        return uids[known], values[known]
+
+    def load_scores(self, miner_scores: dict[str, float]):
+        """Replace all scores, hotkeys that are not in the metagraph are dropped."""
+        self.scores = np.zeros(self.n, dtype=np.float32)
+        uids, values = self._index(miner_scores)
+        self.scores[uids] = values
+
+    def add_scores(self, miner_scores: dict[str, float]):
+        uids, values = self._index(miner_scores)
+        np.add.at(self.scores, uids, values)
+
+    def compute(
+        self,
+        min_allowed_weights: int,
+        max_weight_limit: float,
+        overrides: dict[str, float] | None = None,
+        exclude_quantile: int = 0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (uids, normalized weights); overrides replace scores for a what-if only."""
+        scores = self.scores
+        if overrides:
+            scores = scores.copy()
+            uids, values = self._index(overrides)
+            scores[uids] = values
+
+        return process_weights(
+            uids=np.arange(self.n, dtype=np.int64),
+            weights=np.where(self.active, scores, 0),
+            n=self.n,
+            min_allowed_weights=min_allowed_weights,
+            max_weight_limit=max_weight_limit,
+            exclude_quantile=exclude_quantile,
+        )
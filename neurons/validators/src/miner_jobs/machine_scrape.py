@@ -1,19 +1,19 @@
-from ctypes import *
-import sys
-import os
+import hashlib
 import json
+import os
 import re
 import shutil
-import subprocess
+import sys
+import tempfile
 import threading
-import psutil
+import time
+from base64 import b64encode
+from ctypes import *
 from functools import wraps
-import hashlib
+
 import docker
-from base64 import b64encode
+import psutil
 from cryptography.fernet import Fernet
-import tempfile
-
 
 nvmlLib = None
 libLoadLock = threading.Lock()
@@ -335,6 +335,15 @@ def _LoadNvmlLibrary(nvmlLib_content: bytes):
                             # If nvml.dll is not found in System32, it should be in ProgramFiles
                             # load nvml.dll from %ProgramFiles%/NVIDIA Corporation/NVSMI/nvml.dll
                             nvmlLib = CDLL(os.path.join(os.getenv("ProgramFiles", "C:/Program Files"), "NVIDIA Corporation/NVSMI/nvml.dll"))
+                    elif hasattr(os, "memfd_create"):
+                        # load the very bytes that were hashed, from memory
+                        fd = os.memfd_create("libnvidia-ml.so.1")
+                        try:
+                            with open(fd, "wb", closefd=False) as memory_file:
+                                memory_file.write(nvmlLib_content)
+                            nvmlLib = CDLL(f"/proc/self/fd/{fd}")
+                        finally:
+                            os.close(fd)
                     else:
                         # assume linux
                         with tempfile.NamedTemporaryFile(delete=False) as temp_file:
@@ -512,28 +521,6 @@ def nvmlDeviceGetUtilizationRates(handle):
     return c_util
 
 
-def run_cmd(cmd):
-    proc = subprocess.run(cmd, shell=True, capture_output=True, check=False, text=True)
-    if proc.returncode != 0:
-        raise RuntimeError(
-            f"run_cmd error {cmd=!r} {proc.returncode=} {proc.stdout=!r} {proc.stderr=!r}"
-        )
-    return proc.stdout
-
-
-def get_network_speed():
-    """Get upload and download speed of the machine."""
-    data = {"upload_speed": None, "download_speed": None}
-    try:
-        speedtest_cmd = run_cmd("speedtest-cli --json")
-        speedtest_data = json.loads(speedtest_cmd)
-        data["upload_speed"] = speedtest_data["upload"] / 1_000_000  # Convert to Mbps
-        data["download_speed"] = speedtest_data["download"] / 1_000_000  # Convert to Mbps
-    except Exception as exc:
-        data["network_speed_error"] = repr(exc)
-    return data
-
-
 def get_all_container_digests():
     """Verify and return the digests of all running containers."""
     client = docker.from_env()
@@ -572,12 +559,73 @@ def get_md5_checksum_from_file_content(file_content: bytes):
     return md5_hash.hexdigest()
 
 
+LIBNVIDIA_ML = "libnvidia-ml.so.1"
+LD_SO_CACHE = "/etc/ld.so.cache"
+# where drivers and the nvidia container toolkit put the library, if the cache misses it
+LIBNVIDIA_ML_DIRS = [
+    "/usr/lib/x86_64-linux-gnu",
+    "/usr/lib/aarch64-linux-gnu",
+    "/usr/lib64",
+    "/usr/lib",
+    "/usr/local/nvidia/lib64",
+    "/usr/local/nvidia/lib",
+    "/usr/lib/wsl/lib",
+]
+# ELF class of this process, 64 or 32 bit
+ELF_CLASS = 2 if sizeof(c_void_p) == 8 else 1
+
+
+def _is_loadable(path: str) -> bool:
+    """Whether path is an ELF file of this process' word size, a 32 bit library can't be loaded."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(5)
+    except OSError:
+        return False
+    return header[:4] == b"\x7fELF" and header[4] == ELF_CLASS
+
+
 def get_libnvidia_ml_path():
+    """Find the library the way the dynamic linker does, without walking the file system.
+
+    The ld.so cache holds the full path of every library it knows, as null
+    terminated strings, so the paths are picked out of it without parsing it.
+    """
+    candidates = []
     try:
-        original_path = run_cmd("find /usr -name 'libnvidia-ml.so.1'").strip()
-        return original_path
-    except:
-        return ''
+        with open(LD_SO_CACHE, "rb") as f:
+            cache = f.read()
+        candidates += [
+            path.decode()
+            for path in re.findall(rb"(/[^\0]*/" + re.escape(LIBNVIDIA_ML.encode()) + rb")\0", cache)
+        ]
+    except OSError:
+        pass
+    candidates += [os.path.join(directory, LIBNVIDIA_ML) for directory in LIBNVIDIA_ML_DIRS]
+
+    for path in candidates:
+        if _is_loadable(path):
+            return path
+    return ''
+
+
+def read_os_release(path: str = "/etc/os-release") -> dict:
+    release = {}
+    with open(path) as f:
+        for line in f:
+            name, _, value = line.strip().partition("=")
+            if name and not name.startswith("#"):
+                release[name] = value.strip('"\'')
+    return release
+
+
+def read_cpu_model(path: str = "/proc/cpuinfo") -> str:
+    with open(path) as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name.strip() == "model name":
+                return value.strip()
+    raise RuntimeError(f"No model name in {path}")
 
 
 def get_file_content(path: str):
@@ -587,20 +635,64 @@ def get_file_content(path: str):
     return content
 
 
-def get_machine_specs():
-    """Get Specs of miner machine."""
-    data = {}
+# seconds each probe may take, counted from when they all start
+PROBE_TIMEOUTS = {
+    "gpu": 30,
+    "cpu": 10,
+    "ram": 10,
+    "hard_disk": 10,
+    "os": 10,
+    # a hung docker daemon never answers
+    "all_container_digests": 30,
+    "md5_checksums": 30,
+}
 
-    if os.environ.get('LD_PRELOAD'):
-        return data
 
-    data["gpu"] = {"count": 0, "details": []}
-    try:
-        libnvidia_path = get_libnvidia_ml_path()
-        if not libnvidia_path:
-            return data
+def run_probes(probes: dict) -> dict:
+    """Run the probes at once, each returning the fields it scraped.
 
-        nvmlLib_content = get_file_content(libnvidia_path)
+    A probe that raises or is still running at its deadline leaves a
+    <name>_scrape_error field instead. Probes run in daemon threads, so that
+    a hung one does not keep the scrape from exiting. The seconds each probe
+    took go in probe_durations.
+    """
+    outcomes = {}
+
+    def run(name, probe):
+        started_at = time.monotonic()
+        try:
+            outcome = (probe(), None)
+        except Exception as exc:
+            outcome = (None, exc)
+        outcomes[name] = outcome + (time.monotonic() - started_at,)
+
+    started_at = time.monotonic()
+    threads = {}
+    for name, probe in probes.items():
+        threads[name] = threading.Thread(target=run, args=(name, probe), daemon=True)
+        threads[name].start()
+
+    data = {"probe_durations": {}}
+    for name, thread in threads.items():
+        thread.join(max(started_at + PROBE_TIMEOUTS[name] - time.monotonic(), 0))
+        if name not in outcomes:
+            data[f"{name}_scrape_error"] = repr(TimeoutError(f"{name} probe took more than {PROBE_TIMEOUTS[name]}s"))
+            data["probe_durations"][name] = time.monotonic() - started_at
+            continue
+
+        result, exc, duration = outcomes[name]
+        data["probe_durations"][name] = duration
+        if exc is not None:
+            data[f"{name}_scrape_error"] = repr(exc)
+        else:
+            data.update(result)
+
+    return data
+
+
+def probe_gpu(nvmlLib_content: bytes) -> dict:
+    data = {}
+    try:
         nvmlInit(nvmlLib_content)
 
         device_count = nvmlDeviceGetCount()
@@ -614,12 +706,6 @@ def get_machine_specs():
 
         for i in range(device_count):
             handle = nvmlDeviceGetHandleByIndex(i)
-            # graphic_clock = nvmlDeviceGetDefaultApplicationsClock(handle, NVML_CLOCK_GRAPHICS)
-            # memory_clock = nvmlDeviceGetDefaultApplicationsClock(handle, NVML_CLOCK_MEM)
-            # memory_clocks = nvmlDeviceGetSupportedMemoryClocks(handle)
-            # print(graphic_clock)
-            # print(memory_clock)
-            # print(memory_clocks)
 
             cuda_compute_capability = nvmlDeviceGetCudaComputeCapability(handle)
             major = cuda_compute_capability[0]
@@ -645,85 +731,100 @@ def get_machine_specs():
 
         nvmlShutdown()
     except Exception as exc:
-        # print(f'Error getting os specs: {exc}', flush=True)
         data["gpu_scrape_error"] = repr(exc)
 
         # Scrape the NVIDIA Container Runtime config
-        nvidia_cfg_cmd = 'cat /etc/nvidia-container-runtime/config.toml'
         try:
-            data["nvidia_cfg"] = run_cmd(nvidia_cfg_cmd)
+            data["nvidia_cfg"] = get_file_content('/etc/nvidia-container-runtime/config.toml').decode()
         except Exception as exc:
             data["nvidia_cfg_scrape_error"] = repr(exc)
 
         # Scrape the Docker Daemon config
-        docker_cfg_cmd = 'cat /etc/docker/daemon.json'
         try:
-            data["docker_cfg"] = run_cmd(docker_cfg_cmd)
+            data["docker_cfg"] = get_file_content('/etc/docker/daemon.json').decode()
         except Exception as exc:
             data["docker_cfg_scrape_error"] = repr(exc)
 
-    data["cpu"] = {"count": 0, "model": "", "clocks": []}
-    try:
-        lscpu_output = run_cmd("lscpu")
-        data["cpu"]["model"] = re.search(r"Model name:\s*(.*)$", lscpu_output, re.M).group(1)
-        data["cpu"]["count"] = int(re.search(r"CPU\(s\):\s*(.*)", lscpu_output).group(1))
-        data["cpu"]["utilization"] = psutil.cpu_percent(interval=1)
-    except Exception as exc:
-        # print(f'Error getting cpu specs: {exc}', flush=True)
-        data["cpu_scrape_error"] = repr(exc)
+    return data
 
-    data["ram"] = {}
-    try:
-        # with open("/proc/meminfo") as f:
-        #     meminfo = f.read()
-
-        # for name, key in [
-        #     ("MemAvailable", "available"),
-        #     ("MemFree", "free"),
-        #     ("MemTotal", "total"),
-        # ]:
-        #     data["ram"][key] = int(re.search(rf"^{name}:\s*(\d+)\s+kB$", meminfo, re.M).group(1))
-        # data["ram"]["used"] = data["ram"]["total"] - data["ram"]["available"]
-        # data['ram']['utilization'] = (data["ram"]["used"] / data["ram"]["total"]) * 100
-
-        mem = psutil.virtual_memory()
-        data["ram"] = {
+
+def probe_cpu() -> dict:
+    return {"cpu": {"count": os.cpu_count(), "model": read_cpu_model(), "clocks": []}}
+
+
+def probe_ram() -> dict:
+    mem = psutil.virtual_memory()
+    return {
+        "ram": {
             "total": mem.total / 1024,
             "free": mem.free / 1024,
-            "used": mem.free / 1024,
+            "used": mem.used / 1024,
             "available": mem.available / 1024,
             "utilization": mem.percent
         }
-    except Exception as exc:
-        # print(f"Error reading /proc/meminfo; Exc: {exc}", file=sys.stderr)
-        data["ram_scrape_error"] = repr(exc)
+    }
 
-    data["hard_disk"] = {}
-    try:
-        disk_usage = shutil.disk_usage(".")
-        data["hard_disk"] = {
+
+def probe_hard_disk() -> dict:
+    disk_usage = shutil.disk_usage(".")
+    return {
+        "hard_disk": {
             "total": disk_usage.total // 1024,  # in kiB
             "used": disk_usage.used // 1024,
             "free": disk_usage.free // 1024,
             "utilization": (disk_usage.used / disk_usage.total) * 100
         }
-    except Exception as exc:
-        # print(f"Error getting disk_usage from shutil: {exc}", file=sys.stderr)
-        data["hard_disk_scrape_error"] = repr(exc)
+    }
 
-    data["os"] = ""
+
+def probe_md5_checksums(nvmlLib_content: bytes) -> dict:
+    nvidia_smi_path = shutil.which("nvidia-smi")
+    if not nvidia_smi_path:
+        raise RuntimeError("nvidia-smi not found")
+    return {
+        "md5_checksums": {
+            "nvidia_smi": get_md5_checksum_from_path(nvidia_smi_path),
+            "libnvidia_ml": get_md5_checksum_from_file_content(nvmlLib_content),
+        }
+    }
+
+
+def get_machine_specs():
+    """Get Specs of miner machine."""
+    data = {}
+
+    if os.environ.get('LD_PRELOAD'):
+        return data
+
+    # cpu utilization is measured over the whole scrape, instead of blocking for it
+    psutil.cpu_percent(interval=None)
+
+    data["gpu"] = {"count": 0, "details": []}
+    libnvidia_path = get_libnvidia_ml_path()
+    if not libnvidia_path:
+        return data
     try:
-        data["os"] = run_cmd('lsb_release -d | grep -Po "Description:\\s*\\K.*"').strip()
+        nvmlLib_content = get_file_content(libnvidia_path)
     except Exception as exc:
-        # print(f'Error getting os specs: {exc}', flush=True)
-        data["os_scrape_error"] = repr(exc)
-
-    data["network"] = get_network_speed()
-    data["all_container_digests"] = get_all_container_digests()
-    data["md5_checksums"] = {
-        "nvidia_smi": get_md5_checksum_from_path(run_cmd("which nvidia-smi").strip()),
-        "libnvidia_ml": get_md5_checksum_from_file_content(nvmlLib_content),
-    }
+        data["gpu_scrape_error"] = repr(exc)
+        return data
+
+    data["cpu"] = {"count": 0, "model": "", "clocks": []}
+    data["ram"] = {}
+    data["hard_disk"] = {}
+    data["os"] = ""
+    data.update(run_probes({
+        "gpu": lambda: probe_gpu(nvmlLib_content),
+        "cpu": probe_cpu,
+        "ram": probe_ram,
+        "hard_disk": probe_hard_disk,
+        "os": lambda: {"os": read_os_release()["PRETTY_NAME"]},
+        "all_container_digests": lambda: {"all_container_digests": get_all_container_digests()},
+        "md5_checksums": lambda: probe_md5_checksums(nvmlLib_content),
+    }))
+
+    if "cpu_scrape_error" not in data:
+        data["cpu"]["utilization"] = psutil.cpu_percent(interval=None)
 
     return data
 
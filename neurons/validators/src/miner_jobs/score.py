@@ -1,60 +1,113 @@
-import sys
+import asyncio
+import hashlib
+import json
 import os
+import shutil
 import subprocess
+import sys
 import tempfile
-import json
-import hashlib
+import time
 from base64 import b64encode
-import asyncio
+
+HASHCAT = shutil.which("hashcat") or "/usr/bin/hashcat"
 
 
 def gen_hash(s: bytes) -> bytes:
     return b64encode(hashlib.sha256(s).digest(), altchars=b"-_")
 
 
-payload = sys.argv[1]
-data = json.loads(payload)
-
-gpu_count = data["gpu_count"]
-num_job_params = data["num_job_params"]
-jobs = data["jobs"]
-timeout = data["timeout"]
+def open_hash_list(payload: str) -> tuple[int, str]:
+    """An fd holding the hash list, and the path hashcat opens it by.
+
+    hashcat reads the hash file twice, so it has to be seekable: an in-memory
+    file where there is memfd_create, an unlinked temporary file otherwise.
+    """
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("hashes")
+    else:
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        os.unlink(path)
+    os.write(fd, payload.encode("utf-8"))
+    return fd, f"/dev/fd/{fd}"
+
+
+async def run_session(device_id: int, algorithm: str, mask: str, payload: str, processes: list) -> dict[str, str]:
+    """Crack the hashes of payload with one hashcat run, returning plain passwords by hash."""
+    fd, hash_list = open_hash_list(payload)
+    try:
+        # a session per device, so that concurrent runs do not see each other's pid file
+        process = await asyncio.create_subprocess_exec(
+            HASHCAT,
+            f"--session=score{device_id}",
+            "--potfile-disable",
+            "--restore-disable",
+            "--attack-mode", "3",
+            "-d", str(device_id),
+            "--workload-profile", "3",
+            "--optimized-kernel-enable",
+            "--hash-type", algorithm,
+            "--hex-salt",
+            "-1", "?l?d?u",
+            # hash:salt:plain, to tell apart the passwords of batched job params
+            "--outfile-format", "1,2",
+            "--quiet",
+            hash_list,
+            mask,
+            stdout=subprocess.PIPE,
+            pass_fds=(fd,),
+        )
+        processes.append(process)
+        stdout, _ = await process.communicate()
+    finally:
+        os.close(fd)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, HASHCAT)
+    cracked = {}
+    for line in stdout.decode("utf-8").split("\n"):
+        if line:
+            fields = line.split(":")
+            cracked[fields[0].lower()] = fields[-1]
+    return cracked
+
+
+async def run_hashcat(device_id: int, job: dict, num_job_params: int, processes: list) -> list[list[str]]:
+    # hashcat takes many salts of one hash type and mask at once, so job params
+    # sharing both are cracked in one run, and the other runs follow on the device
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i in range(num_job_params):
+        groups.setdefault((str(job["algorithms"][i]), job["masks"][i]), []).append(i)
 
+    cracked = {}
+    for (algorithm, mask), params in groups.items():
+        payload = "\n".join(job["payloads"][i] for i in params)
+        cracked.update(await run_session(device_id, algorithm, mask, payload, processes))
 
-def run_hashcat(device_id: int, job: dict) -> list[str]:
     answers = []
     for i in range(num_job_params):
-        payload = job["payloads"][i]
-        mask = job["masks"][i]
-        algorithm = job["algorithms"][i]
-
-        with tempfile.NamedTemporaryFile(delete=True, suffix='.txt') as payload_file:
-            payload_file.write(payload.encode('utf-8'))
-            payload_file.flush()
-            os.fsync(payload_file.fileno())
-
-            subprocess.check_output(f"cp /usr/bin/hashcat /usr/bin/hashcat{device_id}", shell=True)
-
-            cmd = f'hashcat{device_id} --potfile-disable --restore-disable --attack-mode 3 -d {device_id} --workload-profile 3 --optimized-kernel-enable --hash-type {algorithm} --hex-salt -1 "?l?d?u" --outfile-format 2 --quiet {payload_file.name} "{mask}"'
-            stdout = subprocess.check_output(cmd, shell=True, text=True)
-            passwords = [p for p in sorted(stdout.split("\n")) if p != ""]
-            answers.append(passwords)
+        hashes = [line.split(":")[0].lower() for line in job["payloads"][i].split("\n") if line]
+        answers.append(sorted(cracked[h] for h in hashes if h in cracked))
 
     return answers
 
 
-
-async def run_jobs():
-    tasks = [
-        asyncio.to_thread(
-            run_hashcat,
-            i+1,
-            jobs[i]
+async def run_jobs(data: dict):
+    processes = []
+    started_at = time.monotonic()
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*[
+                run_hashcat(i + 1, data["jobs"][i], data["num_job_params"], processes)
+                for i in range(data["gpu_count"])
+            ]),
+            timeout=data["timeout"],
         )
-        for i in range(gpu_count)
-    ]
+    finally:
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+    elapsed = time.monotonic() - started_at
 
-    results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=timeout)
     result = {
         "answer": gen_hash("".join([
             "".join([
@@ -62,10 +115,13 @@ async def run_jobs():
                 for passwords in answers
             ])
             for answers in results
-        ]).encode("utf-8")).decode("utf-8")
+        ]).encode("utf-8")).decode("utf-8"),
+        # seconds from the first hashcat start to the last one's end
+        "elapsed": elapsed,
     }
 
     print(json.dumps(result))
 
+
 if __name__ == "__main__":
-    asyncio.run(run_jobs())
+    asyncio.run(run_jobs(json.loads(sys.argv[1])))
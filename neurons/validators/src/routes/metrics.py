@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from core import metrics
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics")
+async def get_metrics():
+    """Validator metrics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
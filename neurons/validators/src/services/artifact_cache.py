@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import os
+import posixpath
+import shlex
+import stat
+import uuid
+from dataclasses import dataclass
+
+import asyncssh
+
+from services.sftp_transfer import REMOTE_ZSTD_MARKER, REMOTE_ZSTD_PROBE, SFTPTransfer
+
+ARTIFACT_CACHE_DIR_NAME = ".artifact_cache"
+# newest blobs are kept up to this size, the cache has to hold at least one job batch
+ARTIFACT_CACHE_MAX_BYTES = 512 * (2**20)
+# uploads that did not make it into the cache, e.g. because the connection dropped
+ARTIFACT_PART_MAX_AGE_MINUTES = 60
+ARTIFACT_COMMAND_TIMEOUT = 60
+HASH_CHUNK_SIZE = 2**20
+
+
+@dataclass(frozen=True)
+class Artifact:
+    path: str
+    digest: str
+    size: int
+    executable: bool
+
+
+@dataclass
+class UploadStats:
+    files: int
+    total_bytes: int
+    uploaded_files: int
+    uploaded_bytes: int
+    # bytes sent for the uploaded files, less than uploaded_bytes when compressed
+    wire_bytes: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        return self.uploaded_bytes / self.seconds if self.seconds else 0
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Upload directories to executors through a content-addressed remote cache.
+
+    Every file is stored once as ``<cache dir>/<sha256>``, next to the directory it is
+    uploaded to, and copied into place. One command checks the blobs against their
+    names and lists the intact ones, only the others are sent (see SFTPTransfer), and
+    one more command copies the files and evicts the least recently used blobs beyond
+    ARTIFACT_CACHE_MAX_BYTES. Copies rather than links, so that nothing written to
+    the job directory ever reaches the cache.
+
+    A directory is walked and hashed once, on its first upload; whoever builds it
+    again in place calls invalidate.
+    """
+
+    def __init__(self, transfer: SFTPTransfer | None = None):
+        self.transfer = transfer or SFTPTransfer()
+        self._manifests: dict[str, list[Artifact]] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _signature(local_dir: str) -> tuple:
+        files = []
+        for root, _, names in os.walk(local_dir):
+            for name in names:
+                file_stat = os.stat(os.path.join(root, name))
+                files.append((os.path.join(root, name), file_stat.st_size, file_stat.st_mtime_ns))
+        return tuple(sorted(files))
+
+    @staticmethod
+    def _build_manifest(local_dir: str, signature: tuple) -> list[Artifact]:
+        return [
+            Artifact(
+                path=os.path.relpath(path, local_dir).replace(os.sep, "/"),
+                digest=_hash_file(path),
+                size=size,
+                executable=bool(os.stat(path).st_mode & stat.S_IXUSR),
+            )
+            for path, size, _ in signature
+        ]
+
+    async def get_manifest(self, local_dir: str) -> list[Artifact]:
+        """Hash local_dir once per build, the executors of a job batch share its manifest."""
+        async with self._lock:
+            manifest = self._manifests.get(local_dir)
+            if manifest is not None:
+                return manifest
+
+            signature = await asyncio.to_thread(self._signature, local_dir)
+            manifest = await asyncio.to_thread(self._build_manifest, local_dir, signature)
+            self._manifests = {local_dir: manifest}
+            return manifest
+
+    def invalidate(self, local_dir: str):
+        """Forget the manifest of local_dir, its files were built again."""
+        self._manifests.pop(local_dir, None)
+
+    @staticmethod
+    async def _run(ssh_client: asyncssh.SSHClientConnection, command: str) -> str:
+        result = await ssh_client.run(command, timeout=ARTIFACT_COMMAND_TIMEOUT)
+        if result.exit_status != 0:
+            raise Exception(f"Artifact cache command failed: {result.stderr}")
+        return result.stdout or ""
+
+    async def upload_directory(
+        self,
+        ssh_client: asyncssh.SSHClientConnection,
+        local_dir: str,
+        remote_dir: str,
+    ) -> UploadStats:
+        """Replace remote_dir with the contents of local_dir."""
+        manifest = await self.get_manifest(local_dir)
+        cache_dir = posixpath.join(posixpath.dirname(remote_dir.rstrip("/")), ARTIFACT_CACHE_DIR_NAME)
+        quoted_cache_dir = shlex.quote(cache_dir)
+        digests = sorted({artifact.digest for artifact in manifest})
+
+        # a blob counts only if its contents still hash to its name, a corrupted or
+        # swapped one is sent again; intact blobs are touched to be the last evicted
+        checklist = " ".join(f"{digest} {digest}" for digest in digests)
+        output = await self._run(
+            ssh_client,
+            f"mkdir -p {quoted_cache_dir} && cd {quoted_cache_dir} && "
+            f"intact=$(printf '%s  %s\\n' {checklist} | sha256sum -c 2>/dev/null | sed -n 's/: OK$//p'); "
+            f'echo "$intact"; [ -z "$intact" ] || touch $intact; '
+            f"{REMOTE_ZSTD_PROBE} || true",
+        )
+        lines = set(output.split())
+        missing = set(digests) - lines
+        remote_zstd = REMOTE_ZSTD_MARKER in lines
+
+        uploads = {
+            artifact.digest: (artifact, f"{artifact.digest}.part.{uuid.uuid4().hex}")
+            for artifact in manifest
+            if artifact.digest in missing
+        }
+        transfer_stats = await self.transfer.put_files(
+            ssh_client,
+            [
+                (os.path.join(local_dir, artifact.path), posixpath.join(cache_dir, part), artifact.digest)
+                for artifact, part in uploads.values()
+            ],
+            remote_zstd=remote_zstd,
+        )
+
+        remote_dirs = sorted({
+            posixpath.join(remote_dir, posixpath.dirname(artifact.path)) for artifact in manifest
+        } | {remote_dir})
+        executables = [
+            shlex.quote(posixpath.join(remote_dir, artifact.path))
+            for artifact in manifest
+            if artifact.executable
+        ]
+        # blobs of executables are stored executable, cp -p keeps the mode of a cached one
+        commands = [
+            f"cd {quoted_cache_dir}",
+            *[
+                f"chmod +x {part}"
+                for artifact, part in uploads.values()
+                if artifact.executable
+            ],
+            *[f"mv -f {part} {digest}" for digest, (_, part) in uploads.items()],
+            f"rm -rf {shlex.quote(remote_dir)}",
+            f"mkdir -p {' '.join(shlex.quote(path) for path in remote_dirs)}",
+            *[
+                f"cp -pf {artifact.digest} {target}"
+                for artifact in manifest
+                for target in [shlex.quote(posixpath.join(remote_dir, artifact.path))]
+            ],
+        ]
+        if executables:
+            commands.append(f"chmod +x {' '.join(executables)}")
+        # eviction is best effort and never fails an upload
+        evict = (
+            f"find . -maxdepth 1 -type f -name '*.part.*' -mmin +{ARTIFACT_PART_MAX_AGE_MINUTES} -delete; "
+            f"find . -maxdepth 1 -type f ! -name '*.part.*' -printf '%T@ %s %f\\n' | sort -rn | "
+            f"awk '{{ total += $2 }} total > {ARTIFACT_CACHE_MAX_BYTES} {{ print $3 }}' | xargs -r rm -f"
+        )
+        await self._run(ssh_client, f"{' && '.join(commands)} && {{ {evict}; true; }}")
+
+        return UploadStats(
+            files=len(manifest),
+            total_bytes=sum(artifact.size for artifact in manifest),
+            uploaded_files=len(uploads),
+            uploaded_bytes=transfer_stats.bytes,
+            wire_bytes=transfer_stats.wire_bytes,
+            seconds=transfer_stats.seconds,
+        )
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from core.utils import _m, get_extra_info
+from services.hash_service import HashService, generate_challenges
+
+logger = logging.getLogger(__name__)
+
+# challenges made by one call to a worker process, to spread the pickling cost
+CHALLENGE_BATCH_SIZE = 8
+
+ChallengeKey = tuple[int, int]
+
+
+class HashChallengePool:
+    """Hashcat challenges generated ahead of time in worker processes.
+
+    Challenges are kept per (gpu_count, num_digits). Taking one tops its bucket
+    back up to pool_size in the background, and a challenge is only ever handed
+    out once. When a bucket is empty, the challenge is generated on demand, still
+    in a worker process, so the event loop never hashes anything.
+    """
+
+    def __init__(self, pool_size: int, workers: int):
+        self.pool_size = pool_size
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._buckets: dict[ChallengeKey, deque[HashService]] = {}
+        self._refilling: dict[ChallengeKey, asyncio.Task] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forked from a fresh server process, not from the validator with its threads and sockets
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._executor
+
+    async def _generate(self, count: int, key: ChallengeKey) -> list[HashService]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, generate_challenges, count, *key)
+
+    async def _refill(self, key: ChallengeKey):
+        bucket = self._buckets[key]
+        try:
+            while len(bucket) < self.pool_size:
+                batches = [
+                    self._generate(min(CHALLENGE_BATCH_SIZE, missing), key)
+                    for missing in range(self.pool_size - len(bucket), 0, -CHALLENGE_BATCH_SIZE)
+                ]
+                for challenges in await asyncio.gather(*batches):
+                    bucket.extend(challenges)
+        except Exception as e:
+            logger.error(
+                _m(
+                    "Failed to refill hashcat challenges",
+                    extra=get_extra_info({"gpu_count": key[0], "num_digits": key[1], "error": str(e)}),
+                ),
+            )
+
+    def _schedule_refill(self, key: ChallengeKey):
+        if key in self._refilling or len(self._buckets[key]) >= self.pool_size:
+            return
+        refill = asyncio.create_task(self._refill(key))
+        self._refilling[key] = refill
+        refill.add_done_callback(lambda _: self._refilling.pop(key, None))
+
+    def warm(self, keys: set[ChallengeKey]):
+        """Start filling the buckets of the challenges expected to be asked for."""
+        for key in keys:
+            self._buckets.setdefault(key, deque())
+            self._schedule_refill(key)
+
+    async def wait_refilled(self):
+        await asyncio.gather(*self._refilling.values(), return_exceptions=True)
+
+    def available(self, gpu_count: int, num_digits: int) -> int:
+        return len(self._buckets.get((gpu_count, num_digits), ()))
+
+    async def get(self, gpu_count: int, num_digits: int, timeout: int) -> HashService:
+        key = (gpu_count, num_digits)
+        bucket = self._buckets.setdefault(key, deque())
+        if bucket:
+            challenge = bucket.popleft()
+        else:
+            challenge, = await self._generate(1, key)
+        self._schedule_refill(key)
+
+        challenge.timeout = timeout
+        return challenge
+
+    async def close(self):
+        for refill in list(self._refilling.values()):
+            refill.cancel()
+        await asyncio.gather(*self._refilling.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
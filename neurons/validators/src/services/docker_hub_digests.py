@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+
+import aiohttp
+
+from core.utils import _m, get_extra_info
+from services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+DOCKER_HUB_AUTH_URL = "https://auth.docker.io/token"
+DOCKER_HUB_REGISTRY_URL = "https://index.docker.io"
+DOCKER_HUB_SERVICE = "registry.docker.io"
+MANIFEST_ACCEPT = "application/vnd.docker.distribution.manifest.v2+json"
+DOCKER_HUB_DIGESTS_PREFIX = "docker_hub_digests"
+# digests younger than this are served as they are
+DIGEST_TTL = 15 * 60
+# older ones are still served, while being refreshed in the background
+DIGEST_MAX_STALE = 6 * 60 * 60
+DIGEST_HEAD_CONCURRENCY = 16
+# tokens are renewed this long before they expire
+TOKEN_EXPIRY_MARGIN = 30
+DEFAULT_TOKEN_EXPIRES_IN = 60
+REGISTRY_REQUEST_TIMEOUT = 30
+
+
+@dataclass
+class DigestEntry:
+    # "repository:tag" -> digest, for the tags of one entry of the repository list
+    digests: dict[str, str] = field(default_factory=dict)
+    etags: dict[str, str] = field(default_factory=dict)
+    tags_etag: str | None = None
+    fetched_at: float = 0
+
+
+class DockerHubDigests:
+    """Digests of Docker Hub images, cached in memory and in Redis.
+
+    Digests younger than DIGEST_TTL are served from the cache. Older ones are
+    served while one background refresh per repository fetches them again, up to
+    DIGEST_MAX_STALE, after which callers wait for the refresh. A refresh reuses
+    the pull token of its repository and sends the ETags it has seen, so that
+    unchanged tag lists and manifests come back as 304s, with its manifest HEADs
+    in parallel.
+    """
+
+    def __init__(
+        self,
+        redis_service: RedisService,
+        auth_url: str = DOCKER_HUB_AUTH_URL,
+        registry_url: str = DOCKER_HUB_REGISTRY_URL,
+        service: str = DOCKER_HUB_SERVICE,
+    ):
+        self.redis_service = redis_service
+        self.auth_url = auth_url
+        self.registry_url = registry_url
+        self.service = service
+        self._entries: dict[str, DigestEntry] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self._tokens: dict[str, tuple[str, float]] = {}
+
+    async def get(self, repositories: list[str]) -> dict[str, str]:
+        """Return "repository:tag" -> digest for every tag of the repositories."""
+        entries = await asyncio.gather(*[self._get_entry(repo) for repo in repositories])
+        all_digests = {}
+        for entry in entries:
+            if entry is not None:
+                all_digests.update(entry.digests)
+        return all_digests
+
+    async def _get_entry(self, repo: str) -> DigestEntry | None:
+        entry = self._entries.get(repo) or await self._load(repo)
+        age = time.time() - entry.fetched_at if entry is not None else None
+        if age is not None and age < DIGEST_TTL:
+            return entry
+
+        refresh = self._refreshing.get(repo)
+        if refresh is None:
+            refresh = asyncio.create_task(self._refresh(repo, entry))
+            self._refreshing[repo] = refresh
+            refresh.add_done_callback(lambda _: self._refreshing.pop(repo, None))
+        if age is not None and age < DIGEST_MAX_STALE:
+            return entry
+
+        # even older digests are better than none when Docker Hub is down
+        return await asyncio.shield(refresh) or entry
+
+    async def _load(self, repo: str) -> DigestEntry | None:
+        try:
+            data = await self.redis_service.get(f"{DOCKER_HUB_DIGESTS_PREFIX}:{repo}")
+        except Exception as e:
+            logger.warning(
+                _m("Failed to load Docker Hub digests", extra=get_extra_info({"repo": repo, "error": str(e)}))
+            )
+            return None
+        if data is None:
+            return None
+        entry = self._entries[repo] = DigestEntry(**json.loads(data))
+        return entry
+
+    async def _save(self, repo: str, entry: DigestEntry):
+        try:
+            await self.redis_service.set(
+                f"{DOCKER_HUB_DIGESTS_PREFIX}:{repo}", json.dumps(asdict(entry)), ex=DIGEST_MAX_STALE
+            )
+        except Exception as e:
+            logger.warning(
+                _m("Failed to save Docker Hub digests", extra=get_extra_info({"repo": repo, "error": str(e)}))
+            )
+
+    async def _get_token(self, session: aiohttp.ClientSession, repository: str) -> str:
+        token, expires_at = self._tokens.get(repository, (None, 0))
+        if token is not None and time.monotonic() < expires_at:
+            return token
+
+        async with session.get(
+            self.auth_url,
+            params={"service": self.service, "scope": f"repository:{repository}:pull"},
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+        token = data.get("token") or data.get("access_token")
+        expires_in = data.get("expires_in") or DEFAULT_TOKEN_EXPIRES_IN
+        self._tokens[repository] = (token, time.monotonic() + expires_in - TOKEN_EXPIRY_MARGIN)
+        return token
+
+    async def _list_tags(
+        self,
+        session: aiohttp.ClientSession,
+        repository: str,
+        headers: dict[str, str],
+        previous: DigestEntry | None,
+    ) -> tuple[list[str], str | None]:
+        if previous is not None and previous.tags_etag:
+            headers = {**headers, "If-None-Match": previous.tags_etag}
+
+        async with session.get(f"{self.registry_url}/v2/{repository}/tags/list", headers=headers) as response:
+            if response.status == 304:
+                return [name.split(":", 1)[1] for name in previous.digests], previous.tags_etag
+            response.raise_for_status()
+            data = await response.json()
+            return data.get("tags") or [], response.headers.get("ETag")
+
+    async def _fetch(self, repo: str, previous: DigestEntry | None) -> DigestEntry:
+        repository, specified_tag = repo.split(":", 1) if ":" in repo else (repo, None)
+        entry = DigestEntry(fetched_at=time.time())
+
+        timeout = aiohttp.ClientTimeout(total=REGISTRY_REQUEST_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            token = await self._get_token(session, repository)
+            headers = {"Authorization": f"Bearer {token}"}
+
+            # find all tags if no specific tag is specified
+            if specified_tag is None:
+                tags, entry.tags_etag = await self._list_tags(session, repository, headers, previous)
+            else:
+                tags = [specified_tag]
+
+            slots = asyncio.Semaphore(DIGEST_HEAD_CONCURRENCY)
+
+            async def head(tag: str):
+                name = f"{repository}:{tag}"
+                request_headers = {**headers, "Accept": MANIFEST_ACCEPT}
+                etag = previous.etags.get(name) if previous is not None else None
+                if etag and name in previous.digests:
+                    request_headers["If-None-Match"] = etag
+
+                async with slots, session.head(
+                    f"{self.registry_url}/v2/{repository}/manifests/{tag}", headers=request_headers
+                ) as response:
+                    if response.status == 304:
+                        entry.digests[name], entry.etags[name] = previous.digests[name], etag
+                        return
+                    response.raise_for_status()
+                    entry.digests[name] = response.headers.get("Docker-Content-Digest")
+                    if response.headers.get("ETag"):
+                        entry.etags[name] = response.headers["ETag"]
+
+            try:
+                await asyncio.gather(*[head(tag) for tag in tags])
+            except aiohttp.ClientResponseError as e:
+                if e.status == 401:
+                    # the token was revoked before it expired
+                    self._tokens.pop(repository, None)
+                raise
+
+        return entry
+
+    async def _refresh(self, repo: str, previous: DigestEntry | None) -> DigestEntry | None:
+        started_at = time.perf_counter()
+        try:
+            entry = await self._fetch(repo, previous)
+        except Exception as e:
+            logger.error(
+                _m(
+                    "Error retrieving Docker Hub digests",
+                    extra=get_extra_info({"repo": repo, "error": str(e)}),
+                ),
+            )
+            return None
+
+        self._entries[repo] = entry
+        await self._save(repo, entry)
+        logger.info(
+            _m(
+                "Refreshed Docker Hub digests",
+                extra=get_extra_info({
+                    "repo": repo,
+                    "tags": len(entry.digests),
+                    "seconds": round(time.perf_counter() - started_at, 3),
+                }),
+            ),
+        )
+        return entry
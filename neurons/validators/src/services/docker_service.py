@@ -1,14 +1,15 @@
 import asyncio
 import logging
-import time
 from typing import Annotated
 from uuid import uuid4
 
-import aiohttp
 import asyncssh
 import bittensor
 from datura.requests.miner_requests import ExecutorSSHInfo
 from fastapi import Depends
+
+from core.readiness import wait_for_ssh, wait_until
+from core.utils import _m, get_extra_info
 from payload_models.payloads import (
     ContainerCreatedResult,
     ContainerCreateRequest,
@@ -19,17 +20,17 @@ from payload_models.payloads import (
     FailedContainerRequest,
 )
 from protocol.vc_protocol.compute_requests import RentedMachine
-
-from core.utils import _m, get_extra_info
-from services.redis_service import (
-    AVAILABLE_PORT_MAPS_PREFIX,
-    STREAMING_LOG_CHANNEL,
-    RedisService,
-)
+from services.docker_hub_digests import DockerHubDigests
+from services.port_allocator import PortAllocator
+from services.redis_service import STREAMING_LOG_CHANNEL, RedisService
+from services.ssh_pool import SSHConnectionPool
 from services.ssh_service import SSHService
 
 logger = logging.getLogger(__name__)
 
+# for a started container to run its command and sshd
+CONTAINER_READY_TIMEOUT = 20
+
 REPOSITORYS = [
     "daturaai/compute-subnet-executor:latest",
     "daturaai/compute-subnet-executor-runner:latest",
@@ -44,9 +45,13 @@ class DockerService:
         self,
         ssh_service: Annotated[SSHService, Depends(SSHService)],
         redis_service: Annotated[RedisService, Depends(RedisService)],
+        ssh_pool: Annotated[SSHConnectionPool, Depends(SSHConnectionPool)],
     ):
         self.ssh_service = ssh_service
         self.redis_service = redis_service
+        self.ssh_pool = ssh_pool
+        self.port_allocator = PortAllocator(redis_service)
+        self.digest_cache = DockerHubDigests(redis_service)
         self.lock = asyncio.Lock()
         self.logs_queue: list[dict] = []
         self.log_task: asyncio.Task | None = None
@@ -58,21 +63,19 @@ class DockerService:
             if internal_ports:
                 docker_internal_ports = internal_ports
 
-            key = f"{AVAILABLE_PORT_MAPS_PREFIX}:{miner_hotkey}:{executor_id}"
-            available_port_maps = await self.redis_service.lrange(key)
+            # the ports verified by the latest probes, held until the container is up
+            available_port_maps = await self.port_allocator.lease_known_good(
+                miner_hotkey, executor_id, len(docker_internal_ports)
+            )
 
-            logger.info(f"available_port_maps: {key}, {available_port_maps}")
+            logger.info(f"available_port_maps: {miner_hotkey}:{executor_id}, {available_port_maps}")
 
-            mappings = []
-            for i, docker_port in enumerate(docker_internal_ports):
-                if i < len(available_port_maps):
-                    internal_port, external_port = map(
-                        int, available_port_maps[i].decode().split(",")
-                    )
-                    mappings.append((docker_port, internal_port, external_port))
-                else:
-                    break
-            return mappings
+            return [
+                (docker_port, internal_port, external_port)
+                for docker_port, (internal_port, external_port) in zip(
+                    docker_internal_ports, available_port_maps
+                )
+            ]
         except Exception as e:
             logger.error(f"Error generating port mappings: {e}", exc_info=True)
             return []
@@ -173,13 +176,11 @@ class DockerService:
         self, ssh_client: asyncssh.SSHClientConnection, container_name: str, timeout: int = 10
     ):
         """Check if the container is running"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        async def is_running():
             result = await ssh_client.run(f"docker ps -q -f name={container_name}")
-            if result.stdout.strip():
-                return True
-            await asyncio.sleep(1)
-        return False
+            return bool(result.stdout.strip())
+
+        return await wait_until(is_running, timeout)
 
     async def create_container(
         self,
@@ -206,6 +207,9 @@ class DockerService:
         )
 
         custom_options = payload.custom_options
+        port_maps = []
+        # known only once the container runs with them
+        ports_ok = None
 
         try:
             # generate port maps
@@ -231,12 +235,11 @@ class DockerService:
             private_key = self.ssh_service.decrypt_payload(keypair.ss58_address, private_key)
             pkey = asyncssh.import_private_key(private_key)
 
-            async with asyncssh.connect(
+            async with self.ssh_pool.connect(
                 host=executor_info.address,
                 port=executor_info.ssh_port,
                 username=executor_info.ssh_username,
-                client_keys=[pkey],
-                known_hosts=None,
+                client_key=pkey,
             ) as ssh_client:
                 logger.info(
                     _m(
@@ -427,6 +430,7 @@ class DockerService:
                         extra=get_extra_info({**default_extra, "container_name": container_name}),
                     ),
                 )
+                ports_ok = True
 
                 await self.finish_stream_logs()
 
@@ -461,6 +465,34 @@ class DockerService:
                 msg=str(log_text),
                 error_code=FailedContainerErrorCodes.UnknownError,
             )
+        finally:
+            await self.release_port_maps(payload.miner_hotkey, payload.executor_id, port_maps, ports_ok)
+
+    async def release_port_maps(
+        self,
+        miner_hotkey: str,
+        executor_id: str,
+        port_maps: list[tuple[int, int, int]],
+        ok: bool | None,
+    ):
+        """End the leases of generate_portMappings, recording whether the ports worked unless ok is None."""
+        for _, internal_port, external_port in port_maps:
+            try:
+                await self.port_allocator.release(
+                    miner_hotkey, executor_id, (internal_port, external_port), ok
+                )
+            except Exception as e:
+                logger.error(
+                    _m(
+                        "Releasing port map failed",
+                        extra=get_extra_info({
+                            "miner_hotkey": miner_hotkey,
+                            "executor_uuid": executor_id,
+                            "port_map": (internal_port, external_port),
+                            "error": str(e),
+                        }),
+                    ),
+                )
 
     async def stop_container(
         self,
@@ -487,12 +519,11 @@ class DockerService:
         private_key = self.ssh_service.decrypt_payload(keypair.ss58_address, private_key)
         pkey = asyncssh.import_private_key(private_key)
 
-        async with asyncssh.connect(
+        async with self.ssh_pool.connect(
             host=executor_info.address,
             port=executor_info.ssh_port,
             username=executor_info.ssh_username,
-            client_keys=[pkey],
-            known_hosts=None,
+            client_key=pkey,
         ) as ssh_client:
             await ssh_client.run(f"docker stop {payload.container_name}")
 
@@ -531,12 +562,11 @@ class DockerService:
         private_key = self.ssh_service.decrypt_payload(keypair.ss58_address, private_key)
         pkey = asyncssh.import_private_key(private_key)
 
-        async with asyncssh.connect(
+        async with self.ssh_pool.connect(
             host=executor_info.address,
             port=executor_info.ssh_port,
             username=executor_info.ssh_username,
-            client_keys=[pkey],
-            known_hosts=None,
+            client_key=pkey,
         ) as ssh_client:
             await ssh_client.run(f"docker start {payload.container_name}")
             logger.info(
@@ -574,12 +604,11 @@ class DockerService:
         private_key = self.ssh_service.decrypt_payload(keypair.ss58_address, private_key)
         pkey = asyncssh.import_private_key(private_key)
 
-        async with asyncssh.connect(
+        async with self.ssh_pool.connect(
             host=executor_info.address,
             port=executor_info.ssh_port,
             username=executor_info.ssh_username,
-            client_keys=[pkey],
-            known_hosts=None,
+            client_key=pkey,
         ) as ssh_client:
             # await ssh_client.run(f"docker stop {payload.container_name}")
             await ssh_client.run(f"docker rm {payload.container_name} -f")
@@ -609,59 +638,7 @@ class DockerService:
 
     async def get_docker_hub_digests(self, repositories) -> dict[str, str]:
         """Retrieve all tags and their corresponding digests from Docker Hub."""
-        all_digests = {}  # Initialize a dictionary to store all tag-digest pairs
-
-        async with aiohttp.ClientSession() as session:
-            for repo in repositories:
-                try:
-                    # Split repository and tag if specified
-                    if ":" in repo:
-                        repository, specified_tag = repo.split(":", 1)
-                    else:
-                        repository, specified_tag = repo, None
-
-                    # Get authorization token
-                    async with session.get(
-                        f"https://auth.docker.io/token?service=registry.docker.io&scope=repository:{repository}:pull"
-                    ) as token_response:
-                        token_response.raise_for_status()
-                        token = await token_response.json()
-                        token = token.get("token")
-
-                    # Find all tags if no specific tag is specified
-                    if specified_tag is None:
-                        async with session.get(
-                            f"https://index.docker.io/v2/{repository}/tags/list",
-                            headers={"Authorization": f"Bearer {token}"},
-                        ) as tags_response:
-                            tags_response.raise_for_status()
-                            tags_data = await tags_response.json()
-                            all_tags = tags_data.get("tags", [])
-                    else:
-                        all_tags = [specified_tag]
-
-                    # Dictionary to store tag-digest pairs for the current repository
-                    tag_digests = {}
-                    for tag in all_tags:
-                        # Get image digest
-                        async with session.head(
-                            f"https://index.docker.io/v2/{repository}/manifests/{tag}",
-                            headers={
-                                "Authorization": f"Bearer {token}",
-                                "Accept": "application/vnd.docker.distribution.manifest.v2+json",
-                            },
-                        ) as manifest_response:
-                            manifest_response.raise_for_status()
-                            digest = manifest_response.headers.get("Docker-Content-Digest")
-                            tag_digests[f"{repository}:{tag}"] = digest
-
-                    # Update the all_digests dictionary with the current repository's tag-digest pairs
-                    all_digests.update(tag_digests)
-
-                except aiohttp.ClientError as e:
-                    print(f"Error retrieving data for {repo}: {e}")
-
-        return all_digests
+        return await self.digest_cache.get(repositories)
 
     async def setup_ssh_access(
         self,
@@ -682,12 +659,20 @@ class DockerService:
         private_key = self.ssh_service.decrypt_payload(my_key, private_key)
         pkey = asyncssh.import_private_key(private_key)
 
-        await asyncio.sleep(5)
+        # retried until the container is up, so the key is only added when missing
+        authorized_keys = "/root/.ssh/authorized_keys"
+        command = (
+            f"docker exec {container_name} sh -c "
+            f"'grep -qxF \"{public_key}\" {authorized_keys} 2>/dev/null"
+            f" || echo \"{public_key}\" >> {authorized_keys}'"
+        )
 
-        command = f"docker exec {container_name} sh -c 'echo \"{public_key}\" >> /root/.ssh/authorized_keys'"
+        # docker exec fails until the container is up
+        async def add_public_key():
+            result = await ssh_client.run(command)
+            return result.exit_status == 0
 
-        result = await ssh_client.run(command)
-        if result.exit_status != 0:
+        if not await wait_until(add_public_key, CONTAINER_READY_TIMEOUT):
             log_text = "Error creating docker connection"
             log_status = "error"
             logger.error(log_text)
@@ -698,6 +683,7 @@ class DockerService:
         for internal, external in port_maps:
             if internal == 22:
                 port = external
+        await wait_for_ssh(ip_address, port, timeout=CONTAINER_READY_TIMEOUT)
         # Check SSH connection
         try:
             async with asyncssh.connect(
@@ -1,15 +1,15 @@
 import os
+import shutil
 import subprocess
-from typing import Annotated
-from pathlib import Path
 import tempfile
-import shutil
+from pathlib import Path
+from typing import Annotated
+
 import PyInstaller.__main__
 from fastapi import Depends
 
-from services.ssh_service import SSHService
-
 from payload_models.payloads import MinerJobEnryptedFiles
+from services.ssh_service import SSHService
 
 
 class FileEncryptService:
@@ -28,11 +28,16 @@ class FileEncryptService:
         return os.path.basename(file_path)
 
     def make_binary_file(self, tmp_directory: str, file_path: str):
+        """Build a onedir bundle, returning the executable's path relative to tmp_directory.
+
+        Only the executable changes from one build to the next, the bundled libraries
+        stay byte identical and are not uploaded again to executors that cached them.
+        """
         file_name = os.path.basename(file_path)
 
         PyInstaller.__main__.run([
             file_path,
-            '--onefile',
+            '--onedir',
             '--noconsole',
             '--log-level=ERROR',
             '--distpath', tmp_directory,
@@ -41,7 +46,7 @@ class FileEncryptService:
 
         subprocess.run(['rm', '-rf', 'build', f'{file_name}.spec'])
 
-        return file_name
+        return os.path.join(file_name, file_name)
 
     def ecrypt_miner_job_files(self):
         tmp_directory = Path(__file__).parent / "temp"
@@ -1,13 +1,40 @@
 import enum
 import hashlib
-import string
+import json
+import os
 import random
 import secrets
-from dataclasses import dataclass
+import string
+import subprocess
 from base64 import b64encode
-import json
+from dataclasses import dataclass, field
 from typing import Self
-import subprocess
+
+
+def _alphabet_table(alphabet: str) -> tuple[bytes, bytes]:
+    """Translation table from random bytes to alphabet, and the bytes to drop.
+
+    Bytes past the last whole multiple of the alphabet size are dropped, so that
+    every character is equally likely.
+    """
+    size = len(alphabet)
+    table = bytes(ord(alphabet[byte % size]) for byte in range(256))
+    return table, bytes(range(256 - 256 % size, 256))
+
+
+LETTERS_TABLE = _alphabet_table(string.ascii_letters)
+DIGITS_TABLE = _alphabet_table(string.digits)
+
+
+def random_chars(count: int, alphabet_table: tuple[bytes, bytes]) -> str:
+    """count random characters, mapped from random bytes a batch at a time."""
+    table, dropped = alphabet_table
+    chars = b""
+    while len(chars) < count:
+        # a few more bytes than needed, to make up for the dropped ones
+        needed = count - len(chars)
+        chars += os.urandom(needed + needed // 4 + 8).translate(table, dropped)
+    return chars[:count].decode("ascii")
 
 
 class Algorithm(enum.Enum):
@@ -90,10 +117,22 @@ class HashService:
     num_job_params: int
     jobs: list[HashcatJob]
     timeout: int
+    # hashed once, the timeout can still be changed afterwards
+    answer: str = field(init=False)
+    _payload_body: str = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.answer = self._answer()
+        self._payload_body = self._build_payload_body()
 
     @classmethod
-    def random_string(self, num_letters: int, num_digits: int) -> str:
-        return ''.join(random.choices(string.ascii_letters, k=num_letters)) + ''.join(random.choices(string.digits, k=num_digits))
+    def random_strings(cls, count: int, num_letters: int, num_digits: int) -> list[str]:
+        letters = random_chars(count * num_letters, LETTERS_TABLE)
+        digits = random_chars(count * num_digits, DIGITS_TABLE)
+        return [
+            letters[i * num_letters:(i + 1) * num_letters] + digits[i * num_digits:(i + 1) * num_digits]
+            for i in range(count)
+        ]
 
     @classmethod
     def generate(
@@ -119,17 +158,19 @@ class HashService:
 
             passwords = [
                 sorted(
-                    {
-                        cls.random_string(
-                            num_letters=_params.num_letters, num_digits=_params.num_digits
+                    set(
+                        cls.random_strings(
+                            _params.num_hashes, num_letters=_params.num_letters, num_digits=_params.num_digits
                         )
-                        for _ in range(_params.num_hashes)
-                    }
+                    )
                 )
                 for _params in job_params
             ]
 
-            salts = [secrets.token_bytes(salt_length_bytes) for _ in range(num_job_params)]
+            salt_bytes = secrets.token_bytes(salt_length_bytes * num_job_params)
+            salts = [
+                salt_bytes[i * salt_length_bytes:(i + 1) * salt_length_bytes] for i in range(num_job_params)
+            ]
 
             jobs.append(HashcatJob(
                 job_params=job_params,
@@ -170,10 +211,7 @@ class HashService:
         ]
         return payloads
 
-    @property
-    def payload(self) -> str | bytes:
-        """Convert this instance to a hashcat argument format."""
-
+    def _build_payload_body(self) -> str:
         data = {
             "gpu_count": self.gpu_count,
             "num_job_params": self.num_job_params,
@@ -185,12 +223,16 @@ class HashService:
                 }
                 for job in self.jobs
             ],
-            "timeout": self.timeout,
         }
         return json.dumps(data)
 
     @property
-    def answer(self) -> str:
+    def payload(self) -> str | bytes:
+        """Convert this instance to a hashcat argument format."""
+        # the timeout goes last, as json.dumps of the whole dict would put it
+        return f'{self._payload_body[:-1]}, "timeout": {json.dumps(self.timeout)}}}'
+
+    def _answer(self) -> str:
         return self._hash(
             "".join(["".join(["".join(passwords) for passwords in job.passwords]) for job in self.jobs]).encode("utf-8")
         ).decode("utf-8")
@@ -199,6 +241,11 @@ class HashService:
         return f"JobService {self.jobs}"
 
 
+def generate_challenges(count: int, gpu_count: int, num_digits: int) -> list[HashService]:
+    """Run in the worker processes of services.challenge_pool, which only import this module."""
+    return [HashService.generate(gpu_count=gpu_count, num_digits=num_digits) for _ in range(count)]
+
+
 if __name__ == "__main__":
     import time
 
@@ -0,0 +1,189 @@
+"""Hashcat timing tables calibrated from the job times executors actually take.
+
+Every correct hashcat result records its job time per GPU model, GPU count and
+digits. `cli.py calibrate-hashcat` turns the recorded times into a timing table
+in the format of HASHCAT_CONFIGS, which the validator loads over the built-in
+one from HASHCAT_CONFIGS_PATH.
+
+The job times come from the executors being scored, so a table must be reviewed
+before it is loaded: a run moves a known timing by at most MAX_CALIBRATION_FACTOR,
+but the timings of models missing from the table are taken as measured.
+"""
+import copy
+import json
+import logging
+from collections import Counter
+
+import numpy as np
+
+from core.utils import _m, get_extra_info
+from services.const import HASHCAT_CONFIGS
+from services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+HASHCAT_TIMINGS_PREFIX = "hashcat_timings"
+# job times kept per gpu model, gpu count and digits, newest first
+HASHCAT_TIMINGS_MAX_SAMPLES = 1000
+HASHCAT_TIMINGS_RETENTION = 60 * 60 * 24 * 30
+# with fewer job times, a gpu count keeps the timing it has
+MIN_CALIBRATION_SAMPLES = 20
+# job times further from the median than this many scaled MADs are dropped
+OUTLIER_MADS = 5
+# MAD to standard deviation of normally distributed job times
+MAD_SCALE = 1.4826
+CALIBRATION_PERCENTILES = (10, 50, 90)
+# a calibration run moves a known average time by at most this factor either way
+MAX_CALIBRATION_FACTOR = 1.5
+
+TimingKey = tuple[str, int, int]
+
+
+def robust_percentiles(samples: list[float]) -> dict[str, float]:
+    """Percentiles of samples, without the outliers, and how many samples were kept."""
+    values = np.asarray(samples, dtype=np.float64)
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * MAD_SCALE
+    if mad > 0:
+        values = values[np.abs(values - median) <= OUTLIER_MADS * mad]
+
+    percentiles = np.percentile(values, CALIBRATION_PERCENTILES)
+    return {
+        **{f"p{q}": float(value) for q, value in zip(CALIBRATION_PERCENTILES, percentiles)},
+        "samples": int(values.size),
+    }
+
+
+def calibrate(
+    samples: dict[TimingKey, list[float]],
+    base_configs: dict = HASHCAT_CONFIGS,
+    min_samples: int = MIN_CALIBRATION_SAMPLES,
+    max_factor: float = MAX_CALIBRATION_FACTOR,
+) -> dict:
+    """Timing table of base_configs, with every gpu count that has enough samples calibrated.
+
+    The median job time becomes the average time of a gpu count, within max_factor
+    of its time in base_configs. Models missing
+    from base_configs get a table up to their largest calibrated gpu count, with
+    the gaps taken from the nearest calibrated count below, or above. The
+    percentiles of each model go under "calibration", where runtime loading
+    ignores them.
+    """
+    configs = copy.deepcopy(base_configs)
+
+    by_model: dict[str, dict[int, list[float]]] = {}
+    digits_seen: dict[str, Counter] = {}
+    for (gpu_model, gpu_count, num_digits), times in samples.items():
+        config = base_configs.get(gpu_model)
+        # timings are only comparable for the digits the model is challenged with
+        if config and config.get("digits", 11) != num_digits:
+            continue
+        by_model.setdefault(gpu_model, {}).setdefault(gpu_count, []).extend(times)
+        digits_seen.setdefault(gpu_model, Counter())[num_digits] += len(times)
+
+    for gpu_model, counts in by_model.items():
+        calibrated = {
+            gpu_count: robust_percentiles(times)
+            for gpu_count, times in counts.items()
+            if len(times) >= min_samples
+        }
+        if not calibrated:
+            continue
+
+        config = configs.get(gpu_model)
+        if not config:
+            max_count = max(calibrated)
+            config = configs[gpu_model] = {
+                "digits": digits_seen[gpu_model].most_common(1)[0][0],
+                "average_time": [
+                    calibrated[min(calibrated, key=lambda count: (abs(count - gpu_count), count))]["p50"]
+                    for gpu_count in range(1, max_count + 1)
+                ],
+            }
+
+        average_time = config.setdefault("average_time", [])
+        calibration = {f"p{q}": [None] * len(average_time) for q in CALIBRATION_PERCENTILES}
+        calibration["samples"] = [0] * len(average_time)
+        for gpu_count, stats in calibrated.items():
+            if gpu_count > len(average_time):
+                # a gpu count past the table is scored with the table's last time
+                continue
+            known = average_time[gpu_count - 1]
+            average_time[gpu_count - 1] = (
+                min(max(stats["p50"], known / max_factor), known * max_factor)
+                if known
+                else stats["p50"]
+            )
+            for name, value in stats.items():
+                calibration[name][gpu_count - 1] = value
+        config["calibration"] = calibration
+
+    return configs
+
+
+def load_hashcat_configs(path: str | None) -> dict:
+    """HASHCAT_CONFIGS, with the models of the timing table at path replacing their built-in ones."""
+    configs = copy.deepcopy(HASHCAT_CONFIGS)
+    if not path:
+        return configs
+
+    with open(path) as file:
+        table = json.load(file)
+
+    for gpu_model, config in table.items():
+        average_time = config.get("average_time")
+        if not average_time or not all(
+            isinstance(value, (int, float)) and value > 0 for value in average_time
+        ):
+            raise ValueError(f"Invalid average_time for {gpu_model} in {path}")
+        configs[gpu_model] = {"digits": int(config.get("digits", 11)), "average_time": average_time}
+
+    logger.info(
+        _m("Loaded hashcat timing table", extra=get_extra_info({"path": path, "models": len(table)}))
+    )
+    return configs
+
+
+class HashcatTimings:
+    """Job times of correct hashcat results, one capped Redis list per gpu model, count and digits.
+
+    Job times are kept in memory as they are recorded and written by flush, once per job batch.
+    """
+
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
+        self._pending: dict[str, list[float]] = {}
+
+    @staticmethod
+    def _key(gpu_model: str, gpu_count: int, num_digits: int) -> str:
+        return f"{HASHCAT_TIMINGS_PREFIX}:{gpu_model}:{gpu_count}:{num_digits}"
+
+    def record(self, gpu_model: str, gpu_count: int, num_digits: int, job_taken_time: float):
+        times = self._pending.setdefault(self._key(gpu_model, gpu_count, num_digits), [])
+        times.append(job_taken_time)
+        # only the newest are kept in redis anyway
+        del times[:-HASHCAT_TIMINGS_MAX_SAMPLES]
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        async with self.redis_service.lock:
+            async with self.redis_service.redis.pipeline(transaction=True) as pipe:
+                for key, times in pending.items():
+                    pipe.lpush(key, *times)
+                    pipe.ltrim(key, 0, HASHCAT_TIMINGS_MAX_SAMPLES - 1)
+                    pipe.expire(key, HASHCAT_TIMINGS_RETENTION)
+                await pipe.execute()
+
+    async def load(self) -> dict[TimingKey, list[float]]:
+        samples = {}
+        async with self.redis_service.lock:
+            async for key in self.redis_service.redis.scan_iter(match=f"{HASHCAT_TIMINGS_PREFIX}:*"):
+                # gpu model names may contain colons, the count and digits never do
+                gpu_model, gpu_count, num_digits = (
+                    key.decode().removeprefix(f"{HASHCAT_TIMINGS_PREFIX}:").rsplit(":", 2)
+                )
+                values = await self.redis_service.redis.lrange(key, 0, -1)
+                samples[(gpu_model, int(gpu_count), int(num_digits))] = [float(value) for value in values]
+        return samples
@@ -1,11 +1,13 @@
 import asyncio
 
 from services.docker_service import DockerService
+from services.file_encrypt_service import FileEncryptService
+from services.job_dispatch_service import JobDispatchService
 from services.miner_service import MinerService
+from services.redis_service import RedisService
+from services.ssh_pool import SSHConnectionPool
 from services.ssh_service import SSHService
 from services.task_service import TaskService
-from services.redis_service import RedisService
-from services.file_encrypt_service import FileEncryptService
 
 ioc = {}
 
@@ -13,13 +15,16 @@ ioc = {}
 async def initiate_services():
     ioc["SSHService"] = SSHService()
     ioc["RedisService"] = RedisService()
+    ioc["SSHConnectionPool"] = SSHConnectionPool()
     ioc["TaskService"] = TaskService(
         ssh_service=ioc["SSHService"],
-        redis_service=ioc["RedisService"]
+        redis_service=ioc["RedisService"],
+        ssh_pool=ioc["SSHConnectionPool"],
     )
     ioc["DockerService"] = DockerService(
         ssh_service=ioc["SSHService"],
-        redis_service=ioc["RedisService"]
+        redis_service=ioc["RedisService"],
+        ssh_pool=ioc["SSHConnectionPool"],
     )
     ioc["MinerService"] = MinerService(
         ssh_service=ioc["SSHService"],
@@ -29,6 +34,10 @@ async def initiate_services():
     ioc["FileEncryptService"] = FileEncryptService(
         ssh_service=ioc["SSHService"],
     )
+    ioc["JobDispatchService"] = JobDispatchService(
+        miner_service=ioc["MinerService"],
+        redis_service=ioc["RedisService"]
+    )
 
 
 def sync_initiate():
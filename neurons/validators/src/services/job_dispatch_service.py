@@ -0,0 +1,265 @@
+import asyncio
+import io
+import json
+import logging
+import shutil
+import tarfile
+import tempfile
+import time
+import uuid
+from collections.abc import AsyncIterator
+from typing import Annotated
+
+from fastapi import Depends
+
+from core.utils import _m, get_extra_info
+from payload_models.payloads import MinerJobEnryptedFiles, MinerJobRequestPayload
+from services.miner_service import MINER_JOB_TIMEOUT, MinerService
+from services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+JOB_SHARD_QUEUE = "job_shards"
+JOB_FILES_PREFIX = "job_files"
+JOB_RESULTS_PREFIX = "job_results"
+JOB_SHARD_SIZE = 8
+# time a shard may wait in the queue for a free worker on top of the miner job timeout,
+# on the coordinator's clock; shards still queued after it are taken back
+JOB_QUEUE_TIMEOUT = 60 * 5
+JOB_DISPATCH_TTL = 60 * 60
+JOB_POLL_INTERVAL = 1
+# job batches whose files a worker keeps unpacked
+JOB_FILES_CACHE_SIZE = 2
+
+
+class JobDispatchService:
+    """Shard the miner jobs of a job batch over worker processes through redis.
+
+    The coordinator pushes shards of miner payloads on a shared queue along with a
+    tarball of the batch's encrypted job files, then streams the per-miner results
+    back from a per-dispatch list as workers push them. Workers can run on any host
+    that reaches the same redis; only the coordinator's clock is used for deadlines,
+    workers run each job under the relative miner job timeout.
+    """
+
+    def __init__(
+        self,
+        miner_service: Annotated[MinerService, Depends(MinerService)],
+        redis_service: Annotated[RedisService, Depends(RedisService)],
+    ):
+        self.miner_service = miner_service
+        self.redis_service = redis_service
+        self._files: dict[str, MinerJobEnryptedFiles] = {}
+        self._files_lock = asyncio.Lock()
+
+    @staticmethod
+    def _pack_files(encypted_files: MinerJobEnryptedFiles) -> bytes:
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            tar.add(encypted_files.tmp_directory, arcname=".")
+        return buffer.getvalue()
+
+    @staticmethod
+    def _unpack_files(data: bytes, tmp_directory: str):
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+            tar.extractall(tmp_directory, filter="data")
+
+    async def dispatch(
+        self,
+        job_batch_id: str,
+        payloads: list[MinerJobRequestPayload],
+        encypted_files: MinerJobEnryptedFiles,
+        docker_hub_digests: dict[str, str],
+        shard_size: int = JOB_SHARD_SIZE,
+    ) -> AsyncIterator[tuple[str, dict | None]]:
+        """Coordinator side: yield (miner_hotkey, result) as workers finish miners."""
+        # job batch ids are not unique, "Unknown" when the block time could not be read
+        dispatch_id = uuid.uuid4().hex
+        default_extra = {
+            "job_batch_id": job_batch_id,
+            "dispatch_id": dispatch_id,
+            "miners": len(payloads),
+        }
+        deadline = time.monotonic() + MINER_JOB_TIMEOUT + JOB_QUEUE_TIMEOUT
+        results_key = f"{JOB_RESULTS_PREFIX}:{dispatch_id}"
+
+        files = await asyncio.to_thread(self._pack_files, encypted_files)
+        await self.redis_service.set(f"{JOB_FILES_PREFIX}:{dispatch_id}", files, ex=JOB_DISPATCH_TTL)
+
+        shards = [
+            json.dumps({
+                "job_batch_id": job_batch_id,
+                "dispatch_id": dispatch_id,
+                "timeout": MINER_JOB_TIMEOUT,
+                "encypted_files": encypted_files.model_dump(),
+                "docker_hub_digests": docker_hub_digests,
+                "payloads": [payload.model_dump() for payload in payloads[i:i + shard_size]],
+            })
+            for i in range(0, len(payloads), shard_size)
+        ]
+        if shards:
+            await self.redis_service.lpush_many(JOB_SHARD_QUEUE, shards, ex=JOB_DISPATCH_TTL)
+
+        logger.info(
+            _m(
+                '[dispatch] Dispatched job shards',
+                extra=get_extra_info({
+                    **default_extra,
+                    "shards": len(shards),
+                    "archive_size": len(files),
+                }),
+            ),
+        )
+
+        pending = {payload.miner_hotkey for payload in payloads}
+        try:
+            while pending and time.monotonic() < deadline:
+                message = await self.redis_service.brpop(results_key, timeout=JOB_POLL_INTERVAL)
+                if message is None:
+                    continue
+
+                finished = json.loads(message)
+                miner_hotkey = finished["miner_hotkey"]
+                if miner_hotkey not in pending:
+                    continue
+                pending.discard(miner_hotkey)
+
+                # a miner that timed out or failed on its worker has no result to score
+                if finished["error"] is not None:
+                    logger.error(
+                        _m(
+                            '[dispatch] Job failed on worker',
+                            extra=get_extra_info({
+                                **default_extra,
+                                "miner_hotkey": miner_hotkey,
+                                "error": finished["error"],
+                            }),
+                        ),
+                    )
+                elif not finished["timed_out"]:
+                    yield miner_hotkey, finished["result"]
+        finally:
+            # no worker picks up the shards of a dispatch nobody waits for anymore
+            for shard in shards:
+                await self.redis_service.lrem(JOB_SHARD_QUEUE, shard, count=1)
+
+        if pending:
+            logger.error(
+                _m(
+                    '[dispatch] Job shards not finished before deadline',
+                    extra=get_extra_info({**default_extra, "pending": len(pending)}),
+                ),
+            )
+
+    async def get_files(self, dispatch_id: str, encypted_files: dict) -> MinerJobEnryptedFiles | None:
+        """Worker side: unpack a dispatch's encrypted files once per worker."""
+        async with self._files_lock:
+            if dispatch_id in self._files:
+                return self._files[dispatch_id]
+
+            data = await self.redis_service.get(f"{JOB_FILES_PREFIX}:{dispatch_id}")
+            if data is None:
+                return None
+
+            tmp_directory = tempfile.mkdtemp(prefix="job_files_")
+            await asyncio.to_thread(self._unpack_files, data, tmp_directory)
+            encypted_files = MinerJobEnryptedFiles(
+                **{**encypted_files, "tmp_directory": tmp_directory}
+            )
+
+            while len(self._files) >= JOB_FILES_CACHE_SIZE:
+                stale = self._files.pop(next(iter(self._files)))
+                shutil.rmtree(stale.tmp_directory, ignore_errors=True)
+            self._files[dispatch_id] = encypted_files
+            return encypted_files
+
+    async def run_shard(self, shard: dict):
+        dispatch_id = shard["dispatch_id"]
+        results_key = f"{JOB_RESULTS_PREFIX}:{dispatch_id}"
+        default_extra = {
+            "job_batch_id": shard["job_batch_id"],
+            "dispatch_id": dispatch_id,
+            "miners": len(shard["payloads"]),
+        }
+
+        encypted_files = await self.get_files(dispatch_id, shard["encypted_files"])
+        if encypted_files is None:
+            logger.warning(
+                _m('[run_shard] Dropping expired job shard', extra=get_extra_info(default_extra)),
+            )
+            return
+
+        logger.info(_m('[run_shard] Running job shard', extra=get_extra_info(default_extra)))
+
+        async def run(payload: MinerJobRequestPayload):
+            finished = {
+                "miner_hotkey": payload.miner_hotkey,
+                "timed_out": False,
+                "error": None,
+                "result": None,
+            }
+            try:
+                job = await self.miner_service.request_job_with_deadline(
+                    payload=payload,
+                    encypted_files=encypted_files,
+                    docker_hub_digests=shard["docker_hub_digests"],
+                    timeout=shard["timeout"],
+                    raise_errors=True,
+                )
+            except Exception as e:
+                finished["error"] = str(e)
+            else:
+                if job is None:
+                    finished["timed_out"] = True
+                else:
+                    finished["result"] = job[1]
+            await self.redis_service.lpush_many(
+                results_key, [json.dumps(finished)], ex=JOB_DISPATCH_TTL
+            )
+
+        await asyncio.gather(
+            *[run(MinerJobRequestPayload(**payload)) for payload in shard["payloads"]],
+            return_exceptions=True,
+        )
+        await self.miner_service.task_service.flush_hashcat_timings()
+
+    async def run_worker(self, concurrency: int):
+        """Worker side: run shards from the queue, up to concurrency at a time."""
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(shard: dict):
+            try:
+                await self.run_shard(shard)
+            except Exception as e:
+                logger.error(
+                    _m(
+                        '[run_worker] Job shard failed',
+                        extra=get_extra_info({
+                            "job_batch_id": shard.get("job_batch_id"),
+                            "error": str(e),
+                        }),
+                    ),
+                    exc_info=True,
+                )
+            finally:
+                slots.release()
+
+        tasks = set()
+        while True:
+            await slots.acquire()
+            try:
+                message = await self.redis_service.brpop(JOB_SHARD_QUEUE, timeout=JOB_POLL_INTERVAL)
+            except Exception as e:
+                logger.error(
+                    _m('[run_worker] Reading job shard queue failed', extra=get_extra_info({"error": str(e)})),
+                )
+                slots.release()
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            if message is None:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(run(json.loads(message)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
@@ -1,10 +1,8 @@
 import asyncio
-import json
 import logging
 from typing import Annotated
 
 import bittensor
-from clients.miner_client import MinerClient
 from datura.requests.miner_requests import (
     AcceptSSHKeyRequest,
     DeclineJobRequest,
@@ -13,6 +11,11 @@ from datura.requests.miner_requests import (
 )
 from datura.requests.validator_requests import SSHPubKeyRemoveRequest, SSHPubKeySubmitRequest
 from fastapi import Depends
+
+from clients.miner_client import MinerClient
+from core.config import settings
+from core.metrics import MINERS_IN_FLIGHT
+from core.utils import _m, get_extra_info
 from payload_models.payloads import (
     ContainerBaseRequest,
     ContainerCreated,
@@ -29,11 +32,8 @@ from payload_models.payloads import (
     MinerJobRequestPayload,
 )
 from protocol.vc_protocol.compute_requests import RentedMachine
-
-from core.config import settings
-from core.utils import _m, get_extra_info
 from services.docker_service import DockerService
-from services.redis_service import EXECUTOR_COUNT_PREFIX, MACHINE_SPEC_CHANNEL_NAME, RedisService
+from services.redis_service import MACHINE_SPEC_CHANNEL_NAME, RedisService
 from services.ssh_service import SSHService
 from services.task_service import TaskService
 
@@ -41,6 +41,7 @@ logger = logging.getLogger(__name__)
 
 
 JOB_LENGTH = 300
+MINER_JOB_TIMEOUT = 60 * 10
 
 
 class MinerService:
@@ -54,6 +55,50 @@ class MinerService:
         self.task_service = task_service
         self.redis_service = redis_service
 
+    async def request_job_with_deadline(
+        self,
+        payload: MinerJobRequestPayload,
+        encypted_files: MinerJobEnryptedFiles,
+        docker_hub_digests: dict[str, str],
+        timeout: float = MINER_JOB_TIMEOUT,
+        raise_errors: bool = False,
+    ) -> tuple[str, dict | None] | None:
+        """Request a job to one miner, giving up once its own deadline passes.
+
+        Returns None when the job timed out, or failed and raise_errors is not set.
+        """
+        default_extra = {
+            "job_batch_id": payload.job_batch_id,
+            "miner_hotkey": payload.miner_hotkey,
+        }
+
+        task = asyncio.create_task(
+            self.request_job_to_miner(
+                payload=payload,
+                encypted_files=encypted_files,
+                docker_hub_digests=docker_hub_digests,
+            )
+        )
+        # request_job_to_miner swallows cancellation, so the deadline is enforced out here
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if not done:
+            task.cancel()
+            logger.error(_m('[sync] Job_Timeout', extra=get_extra_info(default_extra)))
+            return None
+
+        try:
+            return payload.miner_hotkey, task.result()
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(
+                _m(
+                    '[sync] Error processing job result',
+                    extra=get_extra_info({**default_extra, "error": str(e)}),
+                ),
+            )
+            return None
+
     async def request_job_to_miner(
         self,
         payload: MinerJobRequestPayload,
@@ -69,6 +114,7 @@ class MinerService:
             "miner_port": payload.miner_port,
         }
 
+        MINERS_IN_FLIGHT.inc()
         try:
             logger.info(_m("Requesting job to miner", extra=get_extra_info(default_extra)))
             miner_client = MinerClient(
@@ -151,9 +197,6 @@ class MinerService:
                     await miner_client.send_model(SSHPubKeyRemoveRequest(public_key=public_key))
 
                     await self.publish_machine_specs(results, miner_client.miner_hotkey)
-                    await self.store_executor_counts(
-                        payload.miner_hotkey, payload.job_batch_id, len(msg.executors), results
-                    )
 
                     total_score = 0
                     for _, _, score, _, _, _, _ in results:
@@ -169,6 +212,8 @@ class MinerService:
                     return {
                         "miner_hotkey": payload.miner_hotkey,
                         "score": total_score,
+                        # stored for the whole job batch by the validator
+                        "executor_counts": self.get_executor_counts(len(msg.executors), results),
                     }
                 elif isinstance(msg, FailedRequest):
                     logger.warning(
@@ -208,6 +253,8 @@ class MinerService:
                 exc_info=True,
             )
             return None
+        finally:
+            MINERS_IN_FLIGHT.dec()
 
     async def publish_machine_specs(
         self, results: list[tuple[dict, ExecutorSSHInfo]], miner_hotkey: str
@@ -257,14 +304,7 @@ class MinerService:
                     exc_info=True,
                 )
 
-    async def store_executor_counts(
-        self, miner_hotkey: str, job_batch_id: str, total: int, results: list[dict]
-    ):
-        default_extra = {
-            "job_batch_id": job_batch_id,
-            "miner_hotkey": miner_hotkey,
-        }
-
+    def get_executor_counts(self, total: int, results: list) -> dict:
         success = 0
         failed = 0
 
@@ -274,27 +314,7 @@ class MinerService:
             else:
                 failed += 1
 
-        data = {"total": total, "success": success, "failed": failed}
-
-        key = f"{EXECUTOR_COUNT_PREFIX}:{miner_hotkey}"
-
-        try:
-            await self.redis_service.hset(key, job_batch_id, json.dumps(data))
-
-            logger.info(
-                _m(
-                    "Stored executor counts",
-                    extra=get_extra_info({**default_extra, **data}),
-                ),
-            )
-        except Exception as e:
-            logger.error(
-                _m(
-                    "Failed storing executor counts",
-                    extra=get_extra_info({**default_extra, **data, "error": str(e)}),
-                ),
-                exc_info=True,
-            )
+        return {"total": total, "success": success, "failed": failed}
 
     async def handle_container(self, payload: ContainerBaseRequest):
         loop = asyncio.get_event_loop()
@@ -310,6 +330,7 @@ class MinerService:
         docker_service = DockerService(
             ssh_service=self.ssh_service,
             redis_service=self.redis_service,
+            ssh_pool=self.task_service.ssh_pool,
         )
 
         try:
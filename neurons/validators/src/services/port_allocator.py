@@ -0,0 +1,183 @@
+import json
+import random
+import time
+
+from datura.requests.miner_requests import ExecutorSSHInfo
+
+from services.redis_service import AVAILABLE_PORT_MAPS_PREFIX, RedisService
+
+DEFAULT_PORT_RANGE = (40000, 65535)
+# random ports offered to the allocate script, the first free one is taken
+PORT_CANDIDATES = 16
+# verified port maps kept per executor, newest first
+KNOWN_GOOD_PORT_MAPS = 10
+# a probe or a starting container holds its ports for this long
+PORT_LEASE_SECONDS = 300
+# a port that failed is not tried again for this long
+FAILED_PORT_SECONDS = 60 * 60
+PORT_STATE_RETENTION = 60 * 60 * 24
+
+PortMap = tuple[int, int]
+
+# port maps are "internal,external" members of three sorted sets per executor:
+# known good ones scored by when they were verified, failed ones by when they
+# failed and leased ones by when their lease ends
+ALLOCATE_PORT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[3]))
+for i = 5, #ARGV do
+    local port_map = ARGV[i]
+    if not redis.call('ZSCORE', KEYS[2], port_map) and not redis.call('ZSCORE', KEYS[3], port_map) then
+        redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), port_map)
+        redis.call('EXPIRE', KEYS[3], ARGV[4])
+        return port_map
+    end
+end
+return false
+"""
+
+LEASE_KNOWN_GOOD_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+local leased = {}
+for _, port_map in ipairs(redis.call('ZREVRANGE', KEYS[1], 0, -1)) do
+    if #leased >= tonumber(ARGV[3]) then break end
+    if not redis.call('ZSCORE', KEYS[3], port_map) then
+        redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), port_map)
+        leased[#leased + 1] = port_map
+    end
+end
+if #leased > 0 then redis.call('EXPIRE', KEYS[3], ARGV[4]) end
+return leased
+"""
+
+RELEASE_PORT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local port_map = ARGV[2]
+redis.call('ZREM', KEYS[3], port_map)
+if ARGV[3] == '' then
+    return
+elseif ARGV[3] == '1' then
+    redis.call('ZADD', KEYS[1], now, port_map)
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[4]) - 1)
+    redis.call('ZREM', KEYS[2], port_map)
+else
+    redis.call('ZADD', KEYS[2], now, port_map)
+    redis.call('ZREM', KEYS[1], port_map)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+"""
+
+
+def _format(port_map: PortMap) -> str:
+    return f"{port_map[0]},{port_map[1]}"
+
+
+def _parse(port_map: bytes | str) -> PortMap:
+    if isinstance(port_map, bytes):
+        port_map = port_map.decode()
+    internal_port, external_port = map(int, port_map.split(","))
+    return internal_port, external_port
+
+
+def candidate_port_maps(executor_info: ExecutorSSHInfo, count: int = PORT_CANDIDATES) -> list[PortMap]:
+    """Random port maps the executor allows, without listing its whole port range."""
+    if executor_info.port_mappings:
+        port_mappings = [
+            (internal_port, external_port)
+            for internal_port, external_port in json.loads(executor_info.port_mappings)
+            if internal_port != executor_info.ssh_port and external_port != executor_info.ssh_port
+        ]
+        return random.sample(port_mappings, min(count, len(port_mappings)))
+
+    if executor_info.port_range and "-" not in executor_info.port_range:
+        ports = {int(part.strip()) for part in executor_info.port_range.split(",")} - {executor_info.ssh_port}
+        return [(port, port) for port in random.sample(sorted(ports), min(count, len(ports)))]
+
+    if executor_info.port_range:
+        min_port, max_port = map(int, (part.strip() for part in executor_info.port_range.split("-")))
+    else:
+        min_port, max_port = DEFAULT_PORT_RANGE
+
+    size = max_port - min_port + 1 - (min_port <= executor_info.ssh_port <= max_port)
+    if size <= 0:
+        return []
+
+    ports: dict[int, None] = {}
+    while len(ports) < min(count, size):
+        port = random.randint(min_port, max_port)
+        if port != executor_info.ssh_port:
+            ports[port] = None
+    return [(port, port) for port in ports]
+
+
+class PortAllocator:
+    """Hand out executor ports, remembering which ones worked, failed or are in use.
+
+    Each executor has a known good, a failed and a leased sorted set in Redis, and
+    every allocation or report is one script call that purges expired entries and
+    updates the sets atomically, so concurrent probes never get the same port.
+    """
+
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
+        self.allocate_script = redis_service.redis.register_script(ALLOCATE_PORT_SCRIPT)
+        self.lease_known_good_script = redis_service.redis.register_script(LEASE_KNOWN_GOOD_SCRIPT)
+        self.release_script = redis_service.redis.register_script(RELEASE_PORT_SCRIPT)
+
+    @staticmethod
+    def _keys(miner_hotkey: str, executor_uuid: str) -> list[str]:
+        prefix = f"{AVAILABLE_PORT_MAPS_PREFIX}:{miner_hotkey}:{executor_uuid}"
+        return [f"{prefix}:good", f"{prefix}:failed", f"{prefix}:leased"]
+
+    async def allocate(self, miner_hotkey: str, executor_info: ExecutorSSHInfo) -> PortMap | None:
+        """Lease a port map that is neither failed nor in use, None if there is none."""
+        candidates = candidate_port_maps(executor_info)
+        if not candidates:
+            return None
+
+        async with self.redis_service.lock:
+            port_map = await self.allocate_script(
+                keys=self._keys(miner_hotkey, executor_info.uuid),
+                args=[
+                    time.time(),
+                    PORT_LEASE_SECONDS,
+                    FAILED_PORT_SECONDS,
+                    PORT_STATE_RETENTION,
+                    *[_format(candidate) for candidate in candidates],
+                ],
+            )
+        return _parse(port_map) if port_map else None
+
+    async def lease_known_good(self, miner_hotkey: str, executor_uuid: str, count: int) -> list[PortMap]:
+        """Lease up to count of the most recently verified port maps that are not in use."""
+        async with self.redis_service.lock:
+            port_maps = await self.lease_known_good_script(
+                keys=self._keys(miner_hotkey, executor_uuid),
+                args=[time.time(), PORT_LEASE_SECONDS, count, PORT_STATE_RETENTION],
+            )
+        return [_parse(port_map) for port_map in port_maps]
+
+    async def release(
+        self, miner_hotkey: str, executor_uuid: str, port_map: PortMap, ok: bool | None = None
+    ):
+        """End the lease of port_map, recording whether it worked unless ok is None."""
+        async with self.redis_service.lock:
+            await self.release_script(
+                keys=self._keys(miner_hotkey, executor_uuid),
+                args=[
+                    time.time(),
+                    _format(port_map),
+                    "" if ok is None else int(ok),
+                    KNOWN_GOOD_PORT_MAPS,
+                    PORT_STATE_RETENTION,
+                ],
+            )
+
+    async def reset(self, miner_hotkey: str, executor_uuid: str):
+        """Forget the known good and leased ports of an executor, failed ones stay out."""
+        good, _, leased = self._keys(miner_hotkey, executor_uuid)
+        async with self.redis_service.lock:
+            await self.redis_service.redis.delete(good, leased)
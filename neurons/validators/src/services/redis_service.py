@@ -1,20 +1,116 @@
-import json
 import asyncio
+import json
+import time
+
 import redis.asyncio as aioredis
-from protocol.vc_protocol.compute_requests import RentedMachine
+
 from core.config import settings
+from core.metrics import REDIS_ROUND_TRIP_SECONDS
+from protocol.vc_protocol.compute_requests import RentedMachine
 
 MACHINE_SPEC_CHANNEL_NAME = "channel:1"
 STREAMING_LOG_CHANNEL = "channel:2"
 RENTED_MACHINE_SET = "rented_machines"
-EXECUTOR_COUNT_PREFIX = "executor_counts"
 AVAILABLE_PORT_MAPS_PREFIX = "available_port_maps"
+# the scoring scripts use the epoch key together with the keys of the epoch, the
+# hash tag keeps them all in one Redis Cluster slot
+MINER_SCORES_PREFIX = "{miner_scores}"
+MINER_SCORES_EPOCH_KEY = f"{MINER_SCORES_PREFIX}:epoch"
+EXECUTOR_COUNT_PREFIX = f"executor_counts:{MINER_SCORES_PREFIX}"
+# scores of finished epochs are kept around for inspection before they expire
+MINER_SCORES_RETENTION = 60 * 60 * 24 * 7
+EXECUTOR_COUNTS_RETENTION = 60 * 60 * 24
+# keys of earlier releases, moved over once by migrate_legacy_keys: a JSON dict of
+# scores and count hashes per miner, then score hashes and count hashes per epoch
+# without the hash tag
+LEGACY_MINER_SCORES_KEY = "miner_scores"
+LEGACY_MINER_SCORES_EPOCH_KEY = "miner_scores:epoch"
+LEGACY_EXECUTOR_COUNT_PREFIX = "executor_counts"
+
+# Every scoring script is given the keys of the epoch the caller last saw, with
+# KEYS[1] the epoch key and ARGV[1] that epoch. If a rollover got there first,
+# the script changes nothing and returns nil, and the caller runs it again with
+# the keys of the new epoch, so that one job result is never split across two.
+CHECK_EPOCH = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then return nil end
+"""
+
+
+# KEYS[2] and KEYS[3] are the score hashes of the previous and the new epoch.
+# Scores carried over, of results that came in after the weights were computed,
+# move from the one to the other
+ROLLOVER_MINER_SCORES_SCRIPT = CHECK_EPOCH + """
+if ARGV[1] ~= ARGV[2] then
+    redis.call('SET', KEYS[1], ARGV[2])
+    for i = 4, #ARGV, 2 do
+        redis.call('HINCRBYFLOAT', KEYS[2], ARGV[i], -tonumber(ARGV[i + 1]))
+        redis.call('HINCRBYFLOAT', KEYS[3], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+return ARGV[1]
+"""
+
+# A chunk of job results in one round trip: ARGV[3] score increments of KEYS[2]
+# as hotkey, score pairs, then one miner hotkey, job batch id and counts triple
+# per count hash in KEYS[3..]. Executor counts live under the current scoring
+# epoch and simply expire once it is over; the min/max totals of every miner
+# are rolled up on the way
+RECORD_JOB_RESULTS_SCRIPT = CHECK_EPOCH + """
+local scores = tonumber(ARGV[3])
+for i = 4, 3 + 2 * scores, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+local rollups = {}
+for i = 3, #KEYS do
+    local at = 4 + 2 * scores + 3 * (i - 3)
+    local miner_hotkey = ARGV[at]
+    redis.call('HSET', KEYS[i], ARGV[at + 1], ARGV[at + 2])
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+    local jobs, min_total, max_total = 0, nil, nil
+    for _, data in ipairs(redis.call('HVALS', KEYS[i])) do
+        local total = cjson.decode(data)['total']
+        jobs = jobs + 1
+        if min_total == nil or total < min_total then min_total = total end
+        if max_total == nil or total > max_total then max_total = total end
+    end
+    rollups[#rollups + 1] = {miner_hotkey, jobs, min_total, max_total}
+end
+return rollups
+"""
+
+GET_MINER_SCORES_SCRIPT = CHECK_EPOCH + """
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+def miner_scores_key(epoch: str) -> str:
+    return f"{MINER_SCORES_PREFIX}:{epoch}"
+
+
+def executor_counts_key(epoch: str, miner_hotkey: str) -> str:
+    return f"{EXECUTOR_COUNT_PREFIX}:{epoch}:{miner_hotkey}"
 
 
 class RedisService:
     def __init__(self):
         self.redis = aioredis.from_url(f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}")
         self.lock = asyncio.Lock()
+        self.record_job_results_script = self.redis.register_script(RECORD_JOB_RESULTS_SCRIPT)
+        self.rollover_miner_scores_script = self.redis.register_script(
+            ROLLOVER_MINER_SCORES_SCRIPT
+        )
+        self.get_miner_scores_script = self.redis.register_script(GET_MINER_SCORES_SCRIPT)
+        # the scoring epoch as last read from or set in redis
+        self._epoch: str | None = None
+
+    async def ping(self) -> float:
+        """Measure the round trip to Redis, bypassing the lock so contention is not counted."""
+        started_at = time.perf_counter()
+        await self.redis.ping()
+        round_trip = time.perf_counter() - started_at
+        REDIS_ROUND_TRIP_SECONDS.set(round_trip)
+        return round_trip
 
     async def publish(self, channel: str, message: dict):
         """Publish a message to a Redis channel."""
@@ -26,10 +122,10 @@ class RedisService:
         await pubsub.subscribe(channel)
         return pubsub
 
-    async def set(self, key: str, value: str):
-        """Set a key-value pair in Redis."""
+    async def set(self, key: str, value: str | bytes, ex: int | None = None):
+        """Set a key-value pair in Redis, optionally expiring after ex seconds."""
         async with self.lock:
-            await self.redis.set(key, value)
+            await self.redis.set(key, value, ex=ex)
 
     async def get(self, key: str):
         """Get a value by key from Redis."""
@@ -71,6 +167,21 @@ class RedisService:
         async with self.lock:
             await self.redis.lpush(key, element)
 
+    async def lpush_many(self, key: str, elements: list[bytes], ex: int | None = None):
+        """Add elements to a list in Redis in one round trip, optionally expiring the list."""
+        async with self.lock:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lpush(key, *elements)
+                if ex:
+                    pipe.expire(key, ex)
+                await pipe.execute()
+
+    async def brpop(self, key: str, timeout: float) -> bytes | None:
+        """Wait up to timeout seconds for the last element of a list in Redis."""
+        # a blocking pop must not hold the lock every other command waits on
+        result = await self.redis.brpop([key], timeout=timeout)
+        return result[1] if result else None
+
     async def lrange(self, key: str) -> list[bytes]:
         """Get all elements from a list in Redis in order."""
         async with self.lock:
@@ -122,18 +233,136 @@ class RedisService:
             async for key in self.redis.scan_iter(match=pattern):
                 await self.redis.delete(key.decode())
 
-    async def clear_all_executor_counts(self):
-        pattern = f"{EXECUTOR_COUNT_PREFIX}:*"
-        cursor = 0
-
-        async with self.lock:
-            while True:
-                cursor, keys = await self.redis.scan(cursor, match=pattern, count=100)
-                if keys:
-                    await self.redis.delete(*keys)
-                if cursor == 0:
-                    break
-
     async def clear_all_ssh_ports(self):
         pattern = f"{AVAILABLE_PORT_MAPS_PREFIX}:*"
         await self.clear_by_pattern(pattern)
+
+    async def _run_in_epoch(self, script, epoch_keys, args: list) -> tuple[str, object]:
+        """Run a scoring script in the current epoch, returning the epoch and the script's result.
+
+        epoch_keys maps an epoch to the keys the script uses in it. Called with the lock held.
+        """
+        while True:
+            if self._epoch is None:
+                self._epoch = (await self.redis.get(MINER_SCORES_EPOCH_KEY) or b"0").decode("utf-8")
+            epoch = self._epoch
+            result = await script(keys=[MINER_SCORES_EPOCH_KEY, *epoch_keys(epoch)], args=[epoch, *args])
+            if result is not None:
+                return epoch, result
+            # rolled over by someone else, read the epoch again
+            self._epoch = None
+
+    async def rollover_miner_scores(self, epoch: int | str, carried: dict[str, float] | None = None):
+        """Start a new scoring epoch with the carried scores and let the previous epoch's scores expire."""
+        args = [str(epoch), MINER_SCORES_RETENTION]
+        for miner_hotkey, score in (carried or {}).items():
+            args += [miner_hotkey, score]
+
+        async with self.lock:
+            await self._run_in_epoch(
+                self.rollover_miner_scores_script,
+                lambda previous: [miner_scores_key(previous), miner_scores_key(str(epoch))],
+                args,
+            )
+            self._epoch = str(epoch)
+
+    async def get_miner_scores(self) -> tuple[str, dict[str, float]]:
+        """Return the current epoch and its miner scores."""
+        async with self.lock:
+            epoch, fields = await self._run_in_epoch(
+                self.get_miner_scores_script, lambda epoch: [miner_scores_key(epoch)], []
+            )
+        scores = {
+            fields[i].decode("utf-8"): float(fields[i + 1])
+            for i in range(0, len(fields), 2)
+        }
+        return epoch, scores
+
+    async def record_job_results(
+        self, scores: dict[str, float], executor_counts: list[tuple[str, str, dict]]
+    ) -> dict[str, dict]:
+        """Add job scores to the current epoch and store executor counts, in one round trip.
+
+        executor_counts holds (miner hotkey, job batch id, counts) entries. Returns the
+        rollups of their miners over all the job batches of the current scoring epoch,
+        keyed by miner hotkey: {"jobs": ..., "min_executors": ..., "max_executors": ...}.
+        """
+        if not scores and not executor_counts:
+            return {}
+
+        args = [EXECUTOR_COUNTS_RETENTION, len(scores)]
+        for miner_hotkey, score in scores.items():
+            args += [miner_hotkey, score]
+        for miner_hotkey, job_batch_id, counts in executor_counts:
+            args += [miner_hotkey, job_batch_id, json.dumps(counts)]
+
+        async with self.lock:
+            _, rollups = await self._run_in_epoch(
+                self.record_job_results_script,
+                lambda epoch: [
+                    miner_scores_key(epoch),
+                    *[
+                        executor_counts_key(epoch, miner_hotkey)
+                        for miner_hotkey, _, _ in executor_counts
+                    ],
+                ],
+                args,
+            )
+        return {
+            miner_hotkey.decode("utf-8"): {
+                "jobs": jobs,
+                "min_executors": min_total,
+                "max_executors": max_total,
+            }
+            for miner_hotkey, jobs, min_total, max_total in rollups
+        }
+
+    async def migrate_legacy_keys(self, epoch: int | str):
+        """Move the scores and executor counts of earlier releases to the current keys, once.
+
+        Scores kept as a JSON dict carried no epoch, they are taken to be of epoch.
+        """
+        async with self.lock:
+            if await self.redis.exists(MINER_SCORES_EPOCH_KEY):
+                return
+
+            legacy_epoch = await self.redis.get(LEGACY_MINER_SCORES_EPOCH_KEY)
+            if legacy_epoch is not None:
+                epoch = legacy_epoch.decode("utf-8")
+                legacy_scores = await self.redis.hgetall(f"{LEGACY_MINER_SCORES_KEY}:{epoch}")
+                scores = {
+                    miner_hotkey.decode("utf-8"): float(score)
+                    for miner_hotkey, score in legacy_scores.items()
+                }
+                counts_pattern = f"{LEGACY_EXECUTOR_COUNT_PREFIX}:{epoch}:*"
+            else:
+                epoch = str(epoch)
+                legacy_scores = await self.redis.get(LEGACY_MINER_SCORES_KEY)
+                scores = json.loads(legacy_scores) if legacy_scores else {}
+                counts_pattern = f"{LEGACY_EXECUTOR_COUNT_PREFIX}:*"
+
+            legacy_keys = [
+                LEGACY_MINER_SCORES_KEY,
+                LEGACY_MINER_SCORES_EPOCH_KEY,
+                f"{LEGACY_MINER_SCORES_KEY}:{epoch}",
+            ]
+            counts = {}
+            async for key in self.redis.scan_iter(match=counts_pattern):
+                key = key.decode("utf-8")
+                # keys of the current scheme, or of other epochs of the earlier one
+                if MINER_SCORES_PREFIX in key or key.count(":") != counts_pattern.count(":"):
+                    continue
+                legacy_keys.append(key)
+                counts[key.rsplit(":", 1)[1]] = await self.redis.hgetall(key)
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.set(MINER_SCORES_EPOCH_KEY, epoch)
+                for miner_hotkey, score in scores.items():
+                    pipe.hincrbyfloat(miner_scores_key(epoch), miner_hotkey, score)
+                for miner_hotkey, data in counts.items():
+                    key = executor_counts_key(epoch, miner_hotkey)
+                    pipe.hset(key, mapping=data)
+                    pipe.expire(key, EXECUTOR_COUNTS_RETENTION)
+                pipe.delete(*legacy_keys)
+                await pipe.execute()
+            self._epoch = epoch
@@ -0,0 +1,99 @@
+import asyncio
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import asyncssh
+
+READ_SIZE = 64 * 1024
+# stdout and stderr together, job scripts print one line of a few tens of KB
+REMOTE_OUTPUT_MAX_BYTES = 4 * (2**20)
+
+
+class OutputLimitExceeded(Exception):
+    pass
+
+
+@dataclass
+class CommandOutput:
+    stdout: list[str] = field(default_factory=list)
+    stderr: list[str] = field(default_factory=list)
+    # the stdout line accepted by is_result, the command is stopped right after it
+    result: str | None = None
+
+
+class _LineSplitter:
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self._pending = b""
+
+    def feed(self, data: bytes) -> list[str]:
+        *complete, self._pending = (self._pending + data).split(b"\n")
+        lines = [line.decode("utf-8", errors="replace").rstrip("\r") for line in complete]
+        self.lines.extend(lines)
+        return lines
+
+    def flush(self) -> list[str]:
+        return self.feed(b"\n") if self._pending else []
+
+
+def _stop(process: asyncssh.SSHClientProcess):
+    if process.exit_status is None:
+        try:
+            process.kill()
+        except Exception:
+            pass
+    process.close()
+
+
+async def run_command(
+    ssh_client: asyncssh.SSHClientConnection,
+    command: str,
+    timeout: float,
+    max_bytes: int = REMOTE_OUTPUT_MAX_BYTES,
+    is_result: Callable[[str], bool] | None = None,
+) -> CommandOutput:
+    """Run command, reading its output line by line as it arrives.
+
+    The command is killed once its output goes over max_bytes, raising
+    OutputLimitExceeded, or once it runs out of time, raising TimeoutError. With
+    is_result, the first stdout line it accepts ends the command early instead of
+    waiting for its end of file.
+    """
+    output = CommandOutput()
+    received = 0
+
+    async def read(stream: asyncssh.SSHReader, splitter: _LineSplitter, watch: bool):
+        nonlocal received
+        while True:
+            data = await stream.read(READ_SIZE)
+            received += len(data)
+            if received > max_bytes:
+                raise OutputLimitExceeded(f"Command output exceeded {max_bytes} bytes")
+            lines = splitter.feed(data) if data else splitter.flush()
+            if watch and is_result is not None:
+                for line in lines:
+                    if is_result(line):
+                        output.result = line
+                        return
+            if not data:
+                return
+
+    async with asyncio.timeout(timeout):
+        process = await ssh_client.create_process(command, encoding=None)
+        readers = [
+            asyncio.create_task(read(process.stdout, _LineSplitter(output.stdout), True)),
+            asyncio.create_task(read(process.stderr, _LineSplitter(output.stderr), False)),
+        ]
+        try:
+            pending = set(readers)
+            while pending and output.result is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for reader in done:
+                    reader.result()
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            _stop(process)
+
+    return output
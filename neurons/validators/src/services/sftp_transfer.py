@@ -0,0 +1,246 @@
+import asyncio
+import functools
+import logging
+import mmap
+import os
+import shlex
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import asyncssh
+
+from core.utils import _m
+
+try:
+    import zstandard
+except ImportError:  # compression is optional, plain sftp is used without it
+    zstandard = None
+
+TRANSFER_BLOCK_SIZE = 256 * 1024
+# write requests in flight per transfer, over all of its sftp channels
+TRANSFER_MAX_REQUESTS = 64
+# sftp channels a transfer spreads its writes over, each has its own ssh flow control window
+TRANSFER_CHANNELS = 2
+TRANSFER_COMPRESSION_LEVEL = 3
+# smaller files are not worth a channel of their own
+TRANSFER_COMPRESSION_MIN_SIZE = 64 * 1024
+# compressed files kept in memory, a job batch uploads the same files to every executor
+COMPRESSED_CACHE_MAX_BYTES = 256 * (2**20)
+STREAM_CHUNK_SIZE = 1024 * 1024
+# appended to a remote command, prints the marker when the executor can decompress
+REMOTE_ZSTD_PROBE = "command -v zstd >/dev/null 2>&1 && echo zstd:available"
+REMOTE_ZSTD_MARKER = "zstd:available"
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def _warn_zstandard_missing():
+    logger.warning(
+        _m(
+            "[SFTPTransfer] Compression is on but the zstandard package is not installed, "
+            "uploading uncompressed",
+            extra={},
+        ),
+    )
+
+
+@dataclass
+class TransferStats:
+    files: int = 0
+    bytes: int = 0
+    wire_bytes: int = 0
+    seconds: float = 0
+    compressed_files: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second, as seen by the remote file system."""
+        return self.bytes / self.seconds if self.seconds else 0
+
+
+@dataclass
+class TransferOptions:
+    block_size: int = TRANSFER_BLOCK_SIZE
+    max_requests: int = TRANSFER_MAX_REQUESTS
+    channels: int = TRANSFER_CHANNELS
+    compression: bool = False
+    compression_level: int = TRANSFER_COMPRESSION_LEVEL
+
+
+@dataclass
+class _CompressedCache:
+    max_bytes: int = COMPRESSED_CACHE_MAX_BYTES
+    items: OrderedDict = field(default_factory=OrderedDict)
+    size: int = 0
+
+    def get(self, key) -> bytes | None:
+        data = self.items.get(key)
+        if data is not None:
+            self.items.move_to_end(key)
+        return data
+
+    def put(self, key, data: bytes):
+        if key in self.items or len(data) > self.max_bytes:
+            return
+        self.items[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class SFTPTransfer:
+    """Upload files with many parallel block writes, optionally zstd compressed.
+
+    Files are read through mmap and written block by block at their offsets, with up
+    to ``max_requests`` writes in flight spread over ``channels`` sftp sessions, so
+    that a single ssh flow control window does not cap high latency links. With
+    compression on, and the ``zstandard`` package installed locally and ``zstd`` on
+    the executor, large files are instead streamed compressed into a remote
+    ``zstd -d``; each file is only compressed once per content.
+    """
+
+    def __init__(self, options: TransferOptions | None = None):
+        self.options = options or TransferOptions()
+        self._compressed = _CompressedCache()
+        self._compressing: dict[str, asyncio.Future] = {}
+        if self.options.compression and zstandard is None:
+            _warn_zstandard_missing()
+
+    @property
+    def compression_enabled(self) -> bool:
+        return self.options.compression and zstandard is not None
+
+    def _compress(self, local_path: str) -> bytes:
+        compressor = zstandard.ZstdCompressor(level=self.options.compression_level, threads=-1)
+        with open(local_path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return compressor.compress(mapped)
+
+    async def _get_compressed(self, local_path: str, key: str) -> bytes:
+        data = self._compressed.get(key)
+        if data is not None:
+            return data
+
+        # executors of a job batch start together, compress each file only once
+        task = self._compressing.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self._compress, local_path))
+            self._compressing[key] = task
+            task.add_done_callback(lambda _: self._compressing.pop(key, None))
+        data = await asyncio.shield(task)
+        self._compressed.put(key, data)
+        return data
+
+    async def _put_compressed(
+        self, ssh_client: asyncssh.SSHClientConnection, local_path: str, remote_path: str, key
+    ) -> int:
+        data = await self._get_compressed(local_path, key)
+        process = await ssh_client.create_process(
+            f"zstd -d -q -f -o {shlex.quote(remote_path)}", encoding=None
+        )
+        async with process:
+            view = memoryview(data)
+            for offset in range(0, len(data), STREAM_CHUNK_SIZE):
+                process.stdin.write(view[offset:offset + STREAM_CHUNK_SIZE])
+                await process.stdin.drain()
+            process.stdin.write_eof()
+            result = await process.wait()
+        if result.exit_status != 0:
+            raise Exception(f"Failed to decompress {remote_path}: {result.stderr}")
+        return len(data)
+
+    async def _put_blocks(
+        self,
+        sftp_clients: list[asyncssh.SFTPClient],
+        slots: asyncio.Semaphore,
+        local_path: str,
+        remote_path: str,
+    ) -> int:
+        block_size = self.options.block_size
+        for sftp_client in sftp_clients:
+            if sftp_client.limits.max_write_len:
+                block_size = min(block_size, sftp_client.limits.max_write_len)
+
+        with open(local_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            handles = [await sftp_clients[0].open(remote_path, "wb")]
+            try:
+                if size == 0:
+                    return 0
+                channels = min(len(sftp_clients), -(-size // block_size))
+                for sftp_client in sftp_clients[1:channels]:
+                    handles.append(await sftp_client.open(remote_path, "r+b"))
+
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+
+                    async def write(index: int, offset: int):
+                        async with slots:
+                            await handles[index % len(handles)].write(
+                                mapped[offset:offset + block_size], offset
+                            )
+
+                    await asyncio.gather(*[
+                        write(index, offset)
+                        for index, offset in enumerate(range(0, size, block_size))
+                    ])
+                return size
+            finally:
+                for handle in handles:
+                    await handle.close()
+
+    async def put_files(
+        self,
+        ssh_client: asyncssh.SSHClientConnection,
+        files: list[tuple[str, str, str]],
+        remote_zstd: bool = False,
+    ) -> TransferStats:
+        """Upload (local path, remote path, content key) triples."""
+        stats = TransferStats(files=len(files))
+        started_at = time.perf_counter()
+        if not files:
+            return stats
+
+        compress = self.compression_enabled and remote_zstd
+        compressed = [
+            file for file in files
+            if compress and os.path.getsize(file[0]) >= TRANSFER_COMPRESSION_MIN_SIZE
+        ]
+        plain = [file for file in files if file not in compressed]
+
+        # compressed streams are ssh channels too, plain sftp keeps one when sharing
+        channels = max(1, self.options.channels)
+        sftp_channels = 1 if compressed else channels
+        streams = asyncio.Semaphore(max(1, channels - sftp_channels))
+
+        async def put_compressed(local_path: str, remote_path: str, key: str):
+            async with streams:
+                stats.wire_bytes += await self._put_compressed(ssh_client, local_path, remote_path, key)
+                stats.bytes += os.path.getsize(local_path)
+                stats.compressed_files += 1
+
+        async def put_plain():
+            if not plain:
+                return
+            sftp_clients = [await ssh_client.start_sftp_client() for _ in range(sftp_channels)]
+            try:
+                slots = asyncio.Semaphore(self.options.max_requests)
+                sizes = await asyncio.gather(*[
+                    self._put_blocks(sftp_clients, slots, local_path, remote_path)
+                    for local_path, remote_path, _ in plain
+                ])
+                stats.bytes += sum(sizes)
+                stats.wire_bytes += sum(sizes)
+            finally:
+                for sftp_client in sftp_clients:
+                    sftp_client.exit()
+                    await sftp_client.wait_closed()
+
+        await asyncio.gather(
+            put_plain(),
+            *[put_compressed(*file) for file in compressed],
+        )
+        stats.seconds = time.perf_counter() - started_at
+        return stats
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import asyncssh
+
+from core.metrics import SSH_CONNECT_SECONDS
+from core.utils import _m, get_extra_info
+
+logger = logging.getLogger(__name__)
+
+# callers sharing one connection, each on its own channels; OpenSSH allows 10 sessions
+SSH_POOL_MAX_LEASES = 4
+SSH_POOL_IDLE_TIMEOUT = 60
+SSH_POOL_MAX_LIFETIME = 60 * 10
+# a connection idle for longer than this is probed before it is handed out again
+SSH_POOL_HEALTH_CHECK_AFTER = 15
+SSH_POOL_HEALTH_CHECK_TIMEOUT = 5
+SSH_POOL_REAP_INTERVAL = 15
+SSH_KEEPALIVE_INTERVAL = 30
+SSH_CONNECT_TIMEOUT = 30
+
+# a connection that raised one of these is not handed out again, ConnectionLost is a DisconnectError
+SSH_POOL_CONNECTION_ERRORS = (asyncssh.DisconnectError, asyncssh.ChannelOpenError, ConnectionError)
+
+PoolKey = tuple[str, int, str, str]
+
+
+class PooledConnection:
+    def __init__(self, connection: asyncssh.SSHClientConnection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.leases = 0
+
+    def is_expired(self, now: float) -> bool:
+        return self.connection.is_closed() or now - self.created_at > SSH_POOL_MAX_LIFETIME
+
+    def is_idle(self, now: float) -> bool:
+        return self.leases == 0 and now - self.last_used > SSH_POOL_IDLE_TIMEOUT
+
+
+class SSHConnectionPool:
+    """Reuse ssh connections to executors across tasks and docker operations.
+
+    Connections are keyed by address, port, username and client key fingerprint, so
+    a new key handed to a miner always gets a new connection. Executor keys are made
+    per job batch, so connections are reused within a batch only and those of the
+    previous batch are closed once idle. Up to
+    SSH_POOL_MAX_LEASES callers share a connection, each opening its own channels
+    on it. Connections that have been idle for a while are probed before being
+    reused, and a reaper closes the ones idle for SSH_POOL_IDLE_TIMEOUT.
+    """
+
+    def __init__(self):
+        self._connections: dict[PoolKey, list[PooledConnection]] = {}
+        self._locks: dict[PoolKey, asyncio.Lock] = {}
+        self._reaper: asyncio.Task | None = None
+
+    @asynccontextmanager
+    async def connect(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        client_key: asyncssh.SSHKey,
+    ) -> AsyncIterator[asyncssh.SSHClientConnection]:
+        key = (host, port, username, client_key.get_fingerprint())
+        pooled = await self._acquire(key, client_key)
+        try:
+            yield pooled.connection
+        except SSH_POOL_CONNECTION_ERRORS:
+            self._discard(key, pooled)
+            raise
+        finally:
+            pooled.leases -= 1
+            pooled.last_used = time.monotonic()
+
+    async def _acquire(self, key: PoolKey, client_key: asyncssh.SSHKey) -> PooledConnection:
+        self._start_reaper()
+
+        # one handshake per key at a time, concurrent callers then share its connection
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            now = time.monotonic()
+            for pooled in list(self._connections.get(key, [])):
+                if pooled.leases >= SSH_POOL_MAX_LEASES:
+                    continue
+                if pooled.is_expired(now) or not await self._is_healthy(pooled, now):
+                    self._discard(key, pooled)
+                    continue
+                pooled.leases += 1
+                return pooled
+
+            host, port, username, _ = key
+            started_at = time.perf_counter()
+            connection = await asyncio.wait_for(
+                asyncssh.connect(
+                    host=host,
+                    port=port,
+                    username=username,
+                    client_keys=[client_key],
+                    known_hosts=None,
+                    keepalive_interval=SSH_KEEPALIVE_INTERVAL,
+                ),
+                timeout=SSH_CONNECT_TIMEOUT,
+            )
+            SSH_CONNECT_SECONDS.observe(time.perf_counter() - started_at)
+            pooled = PooledConnection(connection)
+            pooled.leases += 1
+            self._connections.setdefault(key, []).append(pooled)
+            return pooled
+
+    async def _is_healthy(self, pooled: PooledConnection, now: float) -> bool:
+        if pooled.leases or now - pooled.last_used < SSH_POOL_HEALTH_CHECK_AFTER:
+            return True
+        try:
+            await pooled.connection.run("true", timeout=SSH_POOL_HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, key: PoolKey, pooled: PooledConnection):
+        connections = self._connections.get(key, [])
+        if pooled in connections:
+            connections.remove(pooled)
+        if not connections:
+            self._connections.pop(key, None)
+            lock = self._locks.get(key)
+            if lock is not None and not lock.locked():
+                self._locks.pop(key)
+        pooled.connection.close()
+
+    def _start_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(SSH_POOL_REAP_INTERVAL)
+            self.reap()
+            # started again by the next connect
+            if not self._connections and not self._locks:
+                return
+
+    def reap(self) -> int:
+        """Close the connections that are idle or expired and not in use."""
+        now = time.monotonic()
+        stale = [
+            (key, pooled)
+            for key, connections in self._connections.items()
+            for pooled in connections
+            if pooled.leases == 0 and (pooled.is_idle(now) or pooled.is_expired(now))
+        ]
+        for key, pooled in stale:
+            self._discard(key, pooled)
+        # locks of keys that failed to connect
+        for key in [key for key, lock in self._locks.items() if key not in self._connections and not lock.locked()]:
+            self._locks.pop(key)
+
+        if stale:
+            logger.info(
+                _m(
+                    "[SSHConnectionPool] Closed idle connections",
+                    extra=get_extra_info({
+                        "closed": len(stale),
+                        "open": sum(len(connections) for connections in self._connections.values()),
+                    }),
+                ),
+            )
+        return len(stale)
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        connections = [
+            pooled.connection for pooled_connections in self._connections.values() for pooled in pooled_connections
+        ]
+        self._connections.clear()
+        self._locks.clear()
+        for connection in connections:
+            connection.close()
+        await asyncio.gather(
+            *[connection.wait_closed() for connection in connections], return_exceptions=True
+        )
@@ -1,37 +1,101 @@
-import os
 import asyncio
 import json
 import logging
+import re
 import time
-import random
-from typing import Annotated, Optional, Tuple
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Annotated
 
 import asyncssh
 import bittensor
 from datura.requests.miner_requests import ExecutorSSHInfo
 from fastapi import Depends
-from payload_models.payloads import MinerJobRequestPayload, MinerJobEnryptedFiles
 
+from core.config import settings
+from core.metrics import (
+    DOCKER_PROBE_SECONDS,
+    EXECUTOR_FAILURES,
+    EXECUTOR_TOTAL_SECONDS,
+    EXECUTORS_IN_FLIGHT,
+    HASHCAT_SECONDS,
+    MACHINE_SCRAPE_SECONDS,
+    UPLOAD_SECONDS,
+)
+from core.pipeline import Stage, StagedPipeline
+from core.readiness import wait_for_ssh
 from core.utils import _m, context, get_extra_info
+from payload_models.payloads import MinerJobEnryptedFiles, MinerJobRequestPayload
+from services.artifact_cache import ArtifactCache, UploadStats
+from services.challenge_pool import HashChallengePool
 from services.const import (
     DOWNLOAD_SPEED_WEIGHT,
     GPU_MAX_SCORES,
     JOB_TAKEN_TIME_WEIGHT,
+    LIB_NVIDIA_ML_DIGESTS,
     MAX_DOWNLOAD_SPEED,
-    MAX_UPLOAD_SPEED,
-    UPLOAD_SPEED_WEIGHT,
     MAX_GPU_COUNT,
+    MAX_UPLOAD_SPEED,
     UNRENTED_MULTIPLIER,
-    HASHCAT_CONFIGS,
-    LIB_NVIDIA_ML_DIGESTS,
+    UPLOAD_SPEED_WEIGHT,
 )
-from services.redis_service import RedisService, RENTED_MACHINE_SET, AVAILABLE_PORT_MAPS_PREFIX
+from services.hashcat_calibration import HashcatTimings, load_hashcat_configs
+from services.port_allocator import PortAllocator
+from services.redis_service import RENTED_MACHINE_SET, RedisService
+from services.remote_command import OutputLimitExceeded, run_command
+from services.sftp_transfer import SFTPTransfer, TransferOptions
+from services.ssh_pool import SSHConnectionPool
 from services.ssh_service import SSHService
-from services.hash_service import HashService
+from services.throughput_probe import NetworkProber, unmeasured
 
 logger = logging.getLogger(__name__)
 
 JOB_LENGTH = 300
+CLEANUP_TIMEOUT = 15
+# for the probe container to start sshd, it generates its host keys first
+CONTAINER_SSH_TIMEOUT = 20
+# for both directions of the network probe together
+NETWORK_PROBE_TIMEOUT = 20
+# docker run errors of a host port that is taken
+PORT_IN_USE_ERRORS = ("port is already allocated", "address already in use")
+# errors _run_task returns when it stopped the command
+TASK_TIMEOUT_ERROR = "Task timed out"
+TASK_OUTPUT_LIMIT_ERROR = "Task output limit exceeded"
+TASK_FAILURES = {TASK_TIMEOUT_ERROR: "timeout", TASK_OUTPUT_LIMIT_ERROR: "output_limit"}
+# the machine scrape prints its spec as one Fernet token
+FERNET_TOKEN = re.compile(r"gAAAAA[A-Za-z0-9_-]+=*")
+
+
+def _is_fernet_token(line: str) -> bool:
+    return FERNET_TOKEN.fullmatch(line.strip()) is not None
+
+
+def _is_hashcat_result(line: str) -> bool:
+    try:
+        result = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(result, dict) and "answer" in result
+
+
+@dataclass
+class ExecutorJob:
+    """One executor's way through the validation pipeline."""
+
+    miner_info: MinerJobRequestPayload
+    executor_info: ExecutorSSHInfo
+    public_key: str
+    encypted_files: MinerJobEnryptedFiles
+    docker_hub_digests: dict[str, str]
+    remote_dir: str
+    default_extra: dict
+    private_key: str = ""
+    client_key: asyncssh.SSHKey | None = None
+    uploaded: bool = False
+    machine_spec: dict | None = None
+    gpu_model: str | None = None
+    gpu_count: int = 0
+    max_score: float = 0
 
 
 class TaskService:
@@ -39,42 +103,63 @@ class TaskService:
         self,
         ssh_service: Annotated[SSHService, Depends(SSHService)],
         redis_service: Annotated[RedisService, Depends(RedisService)],
+        ssh_pool: Annotated[SSHConnectionPool, Depends(SSHConnectionPool)],
     ):
         self.ssh_service = ssh_service
         self.redis_service = redis_service
+        self.ssh_pool = ssh_pool
+        self.port_allocator = PortAllocator(redis_service)
+        self.artifact_cache = ArtifactCache(
+            SFTPTransfer(
+                TransferOptions(
+                    block_size=settings.UPLOAD_BLOCK_SIZE,
+                    max_requests=settings.UPLOAD_MAX_REQUESTS,
+                    channels=settings.UPLOAD_CHANNELS,
+                    compression=settings.UPLOAD_COMPRESSION,
+                )
+            )
+        )
+        self.hashcat_configs = load_hashcat_configs(settings.HASHCAT_CONFIGS_PATH)
+        self.hashcat_timings = HashcatTimings(redis_service)
+        self.network_prober = NetworkProber(
+            redis_service,
+            concurrency=settings.NETWORK_PROBE_CONCURRENCY,
+            max_size=settings.NETWORK_PROBE_BYTES,
+            timeout=NETWORK_PROBE_TIMEOUT,
+        )
+        self.challenge_pool = HashChallengePool(
+            pool_size=settings.HASHCAT_CHALLENGE_POOL_SIZE, workers=settings.HASHCAT_CHALLENGE_WORKERS
+        )
         self.is_valid = True
+        # executors hold a pooled ssh connection per stage only, the remote temp dir
+        # carries over from one stage to the next
+        self.pipeline: StagedPipeline[ExecutorJob] = StagedPipeline(
+            stages=[
+                Stage("scrape", self._scrape_stage, settings.EXECUTOR_SCRAPE_CONCURRENCY),
+                # the prober itself runs only a few probes at once, the others wait for a slot
+                Stage("network", self._network_stage, settings.EXECUTOR_SCRAPE_CONCURRENCY),
+                Stage("docker", self._docker_stage, settings.EXECUTOR_DOCKER_CONCURRENCY),
+                Stage("hashcat", self._hashcat_stage, settings.EXECUTOR_HASHCAT_CONCURRENCY),
+            ],
+            queue_size=settings.EXECUTOR_PIPELINE_QUEUE_SIZE,
+            on_error=self._handle_job_error,
+            on_finish=self._finish_job,
+        )
 
     async def upload_directory(
         self,
         ssh_client: asyncssh.SSHClientConnection,
         local_dir: str,
         remote_dir: str
-    ):
-        """Uploads a directory recursively to a remote server using AsyncSSH."""
-        async with ssh_client.start_sftp_client() as sftp_client:
-            for root, dirs, files in os.walk(local_dir):
-                relative_dir = os.path.relpath(root, local_dir)
-                remote_path = os.path.join(remote_dir, relative_dir)
-
-                # Create remote directory if it doesn't exist
-                result = await ssh_client.run(f'mkdir -p {remote_path}')
-                if result.exit_status != 0:
-                    raise Exception(f"Failed to create directory {remote_path}: {result.stderr}")
-
-                # Upload files
-                upload_tasks = []
-                for file in files:
-                    local_file = os.path.join(root, file)
-                    remote_file = os.path.join(remote_path, file)
-                    upload_tasks.append(sftp_client.put(local_file, remote_file))
-
-                # Await all upload tasks for the current directory
-                await asyncio.gather(*upload_tasks)
+    ) -> UploadStats:
+        """Replace remote_dir with local_dir, sending only the files the executor has not cached."""
+        return await self.artifact_cache.upload_directory(ssh_client, local_dir, remote_dir)
 
     def check_digests(self, result, list_digests):
         # Check if each digest exists in list_digests
         digests_in_list = {}
-        each_digests = result['all_container_digests']
+        # missing when the probe failed, which leaves the digests empty and so invalid
+        each_digests = result.get('all_container_digests', [])
         for each_digest in each_digests:
             digest = each_digest['digest']
             digests_in_list[digest] = digest in list_digests.values()
@@ -123,42 +208,6 @@ class TaskService:
         except:
             pass
 
-    def get_available_port_map(
-        self,
-        executor_info: ExecutorSSHInfo,
-    ) -> Optional[Tuple[int, int]]:
-        if executor_info.port_mappings:
-            port_mappings: list[Tuple[int, int]] = json.loads(executor_info.port_mappings)
-            port_mappings = [
-                (internal_port, external_port)
-                for internal_port, external_port in port_mappings
-                if internal_port != executor_info.ssh_port and external_port != executor_info.ssh_port
-            ]
-
-            if not port_mappings:
-                return None
-
-            return random.choice(port_mappings)
-
-        if executor_info.port_range:
-            if '-' in executor_info.port_range:
-                min_port, max_port = map(int, (part.strip() for part in executor_info.port_range.split('-')))
-                ports = list(range(min_port, max_port + 1))
-            else:
-                ports = list(map(int, (part.strip() for part in executor_info.port_range.split(','))))
-        else:
-            # Default range if port_range is empty
-            ports = list(range(40000, 65536))
-
-        ports = [port for port in ports if port != executor_info.ssh_port]
-
-        if not ports:
-            return None
-
-        internal_port = random.choice(ports)
-
-        return internal_port, internal_port
-
     async def docker_connection_check(
         self,
         ssh_client: asyncssh.SSHClientConnection,
@@ -168,7 +217,7 @@ class TaskService:
         private_key: str,
         public_key: str,
     ):
-        port_map = self.get_available_port_map(executor_info)
+        port_map = await self.port_allocator.allocate(miner_hotkey, executor_info)
         if port_map is None:
             log_text = _m(
                 "No port available for docker container",
@@ -202,6 +251,8 @@ class TaskService:
         }
         context.set(f"[_docker_connection_check][{executor_name}]")
 
+        # None leaves the port's record as it was, e.g. when docker itself is broken
+        port_ok = None
         try:
             log_text = _m(
                 "Creating docker container",
@@ -216,6 +267,8 @@ class TaskService:
 
             result = await ssh_client.run(command, timeout=20)
             if result.exit_status != 0:
+                if any(error in (result.stderr or "") for error in PORT_IN_USE_ERRORS):
+                    port_ok = False
                 log_text = _m(
                     "Error creating docker connection",
                     extra=get_extra_info(default_extra),
@@ -225,7 +278,8 @@ class TaskService:
 
                 return False, log_text, log_status
 
-            await asyncio.sleep(2)
+            # connecting fails with a clear error if sshd is not up by the deadline
+            await wait_for_ssh(executor_info.address, external_port, timeout=CONTAINER_SSH_TIMEOUT)
 
             pkey = asyncssh.import_private_key(private_key)
             async with asyncssh.connect(
@@ -240,21 +294,7 @@ class TaskService:
                     extra=default_extra,
                 )
                 logger.info(log_text)
-
-                # set port on redis
-                key = f"{AVAILABLE_PORT_MAPS_PREFIX}:{miner_hotkey}:{executor_info.uuid}"
-                port_map = f"{internal_port},{external_port}"
-
-                # delete all the same port_maps in the list
-                await self.redis_service.lrem(key=key, element=port_map)
-
-                # insert port_map in the list
-                await self.redis_service.lpush(key, port_map)
-
-                # keep the latest 10 port maps
-                port_maps = await self.redis_service.lrange(key)
-                if len(port_maps) > 10:
-                    await self.redis_service.rpop(key)
+                port_ok = True
 
             command = f"docker rm {container_name} -f"
             await ssh_client.run(command, timeout=20)
@@ -275,480 +315,510 @@ class TaskService:
                 pass
 
             return False, log_text, log_status
+        finally:
+            await self.port_allocator.release(miner_hotkey, executor_info.uuid, port_map, port_ok)
 
-    async def create_task(
+    def _job_result(
         self,
-        miner_info: MinerJobRequestPayload,
-        executor_info: ExecutorSSHInfo,
-        keypair: bittensor.Keypair,
-        private_key: str,
-        public_key: str,
-        encypted_files: MinerJobEnryptedFiles,
-        docker_hub_digests: dict[str, str]
+        job: ExecutorJob,
+        machine_spec: dict | None,
+        score: float,
+        job_score: float,
+        log_status: str,
+        log_text: str,
+        failure: str | None = None,
     ):
-        default_extra = {
-            "job_batch_id": miner_info.job_batch_id,
-            "miner_hotkey": miner_info.miner_hotkey,
-            "executor_uuid": executor_info.uuid,
-            "executor_ip_address": executor_info.address,
-            "executor_port": executor_info.port,
-            "executor_ssh_username": executor_info.ssh_username,
-            "executor_ssh_port": executor_info.ssh_port,
-        }
+        if failure:
+            EXECUTOR_FAILURES.labels(failure).inc()
+        return (
+            machine_spec,
+            job.executor_info,
+            score,
+            job_score,
+            job.miner_info.job_batch_id,
+            log_status,
+            log_text,
+        )
+
+    async def flush_hashcat_timings(self):
+        """Write the hashcat job times recorded since the last flush, once per job batch."""
         try:
-            logger.info(_m("Start job on an executor", extra=get_extra_info(default_extra)))
+            await self.hashcat_timings.flush()
+        except Exception as e:
+            logger.warning(
+                _m("Failed to record hashcat job times", extra=get_extra_info({"error": str(e)})),
+            )
 
-            private_key = self.ssh_service.decrypt_payload(keypair.ss58_address, private_key)
-            pkey = asyncssh.import_private_key(private_key)
+    def warm_challenge_pool(self):
+        # the gpu counts the hashcat configs have timings for
+        self.challenge_pool.warm({
+            (gpu_count, config.get("digits", 11))
+            for config in self.hashcat_configs.values()
+            if config
+            for gpu_count in range(1, len(config.get("average_time") or []) + 1)
+        })
+
+    def _connect(self, job: ExecutorJob):
+        return self.ssh_pool.connect(
+            host=job.executor_info.address,
+            port=job.executor_info.ssh_port,
+            username=job.executor_info.ssh_username,
+            client_key=job.client_key,
+        )
+
+    async def _scrape_stage(self, job: ExecutorJob):
+        """Upload the job files, scrape the machine spec and check it."""
+        default_extra = job.default_extra
+        encypted_files = job.encypted_files
+
+        async with self._connect(job) as ssh_client:
+            # upload temp directory
+            with UPLOAD_SECONDS.time():
+                upload_stats = await self.upload_directory(ssh_client, encypted_files.tmp_directory, job.remote_dir)
+            job.uploaded = True
 
-            async with asyncssh.connect(
-                host=executor_info.address,
-                port=executor_info.ssh_port,
-                username=executor_info.ssh_username,
-                client_keys=[pkey],
-                known_hosts=None,
-            ) as ssh_client:
-                remote_dir = f"{executor_info.root_dir}/temp"
-                await ssh_client.run(f"rm -rf {remote_dir}")
-                await ssh_client.run(f"mkdir -p {remote_dir}")
+            logger.info(
+                _m(
+                    "Uploaded files to run job",
+                    extra=get_extra_info({
+                        **default_extra,
+                        "files": upload_stats.files,
+                        "uploaded_files": upload_stats.uploaded_files,
+                        "uploaded_bytes": upload_stats.uploaded_bytes,
+                        "wire_bytes": upload_stats.wire_bytes,
+                        "total_bytes": upload_stats.total_bytes,
+                        "upload_seconds": round(upload_stats.seconds, 3),
+                        "upload_mbps": round(upload_stats.throughput * 8 / 1e6, 1),
+                    }),
+                ),
+            )
 
-                # upload temp directory
-                await self.upload_directory(ssh_client, encypted_files.tmp_directory, remote_dir)
+            remote_machine_scrape_file_path = f"{job.remote_dir}/{encypted_files.machine_scrape_file_name}"
+            with MACHINE_SCRAPE_SECONDS.time():
+                machine_specs, err = await self._run_task(
+                    ssh_client=ssh_client,
+                    miner_hotkey=job.miner_info.miner_hotkey,
+                    executor_info=job.executor_info,
+                    command=f"chmod +x {remote_machine_scrape_file_path} && {remote_machine_scrape_file_path}",
+                    is_result=_is_fernet_token,
+                )
 
-                remote_machine_scrape_file_path = f"{remote_dir}/{encypted_files.machine_scrape_file_name}"
-                remote_score_file_path = f"{remote_dir}/{encypted_files.score_file_name}"
+        if not machine_specs:
+            log_status = "warning"
+            log_text = _m("No machine specs found", extra=get_extra_info(default_extra))
+            logger.warning(log_text)
 
-                logger.info(
-                    _m(
-                        "Uploaded files to run job",
-                        extra=get_extra_info(default_extra),
-                    ),
-                )
+            failure = TASK_FAILURES.get(err, "no_machine_specs")
+            return self._job_result(job, None, 0, 0, log_status, log_text, failure)
 
-                machine_specs, _ = await self._run_task(
-                    ssh_client=ssh_client,
-                    miner_hotkey=miner_info.miner_hotkey,
-                    executor_info=executor_info,
-                    command=f"chmod +x {remote_machine_scrape_file_path} && {remote_machine_scrape_file_path}"
-                )
-                if not machine_specs:
-                    log_status = "warning"
-                    log_text = _m("No machine specs found", extra=get_extra_info(default_extra))
-                    logger.warning(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        None,
-                        executor_info,
-                        0,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-
-                machine_spec = json.loads(self.ssh_service.decrypt_payload(encypted_files.encrypt_key, machine_specs[0].strip()))
-
-                gpu_model = None
-                if machine_spec.get("gpu", {}).get("count", 0) > 0:
-                    details = machine_spec["gpu"].get("details", [])
-                    if len(details) > 0:
-                        gpu_model = details[0].get("name", None)
-
-                max_score = 0
-                if gpu_model:
-                    max_score = GPU_MAX_SCORES.get(gpu_model, 0)
-
-                gpu_count = machine_spec.get("gpu", {}).get("count", 0)
-
-                nvidia_driver = machine_spec.get("gpu", {}).get("driver", '')
-                libnvidia_ml = machine_spec.get('md5_checksums', {}).get('libnvidia_ml', '')
-
-                logger.info(
-                    _m(
-                        "Machine spec scraped",
-                        extra=get_extra_info({
-                            **default_extra,
-                            "gpu_model": gpu_model,
-                            "gpu_count": gpu_count,
-                            "nvidia_driver": nvidia_driver,
-                            "libnvidia_ml": libnvidia_ml,
-                        }),
-                    ),
+        machine_spec = json.loads(self.ssh_service.decrypt_payload(encypted_files.encrypt_key, machine_specs[0].strip()))
+        job.machine_spec = machine_spec
+
+        gpu_model = None
+        if machine_spec.get("gpu", {}).get("count", 0) > 0:
+            details = machine_spec["gpu"].get("details", [])
+            if len(details) > 0:
+                gpu_model = details[0].get("name", None)
+
+        max_score = 0
+        if gpu_model:
+            max_score = GPU_MAX_SCORES.get(gpu_model, 0)
+
+        gpu_count = machine_spec.get("gpu", {}).get("count", 0)
+
+        nvidia_driver = machine_spec.get("gpu", {}).get("driver", '')
+        libnvidia_ml = machine_spec.get('md5_checksums', {}).get('libnvidia_ml', '')
+
+        job.gpu_model, job.gpu_count, job.max_score = gpu_model, gpu_count, max_score
+
+        logger.info(
+            _m(
+                "Machine spec scraped",
+                extra=get_extra_info({
+                    **default_extra,
+                    "gpu_model": gpu_model,
+                    "gpu_count": gpu_count,
+                    "nvidia_driver": nvidia_driver,
+                    "libnvidia_ml": libnvidia_ml,
+                }),
+            ),
+        )
+
+        if gpu_count > MAX_GPU_COUNT:
+            log_status = "warning"
+            log_text = _m(
+                f"GPU count({gpu_count}) is greater than the maximum allowed ({MAX_GPU_COUNT}).",
+                extra=get_extra_info(default_extra),
+            )
+            logger.warning(log_text)
+
+            return self._job_result(job, machine_spec, 0, 0, log_status, log_text, "gpu_count_exceeded")
+
+        if max_score == 0 or gpu_count == 0:
+            extra_info = {
+                **default_extra,
+                "os_version": machine_spec.get('os', ''),
+                "nvidia_cfg": machine_spec.get('nvidia_cfg', ''),
+                "docker_cfg": machine_spec.get('docker_cfg', ''),
+                "gpu_scrape_error": machine_spec.get('gpu_scrape_error', ''),
+                "nvidia_cfg_scrape_error": machine_spec.get('nvidia_cfg_scrape_error', ''),
+                "docker_cfg_scrape_error": machine_spec.get('docker_cfg_scrape_error', '')
+            }
+            if gpu_model:
+                extra_info["gpu_model"] = gpu_model
+                extra_info["help_text"] = (
+                    "If you have the gpu machine and encountering this issue consistantly, "
+                    "then please pull the latest version of github repository and follow the installation guide here: "
+                    "https://github.com/Datura-ai/compute-subnet/tree/main/neurons/executor. "
+                    "Also, please configure the nvidia-container-runtime correctly. Check out here: "
+                    "https://stackoverflow.com/questions/72932940/failed-to-initialize-nvml-unknown-error-in-docker-after-few-hours "
+                    "https://bobcares.com/blog/docker-failed-to-initialize-nvml-unknown-error/"
                 )
 
-                if gpu_count > MAX_GPU_COUNT:
-                    log_status = "warning"
-                    log_text = _m(
-                        f"GPU count({gpu_count}) is greater than the maximum allowed ({MAX_GPU_COUNT}).",
-                        extra=get_extra_info(default_extra),
-                    )
-                    logger.warning(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        machine_spec,
-                        executor_info,
-                        0,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-
-                if max_score == 0 or gpu_count == 0:
-                    extra_info = {
+            log_text = _m(
+                f"Max Score({max_score}) or GPU count({gpu_count}) is 0. No need to run job.",
+                extra=get_extra_info({
+                    **default_extra,
+                    **extra_info,
+                }),
+            )
+            log_status = "warning"
+            logger.warning(log_text)
+
+            return self._job_result(job, machine_spec, 0, 0, log_status, log_text, "unsupported_gpu")
+
+        if nvidia_driver and LIB_NVIDIA_ML_DIGESTS.get(nvidia_driver) != libnvidia_ml:
+            log_status = "warning"
+            log_text = _m(
+                "Nvidia driver is altered",
+                extra=get_extra_info({
+                    **default_extra,
+                    "gpu_model": gpu_model,
+                    "gpu_count": gpu_count,
+                    "nvidia_driver": nvidia_driver,
+                    "libnvidia_ml": libnvidia_ml,
+                }),
+            )
+            logger.warning(log_text)
+
+            return self._job_result(job, machine_spec, 0, 0, log_status, log_text, "nvidia_driver_altered")
+
+        logger.info(
+            _m(
+                f"Got GPU specs: {gpu_model} with max score: {max_score}",
+                extra=get_extra_info(default_extra),
+            ),
+        )
+
+        # check rented status
+        is_rented = await self.redis_service.is_elem_exists_in_set(
+            RENTED_MACHINE_SET, f"{job.miner_info.miner_hotkey}:{job.executor_info.uuid}"
+        )
+        if is_rented:
+            score = max_score * gpu_count
+            log_text = _m(
+                "Executor is already rented.",
+                extra=get_extra_info({**default_extra, "score": score}),
+            )
+            log_status = "info"
+            logger.info(log_text)
+
+            return self._job_result(job, machine_spec, score, 0, log_status, log_text)
+
+        # if not rented, check docker digests
+        digests_in_list = self.check_digests(machine_spec, job.docker_hub_digests)
+        duplicates = self.check_duplidate_digests(machine_spec)
+        digests_empty = self.check_empty_digests(machine_spec)  # True: docker image empty, False: docker image not empty
+        # Validate digests
+        self.is_valid = self.validate_digests(digests_in_list, duplicates, digests_empty)
+        if not self.is_valid:
+            log_text = _m(
+                "Docker digests are not valid",
+                extra=get_extra_info({
+                    **default_extra,
+                    "docker_digests": machine_spec.get('all_container_digests', [])
+                }),
+            )
+            log_status = "error"
+
+            logger.warning(log_text)
+
+            return self._job_result(job, None, 0, 0, log_status, log_text, "docker_digests_invalid")
+
+        return None
+
+    async def _network_stage(self, job: ExecutorJob):
+        """Measure the executor's upload and download speed, unless its last ones are recent."""
+        default_extra = job.default_extra
+        try:
+            network = await self.network_prober.speeds(
+                job.miner_info.miner_hotkey, job.executor_info.uuid, lambda: self._connect(job)
+            )
+        except Exception as e:
+            network = unmeasured(repr(e))
+
+        if network.get("unmeasured") or network.get("probe_error"):
+            logger.warning(
+                _m(
+                    "Network probe failed",
+                    extra=get_extra_info({
                         **default_extra,
-                        "os_version": machine_spec.get('os', ''),
-                        "nvidia_cfg": machine_spec.get('nvidia_cfg', ''),
-                        "docker_cfg": machine_spec.get('docker_cfg', ''),
-                        "gpu_scrape_error": machine_spec.get('gpu_scrape_error', ''),
-                        "nvidia_cfg_scrape_error": machine_spec.get('nvidia_cfg_scrape_error', ''),
-                        "docker_cfg_scrape_error": machine_spec.get('docker_cfg_scrape_error', '')
-                    }
-                    if gpu_model:
-                        extra_info["gpu_model"] = gpu_model
-                        extra_info["help_text"] = (
-                            "If you have the gpu machine and encountering this issue consistantly, "
-                            "then please pull the latest version of github repository and follow the installation guide here: "
-                            "https://github.com/Datura-ai/compute-subnet/tree/main/neurons/executor. "
-                            "Also, please configure the nvidia-container-runtime correctly. Check out here: "
-                            "https://stackoverflow.com/questions/72932940/failed-to-initialize-nvml-unknown-error-in-docker-after-few-hours "
-                            "https://bobcares.com/blog/docker-failed-to-initialize-nvml-unknown-error/"
-                        )
-
-                    log_text = _m(
-                        f"Max Score({max_score}) or GPU count({gpu_count}) is 0. No need to run job.",
-                        extra=get_extra_info({
-                            **default_extra,
-                            **extra_info,
-                        }),
-                    )
-                    log_status = "warning"
-                    logger.warning(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        machine_spec,
-                        executor_info,
-                        0,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-
-                if nvidia_driver and LIB_NVIDIA_ML_DIGESTS.get(nvidia_driver) != libnvidia_ml:
-                    log_status = "warning"
-                    log_text = _m(
-                        f"Nvidia driver is altered",
-                        extra=get_extra_info({
-                            **default_extra,
-                            "gpu_model": gpu_model,
-                            "gpu_count": gpu_count,
-                            "nvidia_driver": nvidia_driver,
-                            "libnvidia_ml": libnvidia_ml,
-                        }),
-                    )
-                    logger.warning(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        machine_spec,
-                        executor_info,
-                        0,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-
-                logger.info(
-                    _m(
-                        f"Got GPU specs: {gpu_model} with max score: {max_score}",
-                        extra=get_extra_info(default_extra),
-                    ),
-                )
+                        "error": network.get("unmeasured") or network.get("probe_error"),
+                        "last_speeds": not network.get("unmeasured"),
+                    }),
+                ),
+            )
 
-                # check rented status
-                is_rented = await self.redis_service.is_elem_exists_in_set(
-                    RENTED_MACHINE_SET, f"{miner_info.miner_hotkey}:{executor_info.uuid}"
-                )
-                if is_rented:
-                    score = max_score * gpu_count
-                    log_text = _m(
-                        "Executor is already rented.",
-                        extra=get_extra_info({**default_extra, "score": score}),
-                    )
-                    log_status = "info"
-                    logger.info(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        machine_spec,
-                        executor_info,
-                        score,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-                else:
-                    # if not rented, check docker digests
-                    digests_in_list = self.check_digests(machine_spec, docker_hub_digests)
-                    duplicates = self.check_duplidate_digests(machine_spec)
-                    digests_empty = self.check_empty_digests(machine_spec)  # True: docker image empty, False: docker image not empty
-                    # Validate digests
-                    self.is_valid = self.validate_digests(digests_in_list, duplicates, digests_empty)
-                    if not self.is_valid:
-                        log_text = _m(
-                            "Docker digests are not valid",
-                            extra=get_extra_info({
-                                **default_extra,
-                                "docker_digests": machine_spec.get('all_container_digests', [])
-                            }),
-                        )
-                        log_status = "error"
-
-                        logger.warning(log_text)
-
-                        await self.clear_remote_directory(ssh_client, remote_dir)
-
-                        return (
-                            None,
-                            executor_info,
-                            0,
-                            0,
-                            miner_info.job_batch_id,
-                            log_status,
-                            log_text,
-                        )
-
-                    # if not rented, check renting ports
-                    success, log_text, log_status = await self.docker_connection_check(
-                        ssh_client=ssh_client,
-                        job_batch_id=miner_info.job_batch_id,
-                        miner_hotkey=miner_info.miner_hotkey,
-                        executor_info=executor_info,
-                        private_key=private_key,
-                        public_key=public_key,
-                    )
-                    if not success:
-                        await self.clear_remote_directory(ssh_client, remote_dir)
-
-                        return (
-                            None,
-                            executor_info,
-                            0,
-                            0,
-                            miner_info.job_batch_id,
-                            log_status,
-                            log_text,
-                        )
-
-                # scoring
-                hashcat_config = HASHCAT_CONFIGS[gpu_model]
-                if not hashcat_config:
-                    log_text = _m(
-                        "No config for hashcat",
-                        extra=get_extra_info(default_extra),
-                    )
-                    log_status = "error"
-
-                    logger.warning(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        None,
-                        executor_info,
-                        0,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-
-                num_digits = hashcat_config.get('digits', 11)
-                avg_job_time = hashcat_config.get("average_time")[gpu_count - 1] if hashcat_config.get("average_time") else 60
-                hash_service = HashService.generate(
-                    gpu_count=gpu_count,
-                    num_digits=num_digits,
-                    timeout=int(avg_job_time * 2.5)
+        # measured by the validator, not reported by the executor
+        job.machine_spec["network"] = network
+        return None
+
+    async def _docker_stage(self, job: ExecutorJob):
+        """Check that the executor can run a container reachable over ssh."""
+        async with self._connect(job) as ssh_client:
+            with DOCKER_PROBE_SECONDS.time():
+                success, log_text, log_status = await self.docker_connection_check(
+                    ssh_client=ssh_client,
+                    job_batch_id=job.miner_info.job_batch_id,
+                    miner_hotkey=job.miner_info.miner_hotkey,
+                    executor_info=job.executor_info,
+                    private_key=job.private_key,
+                    public_key=job.public_key,
                 )
-                start_time = time.time()
+        if not success:
+            return self._job_result(job, None, 0, 0, log_status, log_text, "docker_probe_failed")
+
+        return None
 
+    async def _hashcat_stage(self, job: ExecutorJob):
+        """Run a hashcat challenge on the executor's GPUs and score it."""
+        default_extra = job.default_extra
+        machine_spec, gpu_model, gpu_count, max_score = job.machine_spec, job.gpu_model, job.gpu_count, job.max_score
+
+        hashcat_config = self.hashcat_configs[gpu_model]
+        if not hashcat_config:
+            log_text = _m(
+                "No config for hashcat",
+                extra=get_extra_info(default_extra),
+            )
+            log_status = "error"
+
+            logger.warning(log_text)
+
+            return self._job_result(job, None, 0, 0, log_status, log_text, "no_hashcat_config")
+
+        num_digits = hashcat_config.get('digits', 11)
+        avg_job_time = hashcat_config.get("average_time")[gpu_count - 1] if hashcat_config.get("average_time") else 60
+        hash_service = await self.challenge_pool.get(
+            gpu_count=gpu_count,
+            num_digits=num_digits,
+            timeout=int(avg_job_time * 2.5)
+        )
+        payload = hash_service.payload
+
+        remote_score_file_path = f"{job.remote_dir}/{job.encypted_files.score_file_name}"
+        async with self._connect(job) as ssh_client:
+            # timed from here, waiting for a pooled connection is not the executor's time
+            start_time = time.time()
+            with HASHCAT_SECONDS.time():
                 results, err = await self._run_task(
                     ssh_client=ssh_client,
-                    miner_hotkey=miner_info.miner_hotkey,
-                    executor_info=executor_info,
-                    command=f"export PYTHONPATH={executor_info.root_dir}:$PYTHONPATH && {executor_info.python_path} {remote_score_file_path} '{hash_service.payload}'",
-                )
-                if not results:
-                    log_text = _m(
-                        "No result from training job task.",
-                        extra=get_extra_info(default_extra),
-                    )
-                    log_status = "warning"
-                    logger.warning(log_text)
-
-                    await self.clear_remote_directory(ssh_client, remote_dir)
-
-                    return (
-                        machine_spec,
-                        executor_info,
-                        0,
-                        0,
-                        miner_info.job_batch_id,
-                        log_status,
-                        log_text,
-                    )
-
-                end_time = time.time()
-                job_taken_time = end_time - start_time
-
-                result = json.loads(results[0])
-                answer = result["answer"]
-
-                score = 0
-
-                logger.info(
-                    _m(
-                        f"Results from training job task: {str(result)}",
-                        extra=get_extra_info(default_extra),
-                    ),
-                )
-                log_text = ""
-                log_status = ""
-
-                if err is not None:
-                    log_status = "error"
-                    log_text = _m(
-                        f"Error executing task on executor: {err}",
-                        extra=get_extra_info(default_extra),
-                    )
-                    logger.error(log_text)
-
-                elif answer != hash_service.answer:
-                    log_status = "error"
-                    log_text = _m(
-                        f"Hashcat incorrect Answer",
-                        extra=get_extra_info(default_extra),
-                    )
-                    logger.error(log_text)
-
-                # elif job_taken_time > avg_job_time * 2:
-                #     log_status = "error"
-                #     log_text = _m(
-                #         f"Incorrect Answer",
-                #         extra=get_extra_info(default_extra),
-                #     )
-                #     logger.error(log_text)
-
-                else:
-                    logger.info(
-                        _m(
-                            "Job taken time for executor",
-                            extra=get_extra_info(
-                                {**default_extra, "job_taken_time": job_taken_time}
-                            ),
-                        ),
-                    )
-
-                    upload_speed = machine_spec.get("network", {}).get("upload_speed", 0)
-                    download_speed = machine_spec.get("network", {}).get("download_speed", 0)
-
-                    # Ensure upload_speed and download_speed are not None
-                    upload_speed = upload_speed if upload_speed is not None else 0
-                    download_speed = download_speed if download_speed is not None else 0
-
-                    job_taken_score = (
-                        min(avg_job_time * 0.7 / job_taken_time, 1) if job_taken_time > 0 else 0
-                    )
-                    upload_speed_score = min(upload_speed / MAX_UPLOAD_SPEED, 1)
-                    download_speed_score = min(download_speed / MAX_DOWNLOAD_SPEED, 1)
-
-                    score = max_score * gpu_count * UNRENTED_MULTIPLIER * (
-                        job_taken_score * JOB_TAKEN_TIME_WEIGHT
-                        + upload_speed_score * UPLOAD_SPEED_WEIGHT
-                        + download_speed_score * DOWNLOAD_SPEED_WEIGHT
-                    )
-
-                    log_status = "info"
-                    log_text = _m(
-                        "Train task finished",
-                        extra=get_extra_info(
-                            {
-                                **default_extra,
-                                "score": score,
-                                "job_taken_time": job_taken_time,
-                                "upload_speed": upload_speed,
-                                "download_speed": download_speed,
-                                "gpu_model": gpu_model,
-                                "gpu_count": gpu_count,
-                            }
-                        ),
-                    )
-
-                    logger.info(log_text)
-
-                logger.info(
-                    _m(
-                        "SSH connection closed for executor",
-                        extra=get_extra_info(default_extra),
-                    ),
+                    miner_hotkey=job.miner_info.miner_hotkey,
+                    executor_info=job.executor_info,
+                    command=f"export PYTHONPATH={job.executor_info.root_dir}:$PYTHONPATH && {job.executor_info.python_path} {remote_score_file_path} '{payload}'",
+                    is_result=_is_hashcat_result,
                 )
+            end_time = time.time()
 
-                await self.clear_remote_directory(ssh_client, remote_dir)
-                return (
-                    machine_spec,
-                    executor_info,
-                    score,
-                    score,
-                    miner_info.job_batch_id,
-                    log_status,
-                    log_text,
-                )
-        except Exception as e:
+        if not results:
+            log_text = _m(
+                "No result from training job task.",
+                extra=get_extra_info(default_extra),
+            )
+            log_status = "warning"
+            logger.warning(log_text)
+
+            failure = TASK_FAILURES.get(err, "no_hashcat_result")
+            return self._job_result(job, machine_spec, 0, 0, log_status, log_text, failure)
+
+        job_taken_time = end_time - start_time
+
+        result = json.loads(results[0])
+        answer = result["answer"]
+
+        score = 0
+        failure = None
+
+        logger.info(
+            _m(
+                f"Results from training job task: {str(result)}",
+                extra=get_extra_info(default_extra),
+            ),
+        )
+        log_text = ""
+        log_status = ""
+
+        if err is not None:
             log_status = "error"
             log_text = _m(
-                "Error creating task for executor",
-                extra=get_extra_info({**default_extra, "error": str(e)}),
+                f"Error executing task on executor: {err}",
+                extra=get_extra_info(default_extra),
             )
+            logger.error(log_text)
+            failure = "hashcat_error"
 
-            try:
-                key = f"{AVAILABLE_PORT_MAPS_PREFIX}:{miner_info.miner_hotkey}:{executor_info.uuid}"
-                await self.redis_service.delete(key)
-            except Exception as redis_error:
-                log_text = _m(
-                    "Error creating task redis_reset_error",
-                    extra=get_extra_info({
-                        **default_extra,
-                        "error": str(e),
-                        "redis_reset_error": str(redis_error),
-                    }),
-                )
+        elif answer != hash_service.answer:
+            log_status = "error"
+            log_text = _m(
+                "Hashcat incorrect Answer",
+                extra=get_extra_info(default_extra),
+            )
+            logger.error(log_text)
+            failure = "hashcat_incorrect_answer"
 
-            logger.error(
-                log_text,
-                exc_info=True,
+        # elif job_taken_time > avg_job_time * 2:
+        #     log_status = "error"
+        #     log_text = _m(
+        #         f"Incorrect Answer",
+        #         extra=get_extra_info(default_extra),
+        #     )
+        #     logger.error(log_text)
+
+        else:
+            logger.info(
+                _m(
+                    "Job taken time for executor",
+                    extra=get_extra_info(
+                        {**default_extra, "job_taken_time": job_taken_time}
+                    ),
+                ),
+            )
+            self.hashcat_timings.record(gpu_model, gpu_count, num_digits, job_taken_time)
+
+            network = machine_spec.get("network", {})
+            upload_speed = network.get("upload_speed", 0)
+            download_speed = network.get("download_speed", 0)
+
+            # Ensure upload_speed and download_speed are not None
+            upload_speed = upload_speed if upload_speed is not None else 0
+            download_speed = download_speed if download_speed is not None else 0
+
+            job_taken_score = (
+                min(avg_job_time * 0.7 / job_taken_time, 1) if job_taken_time > 0 else 0
+            )
+            upload_speed_score = min(upload_speed / MAX_UPLOAD_SPEED, 1)
+            download_speed_score = min(download_speed / MAX_DOWNLOAD_SPEED, 1)
+
+            score = max_score * gpu_count * UNRENTED_MULTIPLIER * (
+                job_taken_score * JOB_TAKEN_TIME_WEIGHT
+                + upload_speed_score * UPLOAD_SPEED_WEIGHT
+                + download_speed_score * DOWNLOAD_SPEED_WEIGHT
+            )
+
+            log_status = "info"
+            log_text = _m(
+                "Train task finished",
+                extra=get_extra_info(
+                    {
+                        **default_extra,
+                        "score": score,
+                        "job_taken_time": job_taken_time,
+                        # as timed by score.py, without the ssh round trips
+                        "hashcat_elapsed": result.get("elapsed"),
+                        "upload_speed": upload_speed,
+                        "download_speed": download_speed,
+                        "network_unmeasured": network.get("unmeasured"),
+                        "gpu_model": gpu_model,
+                        "gpu_count": gpu_count,
+                    }
+                ),
             )
 
-            return (
-                None,
-                executor_info,
-                0,
-                0,
-                miner_info.job_batch_id,
-                log_status,
-                log_text,
+            logger.info(log_text)
+
+        return self._job_result(job, machine_spec, score, score, log_status, log_text, failure)
+
+    async def _handle_job_error(self, job: ExecutorJob, e: Exception):
+        default_extra = job.default_extra
+        log_status = "error"
+        log_text = _m(
+            "Error creating task for executor",
+            extra=get_extra_info({**default_extra, "error": str(e)}),
+        )
+
+        try:
+            await self.port_allocator.reset(job.miner_info.miner_hotkey, job.executor_info.uuid)
+        except Exception as redis_error:
+            log_text = _m(
+                "Error creating task redis_reset_error",
+                extra=get_extra_info({
+                    **default_extra,
+                    "error": str(e),
+                    "redis_reset_error": str(redis_error),
+                }),
             )
 
+        logger.error(
+            log_text,
+            exc_info=e,
+        )
+
+        failure = "timeout" if isinstance(e, TimeoutError) else "error"
+        return self._job_result(job, None, 0, 0, log_status, log_text, failure)
+
+    async def _finish_job(self, job: ExecutorJob):
+        if not job.uploaded:
+            return
+
+        async def clear():
+            async with self._connect(job) as ssh_client:
+                await self.clear_remote_directory(ssh_client, job.remote_dir)
+
+        # an executor that went away must not hold a pipeline worker for long
+        await asyncio.wait_for(clear(), timeout=CLEANUP_TIMEOUT)
+
+    async def create_task(
+        self,
+        miner_info: MinerJobRequestPayload,
+        executor_info: ExecutorSSHInfo,
+        keypair: bittensor.Keypair,
+        private_key: str,
+        public_key: str,
+        encypted_files: MinerJobEnryptedFiles,
+        docker_hub_digests: dict[str, str]
+    ):
+        job = ExecutorJob(
+            miner_info=miner_info,
+            executor_info=executor_info,
+            public_key=public_key,
+            encypted_files=encypted_files,
+            docker_hub_digests=docker_hub_digests,
+            remote_dir=f"{executor_info.root_dir}/temp",
+            default_extra={
+                "job_batch_id": miner_info.job_batch_id,
+                "miner_hotkey": miner_info.miner_hotkey,
+                "executor_uuid": executor_info.uuid,
+                "executor_ip_address": executor_info.address,
+                "executor_port": executor_info.port,
+                "executor_ssh_username": executor_info.ssh_username,
+                "executor_ssh_port": executor_info.ssh_port,
+            },
+        )
+        EXECUTORS_IN_FLIGHT.inc()
+        try:
+            with EXECUTOR_TOTAL_SECONDS.time():
+                try:
+                    logger.info(_m("Start job on an executor", extra=get_extra_info(job.default_extra)))
+
+                    job.private_key = self.ssh_service.decrypt_payload(keypair.ss58_address, private_key)
+                    job.client_key = asyncssh.import_private_key(job.private_key)
+                except Exception as e:
+                    return await self._handle_job_error(job, e)
+
+                return await self.pipeline.submit(job)
+        finally:
+            EXECUTORS_IN_FLIGHT.dec()
+
     async def _run_task(
         self,
         ssh_client: asyncssh.SSHClientConnection,
@@ -756,7 +826,13 @@ class TaskService:
         executor_info: ExecutorSSHInfo,
         command: str,
         timeout: int = JOB_LENGTH,
+        is_result: Callable[[str], bool] | None = None,
     ) -> tuple[list[str] | None, str | None]:
+        """Run command on the executor, returning its stdout lines or an error.
+
+        With is_result, the first line it accepts is returned on its own as soon as
+        it arrives and the command is stopped.
+        """
         try:
             executor_name = f"{executor_info.uuid}_{executor_info.address}_{executor_info.port}"
             default_extra = {
@@ -773,11 +849,12 @@ class TaskService:
                     extra=default_extra,
                 ),
             )
-            result = await ssh_client.run(command, timeout=timeout)
-            results = result.stdout.splitlines()
-            errors = result.stderr.splitlines()
+            output = await run_command(ssh_client, command, timeout=timeout, is_result=is_result)
+            if output.result is not None:
+                return [output.result], None
 
-            actual_errors = [error for error in errors if "warnning" not in error.lower()]
+            results = output.stdout
+            actual_errors = [error for error in output.stderr if "warnning" not in error.lower()]
 
             if len(results) == 0 and len(actual_errors) > 0:
                 logger.error(_m("Failed to execute command!", extra=get_extra_info(default_extra)))
@@ -790,6 +867,10 @@ class TaskService:
                 exc_info=True,
             )
 
+            if isinstance(e, TimeoutError):
+                return None, TASK_TIMEOUT_ERROR
+            if isinstance(e, OutputLimitExceeded):
+                return None, TASK_OUTPUT_LIMIT_ERROR
             return None, str(e)
 
 
@@ -0,0 +1,196 @@
+"""Upload and download speed of an executor, measured over the validator's ssh connection to it.
+
+Takes the place of speedtest-cli on the executor, which talked to third-party
+servers, took tens of seconds and varied from run to run. Random bytes, which
+ssh compression cannot shrink, are streamed each way over the executor's pooled
+connection, and only the bytes that arrive are counted. A short sample transfer
+first sizes the measured one, so that slow links are not held for long and fast
+ones are measured over more than the tcp ramp up.
+
+Each transfer starts with the executor echoing a single byte back: it marks the
+moment the remote command is reading, so that neither the channel setup nor the
+command start is timed, and gives the round trip taken off the download time.
+
+Probes share the validator's uplink, so NetworkProber runs only a few at once and
+keeps each executor's speeds in Redis until they are due to be measured again.
+An executor that could not be probed scores its speeds as zero, unless it has
+recent ones to fall back on.
+"""
+import asyncio
+import json
+import os
+import time
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager
+from functools import lru_cache
+
+import asyncssh
+
+from core.metrics import NETWORK_PROBE_SECONDS
+from services.redis_service import RedisService
+
+THROUGHPUT_CHUNK_SIZE = 256 * 1024
+# dd reads exactly the one byte it echoes, the rest of stdin is left to wc
+HANDSHAKE_COMMAND = "dd bs=1 count=1 2>/dev/null"
+DOWNLOAD_COMMAND = f"{HANDSHAKE_COMMAND} && wc -c"
+UPLOAD_COMMAND = HANDSHAKE_COMMAND + " && head -c {size} /dev/urandom"
+# the first transfer each way, which sizes the measured one
+SAMPLE_BYTES = 256 * 1024
+# the measured transfer is sized to take about this long at the sampled speed
+TARGET_TRANSFER_SECONDS = 2
+NETWORK_SPEEDS_PREFIX = "network_speeds"
+# an executor's speeds are measured again once they are this old
+NETWORK_PROBE_INTERVAL = 60 * 60 * 6
+# last speeds stand in for probes that fail for this long after they were measured
+NETWORK_SPEEDS_RETENTION = 60 * 60 * 24
+# a probe waits this long for one of the prober's slots before it counts as failed
+NETWORK_PROBE_SLOT_TIMEOUT = 60
+# a transfer faster than the clock can tell apart is reported at this many seconds
+MIN_TRANSFER_SECONDS = 1e-3
+
+
+@lru_cache(maxsize=4)
+def random_payload(size: int) -> bytes:
+    """Random bytes sent for the download, generated once per size."""
+    return os.urandom(size)
+
+
+def _mbps(size: int, seconds: float) -> float:
+    return size * 8 / max(seconds, MIN_TRANSFER_SECONDS) / 1e6
+
+
+async def _handshake(process: asyncssh.SSHClientProcess) -> float:
+    """Have the remote command echo a byte, returning the round trip it took."""
+    sent_at = time.monotonic()
+    process.stdin.write(b"\0")
+    await process.stdout.readexactly(1)
+    return time.monotonic() - sent_at
+
+
+async def measure_upload(ssh_client: asyncssh.SSHClientConnection, size: int) -> float:
+    """Mbit/s of size random bytes sent by the executor to the validator."""
+    async with ssh_client.create_process(UPLOAD_COMMAND.format(size=size), encoding=None) as process:
+        await _handshake(process)
+        # the data leaves right behind the echo, on the same path
+        started_at = time.monotonic()
+        received = 0
+        while data := await process.stdout.read(THROUGHPUT_CHUNK_SIZE):
+            received += len(data)
+        elapsed = time.monotonic() - started_at
+
+    if received != size:
+        raise RuntimeError(f"Received {received} of {size} upload bytes")
+    return _mbps(size, elapsed)
+
+
+async def measure_download(ssh_client: asyncssh.SSHClientConnection, size: int) -> float:
+    """Mbit/s of size random bytes sent by the validator to the executor."""
+    payload = random_payload(size)
+    async with ssh_client.create_process(DOWNLOAD_COMMAND, encoding=None) as process:
+        round_trip = await _handshake(process)
+        started_at = time.monotonic()
+        for offset in range(0, size, THROUGHPUT_CHUNK_SIZE):
+            process.stdin.write(payload[offset:offset + THROUGHPUT_CHUNK_SIZE])
+            await process.stdin.drain()
+        process.stdin.write_eof()
+        output = await process.stdout.read()
+        # half a round trip for the last byte to arrive, half for wc to answer
+        elapsed = time.monotonic() - started_at - round_trip
+
+    received = int(output.strip() or 0)
+    if received != size:
+        raise RuntimeError(f"Executor received {received} of {size} download bytes")
+    return _mbps(size, elapsed)
+
+
+def probe_size(sample_speed: float, max_size: int) -> int:
+    """Bytes that take about TARGET_TRANSFER_SECONDS at sample_speed Mbit/s, at most max_size."""
+    size = int(sample_speed * 1e6 / 8 * TARGET_TRANSFER_SECONDS)
+    return max(min(size, max_size), min(SAMPLE_BYTES, max_size))
+
+
+async def _measure_sized(
+    measure: Callable, ssh_client: asyncssh.SSHClientConnection, max_size: int
+) -> tuple[float, int]:
+    """Speed of a sample transfer, then of one sized from it, with the bytes of the last."""
+    size = min(SAMPLE_BYTES, max_size)
+    speed = await measure(ssh_client, size)
+    if (sized := probe_size(speed, max_size)) > size:
+        size = sized
+        speed = await measure(ssh_client, size)
+    return speed, size
+
+
+async def measure_throughput(ssh_client: asyncssh.SSHClientConnection, max_size: int, timeout: float) -> dict:
+    """The network of a machine spec: upload and download speed in Mbit/s, one direction at a time."""
+    async with asyncio.timeout(timeout):
+        upload_speed, upload_bytes = await _measure_sized(measure_upload, ssh_client, max_size)
+        download_speed, download_bytes = await _measure_sized(measure_download, ssh_client, max_size)
+    return {
+        "upload_speed": upload_speed,
+        "download_speed": download_speed,
+        "upload_bytes": upload_bytes,
+        "download_bytes": download_bytes,
+    }
+
+
+def unmeasured(reason: str) -> dict:
+    """The network of an executor that could not be probed, whose speeds score zero."""
+    return {"upload_speed": None, "download_speed": None, "unmeasured": reason}
+
+
+class NetworkProber:
+    """Network probes of executors, at most concurrency at a time.
+
+    An executor whose speeds are recent enough is not probed again. A probe that
+    fails, by timing out, by erroring or by waiting too long for a slot, leaves
+    the executor with its last speeds, or unmeasured if it has none.
+    """
+
+    def __init__(self, redis_service: RedisService, concurrency: int, max_size: int, timeout: float):
+        self.redis_service = redis_service
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_size = max_size
+        self.timeout = timeout
+
+    @staticmethod
+    def _key(miner_hotkey: str, executor_uuid: str) -> str:
+        return f"{NETWORK_SPEEDS_PREFIX}:{miner_hotkey}:{executor_uuid}"
+
+    async def speeds(
+        self,
+        miner_hotkey: str,
+        executor_uuid: str,
+        connect: Callable[[], AbstractAsyncContextManager[asyncssh.SSHClientConnection]],
+    ) -> dict:
+        """The executor's network, probed over a connection from connect if it is due."""
+        key = self._key(miner_hotkey, executor_uuid)
+        last = await self.redis_service.get(key)
+        last = json.loads(last) if last else None
+        if last and time.time() - last["measured_at"] < NETWORK_PROBE_INTERVAL:
+            return last
+
+        try:
+            network = await self._probe(connect)
+        except Exception as e:
+            return {**last, "probe_error": repr(e)} if last else unmeasured(repr(e))
+
+        network["measured_at"] = time.time()
+        await self.redis_service.set(key, json.dumps(network), ex=NETWORK_SPEEDS_RETENTION)
+        return network
+
+    async def _probe(
+        self, connect: Callable[[], AbstractAsyncContextManager[asyncssh.SSHClientConnection]]
+    ) -> dict:
+        try:
+            async with asyncio.timeout(NETWORK_PROBE_SLOT_TIMEOUT):
+                await self.semaphore.acquire()
+        except TimeoutError:
+            raise TimeoutError("No network probe slot came free") from None
+
+        try:
+            async with connect() as ssh_client:
+                with NETWORK_PROBE_SECONDS.time():
+                    return await measure_throughput(ssh_client, self.max_size, self.timeout)
+        finally:
+            self.semaphore.release()
@@ -0,0 +1,397 @@
+import asyncio
+import filecmp
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from clients.subtensor_client import SubtensorClient
+from core.weights import WeightsEngine, convert_weights_for_emit
+from services.challenge_pool import HashChallengePool
+from services.hash_service import HashService
+from services.sftp_transfer import (
+    TRANSFER_CHANNELS,
+    SFTPTransfer,
+    TransferOptions,
+    TransferStats,
+    zstandard,
+)
+from services.throughput_probe import measure_throughput
+from testing.local_chain import LocalChain, LocalSubtensor
+from testing.local_ssh import LatencyProxy, LocalSSHServer
+from testing.loop_lag import LoopLagMonitor
+
+NETUID = 51
+
+
+def _make_chain(neurons: int, latency: float) -> LocalChain:
+    return LocalChain(
+        netuid=NETUID,
+        hotkeys=[f"hotkey-{uid}" for uid in range(neurons)],
+        latency=latency,
+    )
+
+
+async def _legacy_sync_cycle(chain: LocalChain, my_hotkey: str):
+    """Chain access of one sync() cycle before the persistent client."""
+    subtensor = LocalSubtensor(chain)
+    chain.rpc("connect")
+    subtensor.metagraph(NETUID)
+    current_block = subtensor.substrate.query("System", "Number", []).value
+    last_update = subtensor.substrate.query("SubtensorModule", "LastUpdate", [NETUID]).value
+    my_uid = subtensor.metagraph(NETUID).hotkeys.index(my_hotkey)
+    _ = current_block - last_update[my_uid]
+    subtensor.tempo(NETUID)
+    subtensor.substrate.query("SubtensorModule", "WeightsSetRateLimit", [NETUID])
+    subtensor.substrate.query("System", "Number", [])
+
+
+async def _client_sync_cycle(client: SubtensorClient, my_hotkey: str):
+    await client.refresh_block()
+    metagraph = await client.get_metagraph()
+    last_update = await client.get_last_update()
+    current_block = await client.get_current_block()
+    _ = current_block - last_update[metagraph.hotkeys.index(my_hotkey)]
+    await client.get_tempo()
+    await client.get_weights_rate_limit()
+    await client.get_current_block()
+
+
+async def benchmark_sync_stall(cycles: int = 5, latency: float = 0.05, neurons: int = 256) -> dict:
+    """Compare event-loop stall of the sync loop chain access, before and after."""
+    my_hotkey = "hotkey-0"
+    report = {}
+
+    chain = _make_chain(neurons, latency)
+    started_at = time.perf_counter()
+    async with LoopLagMonitor() as monitor:
+        for _ in range(cycles):
+            await _legacy_sync_cycle(chain, my_hotkey)
+            await asyncio.sleep(0)
+    report["legacy"] = {
+        **monitor.summary(),
+        "elapsed": time.perf_counter() - started_at,
+        "rpc_calls": sum(chain.calls.values()),
+    }
+
+    chain = _make_chain(neurons, latency)
+    client = SubtensorClient(
+        config=None, netuid=NETUID, subtensor_factory=lambda: LocalSubtensor(chain)
+    )
+    started_at = time.perf_counter()
+    async with LoopLagMonitor() as monitor:
+        for _ in range(cycles):
+            await _client_sync_cycle(client, my_hotkey)
+            await asyncio.sleep(0)
+    client.close()
+    report["client"] = {
+        **monitor.summary(),
+        "elapsed": time.perf_counter() - started_at,
+        "rpc_calls": sum(chain.calls.values()),
+    }
+
+    return report
+
+
+def _legacy_weights(subtensor: LocalSubtensor, metagraph, miners, miner_scores: dict):
+    """Weights computation of set_weights before the weights engine."""
+    from bittensor.utils.weight_utils import (
+        convert_weights_and_uids_for_emit,
+        process_weights_for_netuid,
+    )
+
+    uids = np.zeros(len(miners), dtype=np.int64)
+    weights = np.zeros(len(miners), dtype=np.float32)
+    for ind, miner in enumerate(miners):
+        uids[ind] = miner.uid
+        weights[ind] = miner_scores.get(miner.hotkey, 0.0)
+
+    processed_uids, processed_weights = process_weights_for_netuid(
+        uids=uids, weights=weights, netuid=NETUID, subtensor=subtensor, metagraph=metagraph
+    )
+    return convert_weights_and_uids_for_emit(uids=processed_uids, weights=processed_weights)
+
+
+def _engine_weights(engine: WeightsEngine, chain: LocalChain, metagraph, miners, miner_scores: dict):
+    engine.sync_metagraph(
+        metagraph.hotkeys,
+        active_uids=np.fromiter((miner.uid for miner in miners), dtype=np.int64, count=len(miners)),
+    )
+    engine.load_scores(miner_scores)
+    uids, weights = engine.compute(
+        min_allowed_weights=chain.min_allowed_weights,
+        max_weight_limit=chain.max_weight_limit,
+    )
+    return convert_weights_for_emit(uids=uids, weights=weights)
+
+
+def _best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started_at = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started_at)
+    return best
+
+
+def benchmark_weights(
+    sizes: tuple[int, ...] = (256, 1024, 4096),
+    repeats: int = 20,
+    max_weight_limit: float = 0.05,
+    seed: int = 0,
+) -> dict:
+    """Time the score to weights transform of set_weights, before and after, per subnet size."""
+    rng = np.random.default_rng(seed)
+    report = {}
+
+    for n in sizes:
+        chain = _make_chain(n, latency=0)
+        chain.max_weight_limit = max_weight_limit
+        subtensor = LocalSubtensor(chain)
+        metagraph = subtensor.metagraph(NETUID)
+        miners = metagraph.neurons
+
+        # most miners score, a handful dominate so that the max weight limit clips
+        scored = rng.random(n) < 0.8
+        values = rng.exponential(1.0, n) * np.where(rng.random(n) < 0.01, 100, 1)
+        miner_scores = {
+            f"hotkey-{uid}": float(values[uid]) for uid in range(n) if scored[uid]
+        }
+
+        engine = WeightsEngine()
+        expected = _legacy_weights(subtensor, metagraph, miners, miner_scores)
+        actual = _engine_weights(engine, chain, metagraph, miners, miner_scores)
+
+        legacy = _best_of(lambda: _legacy_weights(subtensor, metagraph, miners, miner_scores), repeats)
+        vectorized = _best_of(
+            lambda: _engine_weights(engine, chain, metagraph, miners, miner_scores), repeats
+        )
+        what_if = _best_of(
+            lambda: engine.compute(
+                min_allowed_weights=chain.min_allowed_weights,
+                max_weight_limit=chain.max_weight_limit,
+                overrides={"hotkey-0": 0.0},
+            ),
+            repeats,
+        )
+        report[n] = {
+            "legacy": legacy,
+            "engine": vectorized,
+            "what_if": what_if,
+            "speedup": legacy / vectorized if vectorized else float("inf"),
+            "matches_legacy": expected == actual,
+        }
+
+    return report
+
+
+def _make_transfer_payload(directory: str, size_mb: int) -> list[str]:
+    """A scrape bundle lookalike: one executable and shared libraries of this python."""
+    import glob
+    import sys
+
+    libraries = sorted(
+        glob.glob(os.path.join(sys.base_prefix, "lib", "**", "*.so*"), recursive=True),
+        key=os.path.getsize,
+        reverse=True,
+    )
+    paths = []
+    written = 0
+    for index, library in enumerate(libraries):
+        if written >= size_mb * (2**20):
+            break
+        path = os.path.join(directory, f"lib{index}.so")
+        shutil.copyfile(library, path)
+        written += os.path.getsize(path)
+        paths.append(path)
+
+    executable = os.path.join(directory, "machine_scrape")
+    with open(executable, "wb") as file:
+        file.write(os.urandom(2**20))
+    return [executable] + paths
+
+
+async def _legacy_put(ssh_client, files: list[tuple[str, str, str]]) -> TransferStats:
+    """upload_directory before the transfer engine, one default sftp put per file."""
+    started_at = time.perf_counter()
+    async with ssh_client.start_sftp_client() as sftp_client:
+        await asyncio.gather(*[sftp_client.put(local, remote) for local, remote, _ in files])
+    size = sum(os.path.getsize(local) for local, _, _ in files)
+    return TransferStats(
+        files=len(files), bytes=size, wire_bytes=size, seconds=time.perf_counter() - started_at
+    )
+
+
+async def benchmark_transfer(
+    latency: float = 0.1,
+    bandwidth_mbps: float | None = None,
+    size_mb: int = 32,
+    repeats: int = 3,
+) -> dict:
+    """Upload job files over a local ssh server behind a latency proxy, per transfer mode."""
+    import asyncssh
+
+    work_dir = tempfile.mkdtemp(prefix="benchmark_transfer_")
+    ssh_server = LocalSSHServer()
+    await ssh_server.start()
+    proxy = LatencyProxy(
+        ssh_server.port, latency, bandwidth_mbps * 1e6 if bandwidth_mbps else None
+    )
+    await proxy.start()
+
+    modes = {
+        "sftp_put": None,
+        "parallel": TransferOptions(channels=1),
+        f"parallel_{TRANSFER_CHANNELS}_channels": TransferOptions(),
+    }
+    if zstandard is not None and shutil.which("zstd"):
+        modes["parallel_zstd"] = TransferOptions(compression=True)
+
+    report = {}
+    try:
+        local_files = _make_transfer_payload(work_dir, size_mb)
+        remote_dir = os.path.join(work_dir, "remote")
+        os.makedirs(remote_dir)
+        files = [
+            (path, os.path.join(remote_dir, os.path.basename(path)), path) for path in local_files
+        ]
+
+        async with asyncssh.connect(
+            "127.0.0.1",
+            proxy.port,
+            username="benchmark",
+            known_hosts=None,
+            client_keys=None,
+        ) as ssh_client:
+            for mode, options in modes.items():
+                runs = []
+                for _ in range(repeats):
+                    if options is None:
+                        stats = await _legacy_put(ssh_client, files)
+                    else:
+                        # a new engine each run, compression is part of the cost
+                        stats = await SFTPTransfer(options).put_files(ssh_client, files, remote_zstd=True)
+                    runs.append(stats)
+
+                best = min(runs, key=lambda stats: stats.seconds)
+                report[mode] = {
+                    "seconds": best.seconds,
+                    "throughput_mbps": best.throughput * 8 / 1e6,
+                    "bytes": best.bytes,
+                    "wire_bytes": best.wire_bytes,
+                    "intact": all(
+                        filecmp.cmp(local, remote, shallow=False) for local, remote, _ in files
+                    ),
+                }
+    finally:
+        proxy.close()
+        ssh_server.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return report
+
+
+async def benchmark_throughput(
+    bandwidth_mbps: float = 100,
+    latency: float = 0.05,
+    size_mb: int = 16,
+    repeats: int = 5,
+) -> dict:
+    """Network probe speeds against a local ssh server behind a bandwidth limited proxy, per direction."""
+    import asyncssh
+
+    ssh_server = LocalSSHServer()
+    await ssh_server.start()
+    proxy = LatencyProxy(ssh_server.port, latency, bandwidth_mbps * 1e6)
+    await proxy.start()
+
+    runs = []
+    seconds = []
+    try:
+        async with asyncssh.connect(
+            "127.0.0.1",
+            proxy.port,
+            username="benchmark",
+            known_hosts=None,
+            client_keys=None,
+        ) as ssh_client:
+            for _ in range(repeats):
+                started_at = time.perf_counter()
+                runs.append(await measure_throughput(ssh_client, size_mb * 2**20, timeout=600))
+                seconds.append(time.perf_counter() - started_at)
+    finally:
+        proxy.close()
+        ssh_server.close()
+
+    report = {}
+    for direction in ("upload_speed", "download_speed"):
+        speeds = np.array([run[direction] for run in runs])
+        report[direction] = {
+            "mean_mbps": float(speeds.mean()),
+            "min_mbps": float(speeds.min()),
+            "max_mbps": float(speeds.max()),
+            # run to run variation, relative to the mean
+            "spread": float((speeds.max() - speeds.min()) / speeds.mean()),
+            # of the link rate, which also carries the ssh and tcp framing
+            "of_bandwidth": float(speeds.mean() / bandwidth_mbps),
+        }
+    report["probe"] = {
+        "seconds": float(np.mean(seconds)),
+        # as sized from the sample transfers, at most size_mb
+        "upload_bytes": [run["upload_bytes"] for run in runs],
+        "download_bytes": [run["download_bytes"] for run in runs],
+    }
+    return report
+
+
+async def benchmark_challenges(gpu_count: int = 14, num_digits: int = 11, count: int = 50) -> dict:
+    """Event-loop time per hashcat challenge, generated inline, in a thread and from the pool."""
+
+    async def inline() -> HashService:
+        return HashService.generate(gpu_count=gpu_count, num_digits=num_digits)
+
+    async def thread() -> HashService:
+        return await asyncio.to_thread(HashService.generate, gpu_count=gpu_count, num_digits=num_digits)
+
+    # the pool is filled before it is timed, and refills while it is
+    pool = HashChallengePool(pool_size=count, workers=2)
+    await pool.get(gpu_count, num_digits, timeout=60)
+    while pool.available(gpu_count, num_digits) < count:
+        await asyncio.sleep(0.1)
+    # nothing is kept ready, every challenge is generated on demand in a worker
+    on_demand_pool = HashChallengePool(pool_size=0, workers=2)
+    await on_demand_pool.get(gpu_count, num_digits, timeout=60)
+
+    modes = {
+        "inline": inline,
+        "thread": thread,
+        "pool": lambda: pool.get(gpu_count, num_digits, timeout=60),
+        "pool_on_demand": lambda: on_demand_pool.get(gpu_count, num_digits, timeout=60),
+    }
+    report = {}
+    try:
+        for mode, take in modes.items():
+            loop_time = 0.0
+            started_at = time.perf_counter()
+            async with LoopLagMonitor() as monitor:
+                for _ in range(count):
+                    hash_service = await take()
+                    # what _hashcat_stage does with it on the loop
+                    cpu_started_at = time.thread_time()
+                    _ = hash_service.payload, hash_service.answer
+                    loop_time += time.thread_time() - cpu_started_at
+            elapsed = time.perf_counter() - started_at
+            lag = monitor.summary()
+            report[mode] = {
+                "wall_per_challenge": elapsed / count,
+                # event-loop time is the stall the loop saw, plus using the challenge
+                "loop_time_per_challenge": (lag["total_stall"] + loop_time) / count,
+                "max_lag": lag["max_lag"],
+            }
+    finally:
+        await pool.close()
+        await on_demand_pool.close()
+
+    return report
@@ -0,0 +1,258 @@
+"""Fake miners and executors for load tests, with no GPU, docker or network.
+
+Miners speak the datura websocket protocol. All executors share one asyncssh
+server, told apart by ssh username, which answers the commands the validator runs:
+a machine scrape shim, a ``docker`` shim that starts and stops "containers" (a
+second asyncssh server accepting the container's ssh key) and a hashcat shim that
+looks the answer up in redis, where the load test records every challenge. Any
+other command, such as the file management around uploads or the network probe,
+runs in a local shell.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import resource
+from dataclasses import dataclass
+
+import asyncssh
+import redis.asyncio as aioredis
+from datura.requests.miner_requests import (
+    AcceptSSHKeyRequest,
+    ExecutorSSHInfo,
+    SSHKeyRemoved,
+)
+from datura.requests.validator_requests import (
+    AuthenticateRequest,
+    BaseValidatorRequest,
+    SSHPubKeyRemoveRequest,
+    SSHPubKeySubmitRequest,
+)
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+
+from services.const import LIB_NVIDIA_ML_DIGESTS
+from services.ssh_service import SSHService
+from services.throughput_probe import HANDSHAKE_COMMAND
+from testing.local_ssh import run_in_shell
+
+logger = logging.getLogger(__name__)
+
+ANSWERS_PREFIX = "load_test:answers"
+NVIDIA_DRIVER = "535.183.01"
+
+
+def answer_key(payload: str) -> str:
+    return f"{ANSWERS_PREFIX}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def raise_open_files_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def normalize_public_key(public_key: str) -> str:
+    # drop the comment, if any
+    return " ".join(public_key.split()[:2])
+
+
+@dataclass
+class FakeFleetConfig:
+    miners: int
+    executors_per_miner: int
+    encrypt_key: str
+    docker_hub_digests: dict[str, str]
+    redis_url: str
+    work_dir: str
+    gpu_model: str = "NVIDIA RTX A5000"
+    gpu_count: int = 1
+    job_time: float = 1.0
+    host: str = "127.0.0.1"
+
+
+class _SSHServer(asyncssh.SSHServer):
+    def __init__(self, authorized_keys: dict[str, set[str]]):
+        self.authorized_keys = authorized_keys
+
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def public_key_auth_supported(self) -> bool:
+        return True
+
+    def validate_public_key(self, username: str, key: asyncssh.SSHKey) -> bool:
+        public_key = normalize_public_key(key.export_public_key("openssh").decode("utf-8"))
+        return public_key in self.authorized_keys.get(username, set())
+
+
+class FakeFleet:
+    def __init__(self, config: FakeFleetConfig):
+        self.config = config
+        self.ssh_service = SSHService()
+        self.redis = aioredis.from_url(config.redis_url)
+
+        self.executor_keys: dict[str, set[str]] = {}
+        self.container_keys: dict[str, set[str]] = {}
+        self.executor_port = 0
+        self.container_port = 0
+        self.miner_ports: list[int] = []
+        self._servers = []
+
+        self.spec = json.dumps({
+            "gpu": {
+                "count": config.gpu_count,
+                "details": [{"name": config.gpu_model}] * config.gpu_count,
+                "driver": NVIDIA_DRIVER,
+            },
+            "md5_checksums": {"libnvidia_ml": LIB_NVIDIA_ML_DIGESTS[NVIDIA_DRIVER]},
+            "all_container_digests": [
+                {"name": name, "digest": digest}
+                for name, digest in config.docker_hub_digests.items()
+            ],
+            "os": "Ubuntu 22.04.4 LTS",
+        })
+
+    def executor_username(self, miner: int, executor: int) -> str:
+        return f"executor-{miner}-{executor}"
+
+    def executor_root_dir(self, username: str) -> str:
+        return os.path.join(self.config.work_dir, username)
+
+    def executors(self, miner: int) -> list[ExecutorSSHInfo]:
+        return [
+            ExecutorSSHInfo(
+                uuid=self.executor_username(miner, executor),
+                address=self.config.host,
+                port=self.executor_port,
+                ssh_username=self.executor_username(miner, executor),
+                ssh_port=self.executor_port,
+                python_path="python3",
+                root_dir=self.executor_root_dir(self.executor_username(miner, executor)),
+                port_mappings=json.dumps([[self.container_port, self.container_port]]),
+            )
+            for executor in range(self.config.executors_per_miner)
+        ]
+
+    async def run_command(self, username: str, command: str) -> tuple[str, int]:
+        """Return (stdout, exit status) of a command run on an executor."""
+        if command.startswith("chmod +x "):
+            return self.ssh_service._encrypt(self.config.encrypt_key, self.spec) + "\n", 0
+
+        if command.startswith("docker run "):
+            public_key = re.search(r'echo \\?"([^"\\]+)\\?"', command).group(1)
+            self.container_keys.setdefault(username, set()).add(normalize_public_key(public_key))
+            return hashlib.sha256(command.encode("utf-8")).hexdigest() + "\n", 0
+
+        if command.startswith("docker rm ") or command.startswith("docker container stop "):
+            self.container_keys.pop(username, None)
+            return "", 0
+
+        if "export PYTHONPATH=" in command:
+            payload = command[command.index("'") + 1:command.rindex("'")]
+            answer = await self.redis.get(answer_key(payload))
+            await asyncio.sleep(self.config.job_time)
+            return json.dumps({"answer": answer.decode("utf-8") if answer else ""}) + "\n", 0
+
+        # file management, e.g. the artifact cache, runs for real under work_dir
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+        return stdout.decode("utf-8"), process.returncode
+
+    async def handle_process(self, process: asyncssh.SSHServerProcess):
+        if (process.command or "").startswith(HANDSHAKE_COMMAND):
+            # the network probe streams stdin and stdout
+            await run_in_shell(process)
+            return
+
+        username = process.get_extra_info("username")
+        try:
+            stdout, exit_status = await self.run_command(username, process.command or "")
+        except Exception as e:
+            process.stderr.write(f"{e}\n".encode())
+            exit_status = 1
+        else:
+            process.stdout.write(stdout.encode("utf-8"))
+        process.exit(exit_status)
+
+    async def handle_miner(self, miner: int, connection: ServerConnection):
+        try:
+            await self._handle_miner(miner, connection)
+        except ConnectionClosed:
+            # the validator hung up first, as it does once a job is done
+            pass
+
+    async def _handle_miner(self, miner: int, connection: ServerConnection):
+        async for message in connection:
+            request = BaseValidatorRequest.parse(message)
+            if isinstance(request, AuthenticateRequest):
+                continue
+
+            executors = self.executors(miner)
+            public_key = normalize_public_key(request.public_key.decode("utf-8"))
+            if isinstance(request, SSHPubKeySubmitRequest):
+                for executor in executors:
+                    self.executor_keys.setdefault(executor.ssh_username, set()).add(public_key)
+                await connection.send(AcceptSSHKeyRequest(executors=executors).json())
+            elif isinstance(request, SSHPubKeyRemoveRequest):
+                for executor in executors:
+                    self.executor_keys.get(executor.ssh_username, set()).discard(public_key)
+                await connection.send(SSHKeyRemoved().json())
+
+    async def start(self):
+        host_key = asyncssh.generate_private_key("ssh-ed25519")
+
+        executor_server = await asyncssh.create_server(
+            lambda: _SSHServer(self.executor_keys),
+            self.config.host,
+            0,
+            server_host_keys=[host_key],
+            process_factory=self.handle_process,
+            sftp_factory=True,
+            encoding=None,
+            backlog=4096,
+        )
+        container_server = await asyncssh.create_server(
+            lambda: _SSHServer(self.container_keys),
+            self.config.host,
+            0,
+            server_host_keys=[host_key],
+            backlog=4096,
+        )
+        self.executor_port = executor_server.sockets[0].getsockname()[1]
+        self.container_port = container_server.sockets[0].getsockname()[1]
+        self._servers += [executor_server, container_server]
+
+        for miner in range(self.config.miners):
+            server = await serve(
+                lambda connection, miner=miner: self.handle_miner(miner, connection),
+                self.config.host,
+                0,
+                max_size=50 * (2**20),
+            )
+            self.miner_ports.append(server.sockets[0].getsockname()[1])
+            self._servers.append(server)
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+        await self.redis.aclose()
+
+
+def run_fleet(config: FakeFleetConfig, ready):
+    """Process entry point: serve a fleet and report its miner ports through ready."""
+    raise_open_files_limit()
+
+    async def main():
+        fleet = FakeFleet(config)
+        await fleet.start()
+        ready.put(fleet.miner_ports)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
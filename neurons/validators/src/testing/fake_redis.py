@@ -0,0 +1,60 @@
+"""A fakeredis server on a local TCP port, for load tests on machines without redis-server.
+
+Needs the fakeredis and lupa packages, which the validator itself does not depend
+on. The server runs in its own process, so that serving the fleet and the
+validator does not show up in the validator's event loop lag.
+"""
+import multiprocessing
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+FAKE_REDIS_START_TIMEOUT = 30
+
+
+def _serve(ready: multiprocessing.Queue):
+    from fakeredis import TcpFakeServer
+    from fakeredis._clients._tcp_server import TCPFakeRequestHandler
+
+    class RequestHandler(TCPFakeRequestHandler):
+        # the stock handler drops the connection after an error reply, such as the
+        # NOSCRIPT that makes redis-py load a script before running it again
+        def setup(self):
+            super().setup()
+            read_response = self.current_client.read_response
+
+            def read_response_or_error():
+                try:
+                    return read_response()
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    return e
+
+            self.current_client.read_response = read_response_or_error
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    server.RequestHandlerClass = RequestHandler
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+@contextmanager
+def fake_redis_server() -> Iterator[str]:
+    """Serve a throwaway fakeredis for the duration, yielding its url."""
+    try:
+        import fakeredis  # noqa: F401
+        import lupa  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            "Neither redis-server nor fakeredis with lupa is installed, pass the url of a running redis instead"
+        ) from e
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=_serve, args=(ready,), daemon=True)
+    process.start()
+    try:
+        yield f"redis://127.0.0.1:{ready.get(timeout=FAKE_REDIS_START_TIMEOUT)}"
+    finally:
+        process.terminate()
+        process.join()
@@ -0,0 +1,295 @@
+"""Drive the validator's sync cycle against a local fleet of fake miners.
+
+The fake miners and executors (testing.fake_miners) run in their own process so
+that they do not pollute the event loop lag, RSS and latencies measured on the
+validator, which runs here against a LocalChain and a local redis, with a hotkey
+made for the run. Nothing leaves the machine: redis is a throwaway redis-server,
+or fakeredis where there is none.
+"""
+import asyncio
+import multiprocessing
+import os
+import pathlib
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import bittensor
+import redis
+
+from clients.subtensor_client import SubtensorClient
+from core.config import settings
+from core.validator import Validator
+from payload_models.payloads import MinerJobEnryptedFiles
+from services.challenge_pool import HashChallengePool
+from services.docker_hub_digests import DockerHubDigests
+from services.docker_service import REPOSITORYS
+from services.redis_service import RedisService
+from testing.fake_miners import (
+    FakeFleetConfig,
+    answer_key,
+    raise_open_files_limit,
+    run_fleet,
+)
+from testing.fake_redis import fake_redis_server
+from testing.local_chain import LocalChain, LocalSubtensor
+from testing.loop_lag import LoopLagMonitor
+from testing.registry import LocalRegistry
+
+FLEET_START_TIMEOUT = 60
+ANSWERS_TTL = 60 * 60
+# most network probe bytes each way, enough to exercise it without the traffic of a real probe
+LOAD_TEST_NETWORK_PROBE_BYTES = 2**20
+LOAD_TEST_WALLET_NAME = "load-test"
+LOAD_TEST_HOTKEY_NAME = "validator"
+
+
+class StageTimer:
+    """Collect the latencies of async methods, wrapped on their instances."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, obj, name: str, stage=None):
+        fn = getattr(obj, name)
+
+        async def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                label = stage(*args, **kwargs) if callable(stage) else stage or name
+                self.samples[label].append(time.perf_counter() - started_at)
+
+        setattr(obj, name, timed)
+
+    def summary(self) -> dict:
+        report = {}
+        for stage, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            report[stage] = {
+                "count": len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+                "max": ordered[-1],
+            }
+        return report
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_redis(redis_url: str | None) -> Iterator[str]:
+    """Use redis_url, or start a throwaway redis-server, or fakeredis without one, for the run."""
+    if redis_url:
+        yield redis_url
+        return
+
+    redis_server = shutil.which("redis-server")
+    if redis_server is None:
+        with fake_redis_server() as redis_url:
+            yield redis_url
+        return
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [redis_server, "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        client = redis.Redis(port=port)
+        for _ in range(100):
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.05)
+        yield f"redis://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _throwaway_wallet(work_dir: str):
+    """Configure a wallet with a hotkey made for the run, only ever registered on the local chain."""
+    settings.BITTENSOR_WALLET_DIRECTORY = pathlib.Path(work_dir) / "wallets"
+    settings.BITTENSOR_WALLET_NAME = LOAD_TEST_WALLET_NAME
+    settings.BITTENSOR_WALLET_HOTKEY_NAME = LOAD_TEST_HOTKEY_NAME
+    wallet = bittensor.wallet(
+        name=LOAD_TEST_WALLET_NAME,
+        hotkey=LOAD_TEST_HOTKEY_NAME,
+        path=str(settings.BITTENSOR_WALLET_DIRECTORY),
+    )
+    wallet.create_new_hotkey(use_password=False, overwrite=True, suppress=True)
+    return settings.get_bittensor_wallet()
+
+
+def _make_job_files(work_dir: str) -> MinerJobEnryptedFiles:
+    # stand-ins of the obfuscated scripts, the fake executors never run them
+    tmp_directory = os.path.join(work_dir, "job_files")
+    os.makedirs(tmp_directory, exist_ok=True)
+    with open(os.path.join(tmp_directory, "machine_scrape"), "wb") as file:
+        file.write(os.urandom(1 << 20))
+    with open(os.path.join(tmp_directory, "score.py"), "w") as file:
+        file.write("print('score')\n")
+    return MinerJobEnryptedFiles(
+        encrypt_key="load-test-encrypt-key",
+        tmp_directory=tmp_directory,
+        machine_scrape_file_name="machine_scrape",
+        score_file_name="score.py",
+    )
+
+
+def _record_answers(challenge_pool: HashChallengePool, redis_service: RedisService):
+    """Record each challenge's answer for the fake hashcat shim."""
+    get = challenge_pool.get
+
+    async def get_and_record(*args, **kwargs):
+        hash_service = await get(*args, **kwargs)
+        await redis_service.set(answer_key(hash_service.payload), hash_service.answer, ex=ANSWERS_TTL)
+        return hash_service
+
+    challenge_pool.get = get_and_record
+
+
+def run_load_test(
+    miners: int = 256,
+    executors_per_miner: int = 8,
+    job_time: float = 1.0,
+    gpu_count: int = 1,
+    redis_url: str | None = None,
+    netuid: int = 51,
+) -> dict:
+    raise_open_files_limit()
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+    context = multiprocessing.get_context("spawn")
+    fleet_process = None
+
+    try:
+        with local_redis(redis_url) as redis_url:
+            encypted_files = _make_job_files(work_dir)
+            registry = LocalRegistry.for_repositories(REPOSITORYS)
+            docker_hub_digests = registry.digests()
+
+            ready = context.Queue()
+            fleet_process = context.Process(
+                target=run_fleet,
+                args=(
+                    FakeFleetConfig(
+                        miners=miners,
+                        executors_per_miner=executors_per_miner,
+                        encrypt_key=encypted_files.encrypt_key,
+                        docker_hub_digests=docker_hub_digests,
+                        redis_url=redis_url,
+                        work_dir=os.path.join(work_dir, "executors"),
+                        gpu_count=gpu_count,
+                        job_time=job_time,
+                    ),
+                    ready,
+                ),
+                daemon=True,
+            )
+            fleet_process.start()
+            miner_ports = ready.get(timeout=FLEET_START_TIMEOUT)
+
+            wallet = _throwaway_wallet(work_dir)
+            settings.BITTENSOR_NETUID = netuid
+            redis_address = urlparse(redis_url)
+            settings.REDIS_HOST, settings.REDIS_PORT = redis_address.hostname, redis_address.port
+            settings.JOB_DISPATCH = "local"
+            # every executor shares the one fake fleet process
+            settings.NETWORK_PROBE_BYTES = LOAD_TEST_NETWORK_PROBE_BYTES
+
+            # uid 0 is the validator, every other uid a miner
+            chain = LocalChain(
+                netuid=netuid,
+                hotkeys=[wallet.hotkey.ss58_address] + [f"miner-{uid}" for uid in range(miners)],
+                miner_ports=[0] + miner_ports,
+            )
+            chain.neurons[0].axon_info.is_serving = False
+
+            validator = Validator(
+                subtensor_client=SubtensorClient(
+                    config=None, netuid=netuid, subtensor_factory=lambda: LocalSubtensor(chain)
+                ),
+            )
+            validator.file_encrypt_service.ecrypt_miner_job_files = lambda: encypted_files
+
+            # the validator's redis connections live on the loop it was created on
+            loop = asyncio.get_event_loop()
+            loop.run_until_complete(registry.start())
+            validator.docker_service.digest_cache = DockerHubDigests(
+                validator.redis_service, auth_url=registry.auth_url, registry_url=registry.url
+            )
+
+            timer = StageTimer()
+            task_service = validator.miner_service.task_service
+            _record_answers(task_service.challenge_pool, validator.redis_service)
+            timer.wrap(validator.miner_service, "request_job_to_miner", "miner")
+            timer.wrap(validator, "handle_job_result", "score_miner")
+            timer.wrap(task_service, "create_task", "executor")
+            timer.wrap(task_service, "upload_directory", "upload")
+            timer.wrap(task_service, "docker_connection_check", "docker_check")
+            timer.wrap(
+                task_service,
+                "_run_task",
+                lambda *args, **kwargs: "scrape" if "chmod +x" in kwargs["command"] else "hashcat",
+            )
+
+            async def run_cycle() -> dict:
+                rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                async with LoopLagMonitor() as monitor:
+                    # the chain starts long after the validator last set weights, so
+                    # they are due at once, but there are no scores to set them with
+                    # until the first pass has run its job batch
+                    started_at = time.perf_counter()
+                    await validator.sync()
+                    makespan = time.perf_counter() - started_at
+                    scored = sum(score > 0 for score in validator.miner_scores.values())
+
+                    # the second pass sets weights from the batch's scores
+                    started_at = time.perf_counter()
+                    await validator.sync()
+                    weights_seconds = time.perf_counter() - started_at
+                uids, _ = chain.weights.get(chain.neurons[0].uid, ([], []))
+                return {
+                    "makespan": makespan,
+                    "weights_seconds": weights_seconds,
+                    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                    "rss_before_mb": rss_before / 1024,
+                    "loop_lag": monitor.summary(),
+                    "scored_miners": scored,
+                    "weighted_miners": len(uids),
+                }
+
+            # the first challenges wait for the worker processes to start otherwise
+            loop.run_until_complete(task_service.challenge_pool.wait_refilled())
+            report = loop.run_until_complete(run_cycle())
+            loop.run_until_complete(task_service.pipeline.close())
+            loop.run_until_complete(task_service.challenge_pool.close())
+            loop.run_until_complete(validator.ssh_pool.close())
+            loop.run_until_complete(registry.close())
+            validator.subtensor_client.close()
+
+            return {
+                "miners": miners,
+                "executors_per_miner": executors_per_miner,
+                **report,
+                "stages": timer.summary(),
+            }
+    finally:
+        if fleet_process is not None:
+            fleet_process.terminate()
+            fleet_process.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
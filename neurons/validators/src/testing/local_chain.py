@@ -0,0 +1,192 @@
+"""In-memory stand-in for the subtensor chain.
+
+Implements the subset of ``bittensor.subtensor`` the validator relies on, with an
+optional per-call latency that blocks the calling thread exactly like a real
+substrate websocket round trip does.
+"""
+import asyncio
+import hashlib
+import time
+from collections.abc import AsyncIterator
+from types import SimpleNamespace
+
+from core.scheduler import BlockSource
+
+
+class LocalChain:
+    def __init__(
+        self,
+        netuid: int,
+        hotkeys: list[str],
+        tempo: int = 360,
+        weights_rate_limit: int = 100,
+        start_block: int = 1_000_000,
+        block_time: float = 12,
+        latency: float = 0.0,
+        miner_address: str = "127.0.0.1",
+        miner_ports: list[int] | None = None,
+    ):
+        self.netuid = netuid
+        self.tempo = tempo
+        self.weights_rate_limit = weights_rate_limit
+        self.block_time = block_time
+        self.latency = latency
+        self.min_allowed_weights = 1
+        self.max_weight_limit = 1.0
+
+        self._start_block = start_block
+        self._started_at = time.monotonic()
+        self._block_offset = 0
+        self._hash_to_block: dict[str, int] = {}
+
+        self.neurons = [
+            SimpleNamespace(
+                uid=uid,
+                hotkey=hotkey,
+                axon_info=SimpleNamespace(
+                    hotkey=hotkey,
+                    ip=miner_address,
+                    port=miner_ports[uid] if miner_ports else 8000 + uid,
+                    is_serving=True,
+                ),
+            )
+            for uid, hotkey in enumerate(hotkeys)
+        ]
+        self.last_update = [0] * len(hotkeys)
+        self.weights: dict[int, tuple[list[int], list[int]]] = {}
+        self.calls: dict[str, int] = {}
+
+    @property
+    def block(self) -> int:
+        elapsed = time.monotonic() - self._started_at
+        if self.block_time > 0:
+            return self._start_block + int(elapsed / self.block_time) + self._block_offset
+        return self._start_block + self._block_offset
+
+    def advance(self, blocks: int = 1):
+        self._block_offset += blocks
+
+    def rpc(self, name: str):
+        """Account for one chain round trip."""
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def block_hash(self, block: int) -> str:
+        block_hash = "0x" + hashlib.sha256(str(block).encode()).hexdigest()
+        self._hash_to_block[block_hash] = block
+        return block_hash
+
+    def block_timestamp(self, block_hash: str | None) -> int:
+        head = self.block
+        block = self._hash_to_block.get(block_hash, head)
+        return int((time.time() - (head - block) * self.block_time) * 1000)
+
+
+class LocalMetagraph:
+    def __init__(self, chain: LocalChain):
+        self.netuid = chain.netuid
+        self.block = chain.block
+        self.neurons = list(chain.neurons)
+        self.hotkeys = [neuron.hotkey for neuron in self.neurons]
+        self.uids = [neuron.uid for neuron in self.neurons]
+        self.axons = [neuron.axon_info for neuron in self.neurons]
+        self.n = len(self.neurons)
+
+
+class _QueryResult:
+    def __init__(self, value):
+        self.value = value
+
+
+class LocalSubstrate:
+    def __init__(self, chain: LocalChain):
+        self.chain = chain
+
+    def query(self, module: str, storage_function: str, params=None, block_hash=None):
+        self.chain.rpc(f"{module}.{storage_function}")
+        if (module, storage_function) == ("System", "Number"):
+            return _QueryResult(self.chain.block)
+        if (module, storage_function) == ("SubtensorModule", "WeightsSetRateLimit"):
+            return _QueryResult(self.chain.weights_rate_limit)
+        if (module, storage_function) == ("SubtensorModule", "LastUpdate"):
+            return _QueryResult(list(self.chain.last_update))
+        if (module, storage_function) == ("SubtensorModule", "Tempo"):
+            return _QueryResult(self.chain.tempo)
+        if (module, storage_function) == ("Timestamp", "Now"):
+            return _QueryResult(self.chain.block_timestamp(block_hash))
+        raise ValueError(f"Unsupported storage query {module}.{storage_function}")
+
+    def get_block_hash(self, block: int) -> str:
+        self.chain.rpc("get_block_hash")
+        return self.chain.block_hash(block)
+
+
+class LocalSubtensor:
+    def __init__(self, chain: LocalChain):
+        self.chain = chain
+        self.substrate = LocalSubstrate(chain)
+
+    def tempo(self, netuid: int, block=None) -> int:
+        self.chain.rpc("tempo")
+        return self.chain.tempo
+
+    def min_allowed_weights(self, netuid: int, block=None) -> int:
+        self.chain.rpc("min_allowed_weights")
+        return self.chain.min_allowed_weights
+
+    def max_weight_limit(self, netuid: int, block=None) -> float:
+        self.chain.rpc("max_weight_limit")
+        return self.chain.max_weight_limit
+
+    def metagraph(self, netuid: int, lite: bool = True, block=None) -> LocalMetagraph:
+        # a metagraph download is far heavier than a single storage query
+        self.chain.rpc("metagraph")
+        if self.chain.latency:
+            time.sleep(self.chain.latency * 4)
+        return LocalMetagraph(self.chain)
+
+    def is_hotkey_registered(self, netuid: int, hotkey_ss58: str, block=None) -> bool:
+        self.chain.rpc("is_hotkey_registered")
+        return any(neuron.hotkey == hotkey_ss58 for neuron in self.chain.neurons)
+
+    def set_weights(
+        self,
+        wallet,
+        netuid: int,
+        uids,
+        weights,
+        wait_for_inclusion: bool = False,
+        wait_for_finalization: bool = False,
+        **kwargs,
+    ) -> tuple[bool, str]:
+        self.chain.rpc("set_weights")
+        hotkey = wallet.hotkey.ss58_address
+        uid = next(
+            (neuron.uid for neuron in self.chain.neurons if neuron.hotkey == hotkey), None
+        )
+        if uid is None:
+            return False, f"Hotkey {hotkey} is not registered"
+        block = self.chain.block
+        if block - self.chain.last_update[uid] < self.chain.weights_rate_limit:
+            return False, "Too soon to set weights"
+        self.chain.weights[uid] = (list(uids), list(weights))
+        self.chain.last_update[uid] = block
+        return True, ""
+
+
+class LocalBlockSource(BlockSource):
+    """Yield blocks of a LocalChain without touching its RPC counters."""
+
+    def __init__(self, chain: LocalChain, interval: float = 0.05):
+        self.chain = chain
+        self.interval = interval
+
+    async def blocks(self) -> AsyncIterator[int]:
+        last_block = None
+        while True:
+            block = self.chain.block
+            if block != last_block:
+                last_block = block
+                yield block
+            await asyncio.sleep(self.interval)
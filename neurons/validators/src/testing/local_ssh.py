@@ -0,0 +1,140 @@
+"""A local ssh server running commands in a shell, behind a proxy adding link latency."""
+import asyncio
+import os
+import signal
+import time
+
+import asyncssh
+
+READ_SIZE = 64 * 1024
+
+
+class _OpenSSHServer(asyncssh.SSHServer):
+    def begin_auth(self, username: str) -> bool:
+        return False
+
+
+async def run_in_shell(process: asyncssh.SSHServerProcess):
+    # in a session of its own, so that killing it also kills what the shell started
+    local = await asyncio.create_subprocess_shell(
+        process.command or "true",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+
+    def kill():
+        try:
+            os.killpg(local.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def feed():
+        try:
+            while data := await process.stdin.read(READ_SIZE):
+                local.stdin.write(data)
+                await local.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except asyncssh.SignalReceived:
+            kill()
+        finally:
+            local.stdin.close()
+
+    async def pipe(reader: asyncio.StreamReader, writer: asyncssh.SSHWriter):
+        try:
+            while data := await reader.read(READ_SIZE):
+                writer.write(data)
+                await writer.drain()
+        except (BrokenPipeError, ConnectionError, asyncssh.Error):
+            # the client closed the channel, stop the command like sshd would
+            if local.returncode is None:
+                kill()
+
+    feeder = asyncio.create_task(feed())
+    await asyncio.gather(pipe(local.stdout, process.stdout), pipe(local.stderr, process.stderr))
+    exit_status = await local.wait()
+    feeder.cancel()
+    if not process.channel.is_closing():
+        process.exit(exit_status)
+
+
+class LatencyProxy:
+    """Forward TCP connections, delaying every chunk by half the round trip each way.
+
+    With bandwidth set, chunks are also paced to that many bits per second, per
+    direction of each connection.
+    """
+
+    def __init__(self, target_port: int, latency: float, bandwidth: float | None = None):
+        self.target_port = target_port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.port = 0
+        self._server: asyncio.Server | None = None
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def deliver():
+            sent_until = 0.0
+            while (item := await queue.get()) is not None:
+                deliver_at, data = item
+                if self.bandwidth:
+                    sent_until = max(sent_until, time.monotonic()) + len(data) * 8 / self.bandwidth
+                    deliver_at = max(deliver_at, sent_until)
+                await asyncio.sleep(max(0, deliver_at - time.monotonic()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        delivery = asyncio.create_task(deliver())
+        try:
+            while data := await reader.read(READ_SIZE):
+                queue.put_nowait((time.monotonic() + self.latency / 2, data))
+        except ConnectionError:
+            pass
+        finally:
+            queue.put_nowait(None)
+            await delivery
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+        await asyncio.gather(
+            self._pump(client_reader, server_writer),
+            self._pump(server_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+
+class LocalSSHServer:
+    """Accept any client on localhost and run its commands, with sftp, in a local shell."""
+
+    def __init__(self):
+        self.port = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncssh.create_server(
+            _OpenSSHServer,
+            "127.0.0.1",
+            0,
+            server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+            process_factory=run_in_shell,
+            sftp_factory=True,
+            encoding=None,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a periodic timer.
+
+    Any time a coroutine (or a blocking call made from one) holds the loop, the
+    ticker oversleeps; the overshoot is the stall every other task experienced.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+        self._tick_started_at = 0.0
+
+    async def _run(self):
+        while True:
+            self._tick_started_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(
+                max(time.perf_counter() - self._tick_started_at - self.interval, 0)
+            )
+
+    def start(self):
+        self.samples = []
+        self._tick_started_at = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # the loop may have been blocked for the whole run, count the tick in flight
+            pending = time.perf_counter() - self._tick_started_at - self.interval
+            if pending > 0:
+                self.samples.append(pending)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"samples": 0, "max_lag": 0, "p99_lag": 0, "total_stall": 0}
+        ordered = sorted(self.samples)
+        return {
+            "samples": len(ordered),
+            "max_lag": ordered[-1],
+            "p99_lag": ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)],
+            # a lag above a few timer periods means the loop was blocked
+            "total_stall": sum(lag for lag in ordered if lag > self.interval),
+        }
@@ -0,0 +1,106 @@
+"""In-memory stand-in for the Docker Hub token service and registry API.
+
+Serves the token, tag list and manifest HEAD endpoints DockerHubDigests uses,
+honours If-None-Match with 304s like Docker Hub does and counts the requests it
+gets, so that tests can point the digest cache at it and check what was sent.
+"""
+import hashlib
+import json
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+from services.docker_hub_digests import MANIFEST_ACCEPT
+
+
+def fake_digest(name: str) -> str:
+    return "sha256:" + hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+class LocalRegistry:
+    def __init__(self, repositories: dict[str, dict[str, str]], token_expires_in: int = 300):
+        # repository -> tag -> digest
+        self.repositories = repositories
+        self.token_expires_in = token_expires_in
+        self.requests: Counter = Counter()
+        self.port = 0
+        self._tokens: set[str] = set()
+        self._runner: web.AppRunner | None = None
+
+    @classmethod
+    def for_repositories(cls, repositories: list[str], tags: int = 3) -> "LocalRegistry":
+        """Serve the repository list of the validator, with a few tags for the untagged ones."""
+        contents: dict[str, dict[str, str]] = {}
+        for repo in repositories:
+            repository, specified_tag = repo.split(":", 1) if ":" in repo else (repo, None)
+            for tag in [specified_tag] if specified_tag else [f"v{index}" for index in range(tags)]:
+                contents.setdefault(repository, {})[tag] = fake_digest(f"{repository}:{tag}")
+        return cls(contents)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def auth_url(self) -> str:
+        return f"{self.url}/token"
+
+    def digests(self) -> dict[str, str]:
+        return {
+            f"{repository}:{tag}": digest
+            for repository, tags in self.repositories.items()
+            for tag, digest in tags.items()
+        }
+
+    def _authorize(self, request: web.Request):
+        if request.headers.get("Authorization", "").removeprefix("Bearer ") not in self._tokens:
+            raise web.HTTPUnauthorized()
+
+    async def _token(self, request: web.Request) -> web.Response:
+        self.requests["token"] += 1
+        token = uuid.uuid4().hex
+        self._tokens.add(token)
+        return web.json_response({"token": token, "expires_in": self.token_expires_in})
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        self.requests["tags"] += 1
+        self._authorize(request)
+        repository = request.match_info["repository"]
+        if repository not in self.repositories:
+            raise web.HTTPNotFound()
+
+        tags = sorted(self.repositories[repository])
+        etag = '"' + hashlib.sha256(json.dumps(tags).encode("utf-8")).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.requests["tags_not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response({"name": repository, "tags": tags}, headers={"ETag": etag})
+
+    async def _manifest(self, request: web.Request) -> web.Response:
+        self.requests["manifest"] += 1
+        self._authorize(request)
+        digest = self.repositories.get(request.match_info["repository"], {}).get(request.match_info["tag"])
+        if digest is None:
+            raise web.HTTPNotFound()
+
+        headers = {"ETag": f'"{digest}"', "Docker-Content-Digest": digest, "Content-Type": MANIFEST_ACCEPT}
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            self.requests["manifest_not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(headers=headers)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/token", self._token)
+        app.router.add_get("/v2/{repository:.+}/tags/list", self._tags)
+        app.router.add_route("HEAD", "/v2/{repository:.+}/manifests/{tag}", self._manifest)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
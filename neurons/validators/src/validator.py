@@ -7,6 +7,7 @@ from fastapi import FastAPI
 from core.config import settings
 from core.utils import configure_logs_of_other_modules, wait_for_services_sync
 from core.validator import Validator
+from routes.metrics import metrics_router
 
 configure_logs_of_other_modules()
 wait_for_services_sync()
@@ -31,6 +32,7 @@ app = FastAPI(
 )
 
 # app.include_router(apis_router)
+app.include_router(metrics_router)
 
 reload = True if settings.ENV == "dev" else False
 
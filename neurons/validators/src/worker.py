@@ -0,0 +1,28 @@
+import asyncio
+import logging
+
+from core.config import settings
+from core.utils import configure_logs_of_other_modules, wait_for_services_sync
+from services.ioc import ioc
+
+logger = logging.getLogger(__name__)
+configure_logs_of_other_modules()
+
+
+wait_for_services_sync()
+
+
+async def run_forever():
+    logger.info("Job worker started")
+    ioc["TaskService"].warm_challenge_pool()
+    await ioc["JobDispatchService"].run_worker(concurrency=settings.JOB_WORKER_CONCURRENCY)
+
+
+def start_process():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run_forever())
+
+
+if __name__ == "__main__":
+    start_process()
@@ -0,0 +1,43 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# the validator runs from src, with its packages at the top level
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+# settings the validator has no defaults for, never used to reach a chain or database here
+for name, value in {
+    "BITTENSOR_WALLET_NAME": "test",
+    "BITTENSOR_WALLET_HOTKEY_NAME": "test",
+    "BITTENSOR_NETUID": "0",
+    "BITTENSOR_NETWORK": "local",
+    "SQLALCHEMY_DATABASE_URI": "postgresql://test",
+    "ASYNC_SQLALCHEMY_DATABASE_URI": "postgresql+asyncpg://test",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis_service(monkeypatch):
+    """A RedisService on fakeredis, which runs the Lua scripts with lupa.
+
+    Every RedisService made while the fixture is in use shares its data.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    from services import redis_service as redis_service_module
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis_service_module.aioredis, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=server)
+    )
+    service = redis_service_module.RedisService()
+    yield service
+    await service.redis.aclose()
@@ -0,0 +1,86 @@
+import os
+import stat
+
+import asyncssh
+import pytest
+
+from services.artifact_cache import ARTIFACT_CACHE_DIR_NAME, ArtifactCache
+from testing.local_ssh import LocalSSHServer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def ssh_client():
+    server = LocalSSHServer()
+    await server.start()
+    async with asyncssh.connect(
+        "127.0.0.1", server.port, username="test", known_hosts=None, client_keys=None
+    ) as connection:
+        yield connection
+    server.close()
+
+
+@pytest.fixture
+def local_dir(tmp_path):
+    local_dir = tmp_path / "local"
+    (local_dir / "lib").mkdir(parents=True)
+    (local_dir / "run").write_bytes(b"#!/bin/sh\necho run\n")
+    (local_dir / "run").chmod(0o755)
+    (local_dir / "lib" / "data.bin").write_bytes(os.urandom(300_000))
+    (local_dir / "lib" / "copy.bin").write_bytes((local_dir / "lib" / "data.bin").read_bytes())
+    return local_dir
+
+
+def _is_executable(path) -> bool:
+    return bool(os.stat(path).st_mode & stat.S_IXUSR)
+
+
+async def test_upload_sends_each_blob_once(ssh_client, local_dir, tmp_path):
+    remote_dir = tmp_path / "remote" / "job"
+    cache = ArtifactCache()
+
+    stats = await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+
+    assert (stats.files, stats.uploaded_files) == (3, 2)
+    for path in ("run", "lib/data.bin", "lib/copy.bin"):
+        assert (remote_dir / path).read_bytes() == (local_dir / path).read_bytes()
+    assert _is_executable(remote_dir / "run")
+    assert not _is_executable(remote_dir / "lib" / "data.bin")
+
+    # cached blobs keep the mode of executables
+    (remote_dir / "stale").write_text("left from the last job")
+    stats = await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+
+    assert stats.uploaded_files == 0
+    assert _is_executable(remote_dir / "run")
+    assert not (remote_dir / "stale").exists()
+
+
+async def test_manifest_is_built_once_per_build(ssh_client, local_dir, tmp_path):
+    remote_dir = tmp_path / "remote" / "job"
+    cache = ArtifactCache()
+    await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+
+    (local_dir / "run").write_bytes(b"#!/bin/sh\necho run again\n")
+    stats = await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+    assert stats.uploaded_files == 0
+
+    cache.invalidate(str(local_dir))
+    stats = await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+    assert stats.uploaded_files == 1
+    assert (remote_dir / "run").read_bytes() == b"#!/bin/sh\necho run again\n"
+
+
+async def test_corrupted_blob_is_sent_again(ssh_client, local_dir, tmp_path):
+    remote_dir = tmp_path / "remote" / "job"
+    cache = ArtifactCache()
+    await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+
+    manifest = await cache.get_manifest(str(local_dir))
+    digest = next(artifact.digest for artifact in manifest if artifact.path == "run")
+    (tmp_path / "remote" / ARTIFACT_CACHE_DIR_NAME / digest).write_bytes(b"tampered")
+
+    stats = await cache.upload_directory(ssh_client, str(local_dir), str(remote_dir))
+    assert stats.uploaded_files == 1
+    assert (remote_dir / "run").read_bytes() == (local_dir / "run").read_bytes()
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from services.docker_hub_digests import DIGEST_MAX_STALE, DIGEST_TTL, DockerHubDigests
+from services.redis_service import RedisService
+from testing.registry import LocalRegistry, fake_digest
+
+pytestmark = pytest.mark.anyio
+
+REPOSITORIES = ["daturaai/compute-subnet-executor", "daturaai/pytorch:latest"]
+
+
+@pytest.fixture
+async def registry():
+    registry = LocalRegistry.for_repositories(REPOSITORIES)
+    await registry.start()
+    yield registry
+    await registry.close()
+
+
+def _digests(registry: LocalRegistry, redis_service: RedisService) -> DockerHubDigests:
+    return DockerHubDigests(redis_service, auth_url=registry.auth_url, registry_url=registry.url)
+
+
+def _age(digests: DockerHubDigests, seconds: float):
+    for entry in digests._entries.values():
+        entry.fetched_at -= seconds
+
+
+async def _refreshed(digests: DockerHubDigests):
+    await asyncio.gather(*digests._refreshing.values())
+
+
+def _push(registry: LocalRegistry, repository: str, tag: str) -> str:
+    """A new image for the tag, as if it had been pushed again."""
+    digest = registry.repositories[repository][tag] = fake_digest(f"{repository}:{tag}:pushed")
+    return digest
+
+
+async def test_first_get_fetches_every_tag(registry, redis_service):
+    digests = _digests(registry, redis_service)
+
+    assert await digests.get(REPOSITORIES) == registry.digests()
+    assert registry.requests["tags"] == 1
+    assert registry.requests["manifest"] == len(registry.digests())
+
+
+async def test_fresh_digests_are_served_from_the_cache(registry, redis_service):
+    digests = _digests(registry, redis_service)
+    await digests.get(REPOSITORIES)
+    requests = registry.requests.copy()
+
+    assert await digests.get(REPOSITORIES) == registry.digests()
+    # another validator process finds them in redis
+    assert await _digests(registry, redis_service).get(REPOSITORIES) == registry.digests()
+    assert registry.requests == requests
+
+
+async def test_stale_digests_are_served_while_refreshing(registry, redis_service):
+    digests = _digests(registry, redis_service)
+    before = await digests.get(REPOSITORIES)
+    _age(digests, DIGEST_TTL + 1)
+    pushed = _push(registry, "daturaai/compute-subnet-executor", "v0")
+
+    assert await digests.get(REPOSITORIES) == before
+    await _refreshed(digests)
+
+    after = await digests.get(REPOSITORIES)
+    assert after["daturaai/compute-subnet-executor:v0"] == pushed
+    assert after == registry.digests()
+    # only the pushed tag came back with a new manifest, the rest were not modified
+    assert registry.requests["tags_not_modified"] == 1
+    assert registry.requests["manifest_not_modified"] == len(before) - 1
+
+
+async def test_too_stale_digests_wait_for_the_refresh(registry, redis_service):
+    digests = _digests(registry, redis_service)
+    await digests.get(REPOSITORIES)
+    _age(digests, DIGEST_MAX_STALE + 1)
+    pushed = _push(registry, "daturaai/pytorch", "latest")
+
+    assert (await digests.get(REPOSITORIES))["daturaai/pytorch:latest"] == pushed
+
+
+async def test_too_stale_digests_are_kept_when_the_registry_is_down(registry, redis_service):
+    digests = _digests(registry, redis_service)
+    before = await digests.get(REPOSITORIES)
+    _age(digests, DIGEST_MAX_STALE + 1)
+    await registry.close()
+
+    assert await digests.get(REPOSITORIES) == before
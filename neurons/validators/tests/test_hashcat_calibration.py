@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from services import hashcat_calibration
+from services.hashcat_calibration import (
+    HashcatTimings,
+    calibrate,
+    load_hashcat_configs,
+    robust_percentiles,
+)
+
+BASE_CONFIGS = {"A100": {"digits": 11, "average_time": [10.0, 20.0, 30.0]}}
+
+
+def test_robust_percentiles_drop_outliers():
+    stats = robust_percentiles([10.0, 10.5, 9.5, 10.2, 9.8, 500.0])
+
+    assert stats["samples"] == 5
+    assert 9.5 <= stats["p10"] <= stats["p50"] <= stats["p90"] <= 10.5
+
+
+def test_calibrate_replaces_timings_with_enough_samples():
+    configs = calibrate(
+        {
+            ("A100", 1, 11): [12.0] * 20,
+            ("A100", 2, 11): [25.0] * 5,
+            # other digits are not comparable
+            ("A100", 3, 12): [31.0] * 20,
+        },
+        base_configs=BASE_CONFIGS,
+    )
+
+    assert configs["A100"]["average_time"] == [12.0, 20.0, 30.0]
+    assert configs["A100"]["calibration"]["samples"] == [20, 0, 0]
+    # the built-in table is left as it was
+    assert BASE_CONFIGS["A100"]["average_time"] == [10.0, 20.0, 30.0]
+
+
+def test_calibrate_caps_how_far_a_run_moves_a_known_timing():
+    configs = calibrate(
+        {("A100", 1, 11): [100.0] * 20, ("A100", 2, 11): [1.0] * 20},
+        base_configs=BASE_CONFIGS,
+        max_factor=1.5,
+    )
+
+    assert configs["A100"]["average_time"] == [15.0, 20.0 / 1.5, 30.0]
+    # the measured median is kept for review
+    assert configs["A100"]["calibration"]["p50"][:2] == [100.0, 1.0]
+
+
+def test_calibrate_new_model():
+    configs = calibrate(
+        {("H200", 1, 12): [5.0] * 20, ("H200", 3, 12): [9.0] * 20},
+        base_configs=BASE_CONFIGS,
+    )
+
+    assert configs["H200"]["digits"] == 12
+    assert configs["H200"]["average_time"] == [5.0, 5.0, 9.0]
+
+
+def test_load_rejects_invalid_timings(tmp_path):
+    path = tmp_path / "hashcat_configs.json"
+    path.write_text(json.dumps({"A100": {"digits": 11, "average_time": [10, -1]}}))
+
+    with pytest.raises(ValueError):
+        load_hashcat_configs(str(path))
+
+
+@pytest.mark.anyio
+async def test_timings_are_written_on_flush(redis_service, monkeypatch):
+    monkeypatch.setattr(hashcat_calibration, "HASHCAT_TIMINGS_MAX_SAMPLES", 3)
+    timings = HashcatTimings(redis_service)
+
+    for job_taken_time in (1.0, 2.0, 3.0, 4.0):
+        timings.record("NVIDIA A100:80GB", 2, 11, job_taken_time)
+    assert await timings.load() == {}
+
+    await timings.flush()
+    timings.record("NVIDIA A100:80GB", 2, 11, 5.0)
+    await timings.flush()
+
+    # newest first, capped
+    assert await timings.load() == {("NVIDIA A100:80GB", 2, 11): [5.0, 4.0, 3.0]}
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from payload_models.payloads import MinerJobEnryptedFiles, MinerJobRequestPayload
+from services import job_dispatch_service
+from services.job_dispatch_service import JOB_SHARD_QUEUE, JobDispatchService
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeTaskService:
+    def __init__(self):
+        self.flushes = 0
+
+    async def flush_hashcat_timings(self):
+        self.flushes += 1
+
+
+class FakeMinerService:
+    """Scores "ok" miners, times out "slow" ones and fails "bad" ones."""
+
+    def __init__(self):
+        self.calls = []
+        self.task_service = FakeTaskService()
+
+    async def request_job_with_deadline(
+        self, payload, encypted_files, docker_hub_digests, timeout, raise_errors=False
+    ):
+        self.calls.append((payload.miner_hotkey, timeout, raise_errors))
+        assert os.path.exists(os.path.join(encypted_files.tmp_directory, "score.py"))
+        if payload.miner_hotkey.startswith("slow"):
+            return None
+        if payload.miner_hotkey.startswith("bad"):
+            raise RuntimeError("miner unreachable")
+        return payload.miner_hotkey, {"score": 1}
+
+
+@pytest.fixture
+def encypted_files(tmp_path):
+    (tmp_path / "score.py").write_text("print(1)")
+    return MinerJobEnryptedFiles(
+        encrypt_key="key",
+        tmp_directory=str(tmp_path),
+        machine_scrape_file_name="scrape.py",
+        score_file_name="score.py",
+    )
+
+
+def _payloads(*miner_hotkeys: str) -> list[MinerJobRequestPayload]:
+    return [
+        MinerJobRequestPayload(
+            job_batch_id="Unknown", miner_hotkey=miner_hotkey, miner_address="127.0.0.1", miner_port=1
+        )
+        for miner_hotkey in miner_hotkeys
+    ]
+
+
+async def _dispatch(service: JobDispatchService, payloads, encypted_files) -> list:
+    return [
+        finished
+        async for finished in service.dispatch(
+            job_batch_id="Unknown",
+            payloads=payloads,
+            encypted_files=encypted_files,
+            docker_hub_digests={},
+            shard_size=2,
+        )
+    ]
+
+
+async def _run_shards(service: JobDispatchService, shards: int):
+    while shards:
+        message = await service.redis_service.brpop(JOB_SHARD_QUEUE, timeout=0.1)
+        if message is None:
+            await asyncio.sleep(0.01)
+            continue
+        await service.run_shard(json.loads(message))
+        shards -= 1
+
+
+async def test_timeouts_and_errors_are_reported_apart(redis_service, encypted_files, caplog):
+    miner_service = FakeMinerService()
+    service = JobDispatchService(miner_service=miner_service, redis_service=redis_service)
+    worker = asyncio.create_task(_run_shards(service, shards=2))
+    finished = await _dispatch(service, _payloads("ok-1", "slow-1", "bad-1"), encypted_files)
+    await worker
+
+    assert finished == [("ok-1", {"score": 1})]
+    # workers run jobs under the relative timeout, errors come back as errors
+    assert {(timeout, raise_errors) for _, timeout, raise_errors in miner_service.calls} == {
+        (job_dispatch_service.MINER_JOB_TIMEOUT, True)
+    }
+    assert [r.getMessage() for r in caplog.records if "Job failed on worker" in r.getMessage()]
+    # one flush of the hashcat job times per shard
+    assert miner_service.task_service.flushes == 2
+
+
+async def test_dispatches_of_one_job_batch_id_do_not_mix(redis_service, encypted_files):
+    service = JobDispatchService(miner_service=FakeMinerService(), redis_service=redis_service)
+    worker = asyncio.create_task(_run_shards(service, shards=2))
+    first, second = await asyncio.gather(
+        _dispatch(service, _payloads("ok-1", "ok-2"), encypted_files),
+        _dispatch(service, _payloads("ok-3"), encypted_files),
+    )
+    await worker
+
+    assert sorted(first) == [("ok-1", {"score": 1}), ("ok-2", {"score": 1})]
+    assert second == [("ok-3", {"score": 1})]
+
+
+async def test_unclaimed_shards_are_taken_back(redis_service, encypted_files, monkeypatch):
+    monkeypatch.setattr(job_dispatch_service, "MINER_JOB_TIMEOUT", 0)
+    monkeypatch.setattr(job_dispatch_service, "JOB_QUEUE_TIMEOUT", 0.2)
+    monkeypatch.setattr(job_dispatch_service, "JOB_POLL_INTERVAL", 0.1)
+    service = JobDispatchService(miner_service=FakeMinerService(), redis_service=redis_service)
+
+    assert await _dispatch(service, _payloads("ok-1", "ok-2", "ok-3"), encypted_files) == []
+    assert await redis_service.lrange(JOB_SHARD_QUEUE) == []
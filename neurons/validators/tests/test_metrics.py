@@ -0,0 +1,66 @@
+import pytest
+
+from core import metrics
+from core.metrics import Counter, Gauge, Histogram
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [])
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage_seconds", "Stage time.", ("stage",), buckets=(1, 0.5, 2))
+    child = histogram.labels("upload")
+    for value in (0.1, 0.5, 0.7, 2, 5):
+        child.observe(value)
+
+    assert histogram.render().splitlines() == [
+        "# HELP stage_seconds Stage time.",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="upload",le="0.5"} 2',
+        'stage_seconds_bucket{stage="upload",le="1"} 3',
+        'stage_seconds_bucket{stage="upload",le="2"} 4',
+        'stage_seconds_bucket{stage="upload",le="+Inf"} 5',
+        'stage_seconds_sum{stage="upload"} 8.3',
+        'stage_seconds_count{stage="upload"} 5',
+    ]
+
+
+def test_histogram_without_labels_is_exported_from_the_start():
+    histogram = Histogram("wait_seconds", "Wait.", buckets=(1,))
+
+    assert histogram.render().splitlines()[2:] == [
+        'wait_seconds_bucket{le="1"} 0',
+        'wait_seconds_bucket{le="+Inf"} 0',
+        "wait_seconds_sum 0",
+        "wait_seconds_count 0",
+    ]
+
+
+def test_label_values_and_help_are_escaped():
+    counter = Counter("failures_total", "Failures,\nby \\reason.", ("reason",))
+    counter.labels('say "hi"\\\n').inc(2)
+
+    assert counter.render().splitlines() == [
+        "# HELP failures_total Failures,\\nby \\\\reason.",
+        "# TYPE failures_total counter",
+        'failures_total{reason="say \\"hi\\"\\\\\\n"} 2',
+    ]
+
+
+def test_wrong_labels_are_rejected():
+    counter = Counter("failures_total", "Failures.", ("reason",))
+
+    with pytest.raises(ValueError):
+        counter.labels()
+
+
+def test_render_all_metrics():
+    Gauge("in_flight", "In flight.").set(1.5)
+    Counter("done_total", "Done.").inc()
+
+    assert metrics.render() == (
+        "# HELP in_flight In flight.\n# TYPE in_flight gauge\nin_flight 1.5\n"
+        "# HELP done_total Done.\n# TYPE done_total counter\ndone_total 1\n"
+    )
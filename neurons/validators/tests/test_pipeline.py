@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from core.pipeline import Stage, StagedPipeline
+
+pytestmark = pytest.mark.anyio
+
+
+async def _on_error(job, e: Exception):
+    return ("error", job, str(e))
+
+
+async def test_jobs_go_through_every_stage():
+    seen = []
+
+    async def first(job):
+        seen.append(("first", job))
+
+    async def second(job):
+        seen.append(("second", job))
+        return job * 2
+
+    pipeline = StagedPipeline([Stage("first", first, 2), Stage("second", second, 2)], queue_size=4, on_error=_on_error)
+    try:
+        assert await asyncio.gather(*[pipeline.submit(job) for job in range(5)]) == [0, 2, 4, 6, 8]
+    finally:
+        await pipeline.close()
+
+    assert sorted(seen) == sorted([("first", job) for job in range(5)] + [("second", job) for job in range(5)])
+    assert pipeline.stats["second"].processed == 5
+
+
+async def test_result_leaves_before_the_next_stage():
+    async def first(job):
+        return "early" if job == "stop" else None
+
+    async def second(job):
+        return "late"
+
+    pipeline = StagedPipeline([Stage("first", first, 1), Stage("second", second, 1)], queue_size=1, on_error=_on_error)
+    try:
+        assert await pipeline.submit("stop") == "early"
+        assert await pipeline.submit("go") == "late"
+    finally:
+        await pipeline.close()
+
+    assert pipeline.stats["second"].processed == 1
+
+
+async def test_errors_become_results():
+    async def stage(job):
+        raise ValueError("broken")
+
+    pipeline = StagedPipeline([Stage("only", stage, 1)], queue_size=1, on_error=_on_error)
+    try:
+        assert await pipeline.submit("job") == ("error", "job", "broken")
+    finally:
+        await pipeline.close()
+
+    assert pipeline.stats["only"].failed == 1
+
+
+async def test_result_is_handed_over_before_finish():
+    finish_started = asyncio.Event()
+    release_finish = asyncio.Event()
+    finished = []
+
+    async def stage(job):
+        return job
+
+    async def on_finish(job):
+        finish_started.set()
+        await release_finish.wait()
+        finished.append(job)
+
+    pipeline = StagedPipeline([Stage("only", stage, 1)], queue_size=1, on_error=_on_error, on_finish=on_finish)
+    try:
+        assert await asyncio.wait_for(pipeline.submit("job"), timeout=1) == "job"
+        await finish_started.wait()
+        assert finished == []
+        release_finish.set()
+        await asyncio.sleep(0)
+        assert finished == ["job"]
+    finally:
+        await pipeline.close()
+
+
+async def test_worker_survives_a_cancelled_handler():
+    async def stage(job):
+        if job == "cancelled":
+            raise asyncio.CancelledError()
+        return job
+
+    # a single worker, which must still be there for the second job
+    pipeline = StagedPipeline([Stage("only", stage, 1)], queue_size=1, on_error=_on_error)
+    try:
+        with pytest.raises(RuntimeError, match="only stage was interrupted"):
+            await asyncio.wait_for(pipeline.submit("cancelled"), timeout=1)
+        assert await asyncio.wait_for(pipeline.submit("next"), timeout=1) == "next"
+    finally:
+        await pipeline.close()
+
+
+async def test_jobs_whose_caller_stopped_waiting_are_dropped():
+    release = asyncio.Event()
+    ran = []
+
+    async def first(job):
+        await release.wait()
+
+    async def second(job):
+        ran.append(job)
+        return job
+
+    pipeline = StagedPipeline([Stage("first", first, 1), Stage("second", second, 1)], queue_size=1, on_error=_on_error)
+    try:
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(pipeline.submit("abandoned"), timeout=0.05)
+        release.set()
+        assert await asyncio.wait_for(pipeline.submit("waited"), timeout=1) == "waited"
+    finally:
+        await pipeline.close()
+
+    assert ran == ["waited"]
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pytest
+from datura.requests.miner_requests import ExecutorSSHInfo
+
+from services import port_allocator
+from services.port_allocator import (
+    FAILED_PORT_SECONDS,
+    KNOWN_GOOD_PORT_MAPS,
+    PORT_LEASE_SECONDS,
+    PortAllocator,
+    candidate_port_maps,
+)
+
+pytestmark = pytest.mark.anyio
+
+MINER = "miner"
+
+
+def _executor(port_range: str | None = None, port_mappings: list | None = None) -> ExecutorSSHInfo:
+    return ExecutorSSHInfo(
+        uuid="executor",
+        address="127.0.0.1",
+        port=8000,
+        ssh_username="root",
+        ssh_port=22,
+        python_path="python",
+        root_dir="/root",
+        port_range=port_range,
+        port_mappings=json.dumps(port_mappings) if port_mappings is not None else None,
+    )
+
+
+@pytest.fixture
+def allocator(redis_service):
+    return PortAllocator(redis_service)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The allocator's time, moved forward by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(port_allocator.time, "time", lambda: now[0])
+    return now
+
+
+def test_candidates_follow_the_executor_ports():
+    mappings = [[22, 22], [9000, 40000], [9001, 40001]]
+    assert sorted(candidate_port_maps(_executor(port_mappings=mappings))) == [(9000, 40000), (9001, 40001)]
+    assert sorted(candidate_port_maps(_executor(port_range="22, 5000,5001"))) == [(5000, 5000), (5001, 5001)]
+
+    ranged = candidate_port_maps(_executor(port_range="20-30"), count=100)
+    assert sorted(ranged) == [(port, port) for port in range(20, 31) if port != 22]
+    assert candidate_port_maps(_executor(port_range="22-22")) == []
+
+    default = candidate_port_maps(_executor())
+    assert len(default) == len(set(default)) == port_allocator.PORT_CANDIDATES
+    assert all(40000 <= internal == external <= 65535 for internal, external in default)
+
+
+async def test_concurrent_allocations_get_different_ports(allocator, clock):
+    executor = _executor(port_range="5000-5003")
+
+    port_maps = await asyncio.gather(*[allocator.allocate(MINER, executor) for _ in range(6)])
+
+    leased = [port_map for port_map in port_maps if port_map]
+    assert sorted(leased) == [(port, port) for port in range(5000, 5004)]
+    assert port_maps.count(None) == 2
+
+
+async def test_lease_ends_on_release_or_expiry(allocator, clock):
+    executor = _executor(port_range="5000")
+    port_map = await allocator.allocate(MINER, executor)
+    assert await allocator.allocate(MINER, executor) is None
+
+    await allocator.release(MINER, executor.uuid, port_map)
+    assert await allocator.allocate(MINER, executor) == port_map
+
+    clock[0] += PORT_LEASE_SECONDS + 1
+    assert await allocator.allocate(MINER, executor) == port_map
+
+
+async def test_failed_ports_are_not_tried_again_for_a_while(allocator, clock):
+    executor = _executor(port_range="5000")
+    port_map = await allocator.allocate(MINER, executor)
+    await allocator.release(MINER, executor.uuid, port_map, ok=False)
+
+    assert await allocator.allocate(MINER, executor) is None
+    clock[0] += FAILED_PORT_SECONDS + 1
+    assert await allocator.allocate(MINER, executor) == port_map
+
+
+async def test_known_good_ports_are_leased_newest_first(allocator, clock):
+    executor = _executor(port_range=f"5000-{5000 + KNOWN_GOOD_PORT_MAPS + 1}")
+    port_maps = [await allocator.allocate(MINER, executor) for _ in range(KNOWN_GOOD_PORT_MAPS + 2)]
+    for port_map in port_maps:
+        clock[0] += 1
+        await allocator.release(MINER, executor.uuid, port_map, ok=True)
+    newest = port_maps[-1]
+
+    leased = await allocator.lease_known_good(MINER, executor.uuid, count=KNOWN_GOOD_PORT_MAPS + 5)
+    assert len(leased) == KNOWN_GOOD_PORT_MAPS
+    assert leased[0] == newest
+    # all of them are in use now
+    assert await allocator.lease_known_good(MINER, executor.uuid, count=1) == []
+
+    for port_map in leased:
+        await allocator.release(MINER, executor.uuid, port_map)
+    await allocator.reset(MINER, executor.uuid)
+    assert await allocator.lease_known_good(MINER, executor.uuid, count=1) == []
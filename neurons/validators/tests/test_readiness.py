@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from core.readiness import wait_until
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_ready_after_a_few_probes():
+    attempts = 0
+
+    async def probe():
+        nonlocal attempts
+        attempts += 1
+        return attempts == 3
+
+    assert await wait_until(probe, timeout=5)
+    assert attempts == 3
+
+
+async def test_gives_up_at_the_deadline():
+    async def probe():
+        return False
+
+    started_at = time.monotonic()
+    assert not await wait_until(probe, timeout=0.2)
+    assert 0.2 <= time.monotonic() - started_at < 1
+
+
+async def test_raising_probe_is_not_ready_yet():
+    attempts = 0
+
+    async def probe():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise ConnectionRefusedError()
+        return True
+
+    assert await wait_until(probe, timeout=5)
+    assert attempts == 3
+
+
+async def test_hanging_probe_is_cut_short():
+    async def probe():
+        await asyncio.sleep(60)
+        return True
+
+    started_at = time.monotonic()
+    assert not await wait_until(probe, timeout=0.2)
+    assert time.monotonic() - started_at < 1
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from services.redis_service import (
+    EXECUTOR_COUNTS_RETENTION,
+    MINER_SCORES_EPOCH_KEY,
+    RedisService,
+    executor_counts_key,
+    miner_scores_key,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_record_job_results(redis_service):
+    await redis_service.rollover_miner_scores(epoch=100)
+
+    rollups = await redis_service.record_job_results(
+        {"a": 1.5, "b": 2},
+        [("a", "batch-1", {"total": 4}), ("b", "batch-1", {"total": 2})],
+    )
+    assert rollups == {
+        "a": {"jobs": 1, "min_executors": 4, "max_executors": 4},
+        "b": {"jobs": 1, "min_executors": 2, "max_executors": 2},
+    }
+
+    rollups = await redis_service.record_job_results({"a": 1}, [("a", "batch-2", {"total": 6})])
+    assert rollups == {"a": {"jobs": 2, "min_executors": 4, "max_executors": 6}}
+
+    assert await redis_service.get_miner_scores() == ("100", {"a": 2.5, "b": 2.0})
+    counts = await redis_service.redis.hgetall(executor_counts_key("100", "a"))
+    assert json.loads(counts[b"batch-2"]) == {"total": 6}
+    assert 0 < await redis_service.redis.ttl(executor_counts_key("100", "a")) <= EXECUTOR_COUNTS_RETENTION
+
+
+async def test_record_nothing(redis_service):
+    assert await redis_service.record_job_results({}, []) == {}
+    assert await redis_service.get_miner_scores() == ("0", {})
+
+
+async def test_rollover_carries_scores(redis_service):
+    await redis_service.rollover_miner_scores(epoch=100)
+    await redis_service.record_job_results({"a": 3, "b": 1}, [])
+
+    await redis_service.rollover_miner_scores(epoch=200, carried={"a": 0.5})
+
+    assert await redis_service.get_miner_scores() == ("200", {"a": 0.5})
+    # the used scores stay around for inspection until they expire
+    assert await redis_service.redis.ttl(miner_scores_key("100")) > 0
+
+
+async def test_results_follow_a_rollover_by_another_validator(redis_service):
+    await redis_service.rollover_miner_scores(epoch=100)
+    await redis_service.record_job_results({"a": 1}, [])
+
+    other = RedisService()
+    await other.rollover_miner_scores(epoch=200)
+
+    # the stale epoch is refused by the script and read again
+    await redis_service.record_job_results({"a": 2}, [("a", "batch", {"total": 1})])
+    assert await redis_service.get_miner_scores() == ("200", {"a": 2.0})
+    assert await redis_service.redis.exists(executor_counts_key("200", "a"))
+    assert not await redis_service.redis.exists(executor_counts_key("100", "a"))
+
+
+async def test_migrate_json_scores(redis_service):
+    redis = redis_service.redis
+    await redis.set("miner_scores", json.dumps({"a": 1.5}))
+    await redis.hset("executor_counts:a", "batch", json.dumps({"total": 3}))
+
+    await redis_service.migrate_legacy_keys(epoch=100)
+
+    assert await redis_service.get_miner_scores() == ("100", {"a": 1.5})
+    assert await redis.hgetall(executor_counts_key("100", "a")) == {
+        b"batch": json.dumps({"total": 3}).encode()
+    }
+    assert not await redis.exists("miner_scores", "executor_counts:a")
+
+
+async def test_migrate_epoch_scores(redis_service):
+    redis = redis_service.redis
+    await redis.set("miner_scores:epoch", "90")
+    await redis.hset("miner_scores:90", "a", 2)
+    await redis.hset("miner_scores:80", "a", 7)
+    await redis.hset("executor_counts:90:a", "batch", json.dumps({"total": 3}))
+
+    await redis_service.migrate_legacy_keys(epoch=100)
+
+    assert await redis_service.get_miner_scores() == ("90", {"a": 2.0})
+    assert await redis.exists(executor_counts_key("90", "a"))
+    assert not await redis.exists("miner_scores:epoch", "miner_scores:90", "executor_counts:90:a")
+    # earlier epochs were used already and are left to expire
+    assert await redis.exists("miner_scores:80")
+
+
+async def test_migrate_once(redis_service):
+    await redis_service.rollover_miner_scores(epoch=100)
+    await redis_service.record_job_results({"a": 1}, [("a", "batch", {"total": 3})])
+
+    await redis_service.migrate_legacy_keys(epoch=200)
+
+    assert await redis_service.redis.get(MINER_SCORES_EPOCH_KEY) == b"100"
+    assert await redis_service.get_miner_scores() == ("100", {"a": 1.0})
+    assert await redis_service.redis.exists(executor_counts_key("100", "a"))
@@ -0,0 +1,63 @@
+import time
+
+import asyncssh
+import pytest
+
+from services.remote_command import OutputLimitExceeded, run_command
+from testing.local_ssh import LocalSSHServer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def ssh_client():
+    server = LocalSSHServer()
+    await server.start()
+    async with asyncssh.connect(
+        "127.0.0.1", server.port, username="test", known_hosts=None, client_keys=None
+    ) as connection:
+        yield connection
+    server.close()
+
+
+async def test_output_is_split_into_lines(ssh_client):
+    output = await run_command(
+        ssh_client, "printf 'one\\r\\ntwo\\nthree'; echo oops >&2", timeout=10
+    )
+
+    assert output.stdout == ["one", "two", "three"]
+    assert output.stderr == ["oops"]
+    assert output.result is None
+
+
+async def test_output_over_the_cap_stops_the_command(ssh_client):
+    started_at = time.monotonic()
+    with pytest.raises(OutputLimitExceeded):
+        await run_command(ssh_client, "yes; sleep 30", timeout=20, max_bytes=100_000)
+    assert time.monotonic() - started_at < 10
+
+
+async def test_stderr_counts_toward_the_cap(ssh_client):
+    with pytest.raises(OutputLimitExceeded):
+        await run_command(ssh_client, "yes >&2", timeout=20, max_bytes=100_000)
+
+
+async def test_timeout_stops_the_command(ssh_client):
+    started_at = time.monotonic()
+    with pytest.raises(TimeoutError):
+        await run_command(ssh_client, "echo started; sleep 30", timeout=0.5)
+    assert time.monotonic() - started_at < 5
+
+
+async def test_result_line_ends_the_command_early(ssh_client):
+    started_at = time.monotonic()
+    output = await run_command(
+        ssh_client,
+        "echo progress; echo '{\"answer\": 42}'; sleep 30",
+        timeout=20,
+        is_result=lambda line: line.startswith("{"),
+    )
+
+    assert output.result == '{"answer": 42}'
+    assert output.stdout == ["progress", '{"answer": 42}']
+    assert time.monotonic() - started_at < 5
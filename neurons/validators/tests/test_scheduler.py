@@ -0,0 +1,124 @@
+import pytest
+
+from core.scheduler import (
+    WEIGHTS_WINDOW_BLOCKS,
+    BlockScheduler,
+    BlockSource,
+    EpochBoundary,
+    JobWindowOpened,
+    WeightsWindowOpened,
+    scoring_epoch,
+)
+
+pytestmark = pytest.mark.anyio
+
+NETUID = 1
+TEMPO = 99
+BLOCKS_FOR_JOB = 50
+
+
+class ListBlockSource(BlockSource):
+    def __init__(self, blocks: list[int]):
+        self._blocks = blocks
+
+    async def blocks(self):
+        for block in self._blocks:
+            yield block
+
+
+class FakeSubtensorClient:
+    def __init__(self, tempo: int | Exception = TEMPO):
+        self.tempo = tempo
+        self.observed = []
+
+    def observe_block(self, block: int):
+        self.observed.append(block)
+
+    async def get_tempo(self) -> int:
+        if isinstance(self.tempo, Exception):
+            raise self.tempo
+        return self.tempo
+
+
+def _scheduler(blocks: list[int], subtensor_client=None) -> BlockScheduler:
+    return BlockScheduler(
+        block_source=ListBlockSource(blocks),
+        subtensor_client=subtensor_client or FakeSubtensorClient(),
+        netuid=NETUID,
+        blocks_for_job=BLOCKS_FOR_JOB,
+    )
+
+
+async def _events(scheduler: BlockScheduler) -> list:
+    return [event async for event in scheduler.events()]
+
+
+async def test_epoch_boundary():
+    # epoch 1 starts at block 98, epoch 2 at block 198
+    events = await _events(_scheduler([96, 97, 98, 99, 198]))
+
+    assert [event for event in events if isinstance(event, EpochBoundary)] == [
+        EpochBoundary(block=98, epoch=1),
+        EpochBoundary(block=198, epoch=2),
+    ]
+
+
+async def test_no_epoch_boundary_on_the_first_block():
+    events = await _events(_scheduler([98]))
+
+    assert not [event for event in events if isinstance(event, EpochBoundary)]
+
+
+async def test_weights_window_until_weights_are_set():
+    window_start = 198 - WEIGHTS_WINDOW_BLOCKS
+    scheduler = _scheduler([])
+
+    assert not [
+        event
+        for event in await scheduler.events_for_block(window_start - 1)
+        if isinstance(event, WeightsWindowOpened)
+    ]
+    for block in (window_start, window_start + 1):
+        assert WeightsWindowOpened(
+            block=block, epoch=1, blocks_till_epoch=198 - block - 1
+        ) in await scheduler.events_for_block(block)
+
+    scheduler.weights_set(1)
+    assert not [
+        event
+        for event in await scheduler.events_for_block(window_start + 2)
+        if isinstance(event, WeightsWindowOpened)
+    ]
+    # the next epoch has a window of its own
+    assert WeightsWindowOpened(
+        block=window_start + TEMPO + 1, epoch=2, blocks_till_epoch=WEIGHTS_WINDOW_BLOCKS - 1
+    ) in await scheduler.events_for_block(window_start + TEMPO + 1)
+
+
+async def test_job_window_once_even_when_blocks_are_skipped():
+    events = await _events(_scheduler([100, 101, 149, 153, 260, 261]))
+
+    assert [event for event in events if isinstance(event, JobWindowOpened)] == [
+        JobWindowOpened(block=100, job_block=100),
+        JobWindowOpened(block=153, job_block=150),
+        JobWindowOpened(block=260, job_block=250),
+    ]
+
+
+async def test_blocks_are_observed_and_failures_skipped():
+    subtensor_client = FakeSubtensorClient(tempo=RuntimeError("chain down"))
+
+    events = await _events(_scheduler([100, 101], subtensor_client))
+
+    assert events == []
+    assert subtensor_client.observed == [100, 101]
+
+
+def test_scoring_epoch_moves_on_when_the_weights_window_opens():
+    # epoch 1 starts at block 98, its weights window at 98 + 100 - 20
+    window_start = 98 + TEMPO + 1 - WEIGHTS_WINDOW_BLOCKS
+    assert scoring_epoch(98, NETUID, TEMPO) == 1
+    assert scoring_epoch(window_start - 1, NETUID, TEMPO) == 1
+    assert scoring_epoch(window_start, NETUID, TEMPO) == 2
+    assert scoring_epoch(98 + TEMPO, NETUID, TEMPO) == 2
+    assert scoring_epoch(window_start + TEMPO + 1, NETUID, TEMPO) == 3
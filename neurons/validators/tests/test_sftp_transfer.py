@@ -0,0 +1,16 @@
+import logging
+
+from services import sftp_transfer
+from services.sftp_transfer import SFTPTransfer, TransferOptions
+
+
+def test_missing_zstandard_is_warned_once(monkeypatch, caplog):
+    monkeypatch.setattr(sftp_transfer, "zstandard", None)
+    sftp_transfer._warn_zstandard_missing.cache_clear()
+
+    with caplog.at_level(logging.WARNING, logger=sftp_transfer.__name__):
+        SFTPTransfer()
+        transfers = [SFTPTransfer(TransferOptions(compression=True)) for _ in range(2)]
+
+    assert not any(transfer.compression_enabled for transfer in transfers)
+    assert len([r for r in caplog.records if "zstandard" in r.getMessage()]) == 1
@@ -0,0 +1,101 @@
+import asyncssh
+import pytest
+
+from services.ssh_pool import SSH_POOL_IDLE_TIMEOUT, SSH_POOL_MAX_LIFETIME, SSHConnectionPool
+from testing.local_ssh import LocalSSHServer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def ssh_server():
+    server = LocalSSHServer()
+    await server.start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+async def pool():
+    pool = SSHConnectionPool()
+    yield pool
+    await pool.close()
+
+
+@pytest.fixture
+def client_key():
+    return asyncssh.generate_private_key("ssh-ed25519")
+
+
+def _connect(pool: SSHConnectionPool, ssh_server: LocalSSHServer, client_key):
+    return pool.connect(host="127.0.0.1", port=ssh_server.port, username="test", client_key=client_key)
+
+
+def _pooled(pool: SSHConnectionPool):
+    return [pooled for connections in pool._connections.values() for pooled in connections]
+
+
+async def test_recently_used_connections_are_kept(pool, ssh_server, client_key):
+    async with _connect(pool, ssh_server, client_key) as connection:
+        pass
+
+    assert pool.reap() == 0
+    assert not connection.is_closed()
+    async with _connect(pool, ssh_server, client_key) as reused:
+        assert reused is connection
+
+
+async def test_idle_connections_are_closed(pool, ssh_server, client_key):
+    async with _connect(pool, ssh_server, client_key) as connection:
+        pass
+    (pooled,) = _pooled(pool)
+    pooled.last_used -= SSH_POOL_IDLE_TIMEOUT + 1
+
+    assert pool.reap() == 1
+    await connection.wait_closed()
+    assert _pooled(pool) == []
+    assert pool._locks == {}
+
+
+async def test_expired_connections_are_closed_once_released(pool, ssh_server, client_key):
+    async with _connect(pool, ssh_server, client_key) as connection:
+        (pooled,) = _pooled(pool)
+        pooled.created_at -= SSH_POOL_MAX_LIFETIME + 1
+        pooled.last_used -= SSH_POOL_IDLE_TIMEOUT + 1
+        # still leased, however old
+        assert pool.reap() == 0
+        assert (await connection.run("echo leased", check=True)).stdout == "leased\n"
+
+    assert pool.reap() == 1
+    await connection.wait_closed()
+
+    async with _connect(pool, ssh_server, client_key) as new_connection:
+        assert new_connection is not connection
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        asyncssh.ConnectionLost("connection lost"),
+        asyncssh.ChannelOpenError(asyncssh.OPEN_CONNECT_FAILED, "too many sessions"),
+        BrokenPipeError(),
+    ],
+)
+async def test_connection_errors_discard_the_connection(pool, ssh_server, client_key, error):
+    with pytest.raises(type(error)):
+        async with _connect(pool, ssh_server, client_key) as connection:
+            raise error
+
+    await connection.wait_closed()
+    assert _pooled(pool) == []
+    async with _connect(pool, ssh_server, client_key) as new_connection:
+        assert new_connection is not connection
+
+
+async def test_command_errors_keep_the_connection(pool, ssh_server, client_key):
+    with pytest.raises(asyncssh.ProcessError):
+        async with _connect(pool, ssh_server, client_key) as connection:
+            await connection.run("exit 3", check=True)
+
+    async with _connect(pool, ssh_server, client_key) as reused:
+        assert reused is connection
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import asyncssh
+import pytest
+
+from services import throughput_probe
+from services.throughput_probe import (
+    NETWORK_PROBE_INTERVAL,
+    SAMPLE_BYTES,
+    TARGET_TRANSFER_SECONDS,
+    NetworkProber,
+    measure_throughput,
+    probe_size,
+)
+from testing.local_ssh import LatencyProxy, LocalSSHServer
+
+pytestmark = pytest.mark.anyio
+
+MINER = "miner"
+EXECUTOR = "executor"
+
+
+@pytest.fixture
+async def ssh_server():
+    server = LocalSSHServer()
+    await server.start()
+    yield server
+    server.close()
+
+
+def _connector(port: int):
+    connects = []
+
+    @asynccontextmanager
+    async def connect():
+        connects.append(port)
+        async with asyncssh.connect(
+            "127.0.0.1", port, username="test", known_hosts=None, client_keys=None
+        ) as connection:
+            yield connection
+
+    connect.connects = connects
+    return connect
+
+
+def _failing_connect():
+    @asynccontextmanager
+    async def connect():
+        raise ConnectionRefusedError("executor is down")
+        yield
+
+    return connect
+
+
+def test_probe_size_follows_the_sampled_speed():
+    # 8 Mbit/s is a MB/s
+    assert probe_size(8, max_size=2**30) == 1_000_000 * TARGET_TRANSFER_SECONDS
+    assert probe_size(10_000, max_size=2**24) == 2**24
+    # never less than the sample, unless the cap is
+    assert probe_size(0.01, max_size=2**24) == SAMPLE_BYTES
+    assert probe_size(0.01, max_size=1000) == 1000
+
+
+async def test_measures_a_bandwidth_limited_link(ssh_server):
+    bandwidth_mbps = 40
+    proxy = LatencyProxy(ssh_server.port, latency=0.01, bandwidth=bandwidth_mbps * 1e6)
+    await proxy.start()
+    try:
+        async with _connector(proxy.port)() as ssh_client:
+            network = await measure_throughput(ssh_client, max_size=2**21, timeout=30)
+    finally:
+        proxy.close()
+
+    for direction in ("upload", "download"):
+        assert 0.5 * bandwidth_mbps < network[f"{direction}_speed"] < 1.1 * bandwidth_mbps
+        # sized from the sample, up to the cap
+        assert SAMPLE_BYTES < network[f"{direction}_bytes"] <= 2**21
+
+
+async def test_recent_speeds_are_not_measured_again(redis_service, ssh_server):
+    prober = NetworkProber(redis_service, concurrency=1, max_size=2**20, timeout=30)
+    connect = _connector(ssh_server.port)
+
+    first = await prober.speeds(MINER, EXECUTOR, connect)
+    assert first["upload_speed"] > 0 and first["download_speed"] > 0
+    assert await prober.speeds(MINER, EXECUTOR, connect) == first
+    assert len(connect.connects) == 1
+
+
+async def test_old_speeds_are_measured_again(redis_service, ssh_server):
+    prober = NetworkProber(redis_service, concurrency=1, max_size=2**20, timeout=30)
+    connect = _connector(ssh_server.port)
+    old = {"upload_speed": 1.0, "download_speed": 1.0, "measured_at": time.time() - NETWORK_PROBE_INTERVAL - 1}
+    await redis_service.set(prober._key(MINER, EXECUTOR), json.dumps(old))
+
+    network = await prober.speeds(MINER, EXECUTOR, connect)
+    assert network["measured_at"] > old["measured_at"]
+    assert len(connect.connects) == 1
+
+
+async def test_failed_probe_without_history_is_unmeasured(redis_service):
+    prober = NetworkProber(redis_service, concurrency=1, max_size=2**20, timeout=30)
+
+    network = await prober.speeds(MINER, EXECUTOR, _failing_connect())
+    assert network["upload_speed"] is None and network["download_speed"] is None
+    assert "executor is down" in network["unmeasured"]
+
+
+async def test_timed_out_probe_keeps_the_last_speeds(redis_service, ssh_server):
+    prober = NetworkProber(redis_service, concurrency=1, max_size=2**20, timeout=0.001)
+    old = {"upload_speed": 5.0, "download_speed": 6.0, "measured_at": time.time() - NETWORK_PROBE_INTERVAL - 1}
+    await redis_service.set(prober._key(MINER, EXECUTOR), json.dumps(old))
+
+    network = await prober.speeds(MINER, EXECUTOR, _connector(ssh_server.port))
+    assert (network["upload_speed"], network["download_speed"]) == (5.0, 6.0)
+    assert "TimeoutError" in network["probe_error"]
+
+
+async def test_probes_wait_for_a_slot(redis_service, ssh_server, monkeypatch):
+    prober = NetworkProber(redis_service, concurrency=1, max_size=2**20, timeout=30)
+    connect = _connector(ssh_server.port)
+
+    async with prober.semaphore:
+        waiting = asyncio.create_task(prober.speeds(MINER, EXECUTOR, connect))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+    assert (await waiting)["upload_speed"] > 0
+
+    # but only for so long
+    monkeypatch.setattr(throughput_probe, "NETWORK_PROBE_SLOT_TIMEOUT", 0.05)
+    async with prober.semaphore:
+        network = await prober.speeds(MINER, "other-executor", connect)
+    assert "No network probe slot" in network["unmeasured"]
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from bittensor.utils import weight_utils
+
+from core.weights import WeightsEngine, convert_weights_for_emit, process_weights
+
+NETUID = 1
+
+
+def _legacy(weights: np.ndarray, min_allowed_weights: int, max_weight_limit: float, exclude_quantile=0):
+    """process_weights_for_netuid with the chain parameters served locally."""
+    n = weights.size
+    subtensor = SimpleNamespace(
+        min_allowed_weights=lambda netuid: min_allowed_weights,
+        max_weight_limit=lambda netuid: max_weight_limit,
+    )
+    return weight_utils.process_weights_for_netuid(
+        uids=np.arange(n, dtype=np.int64),
+        weights=weights,
+        netuid=NETUID,
+        subtensor=subtensor,
+        metagraph=SimpleNamespace(n=n),
+        exclude_quantile=exclude_quantile,
+    )
+
+
+def _scores(n: int, non_zero: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    weights = np.zeros(n, dtype=np.float32)
+    weights[rng.choice(n, non_zero, replace=False)] = rng.uniform(0.1, 100, non_zero)
+    return weights
+
+
+@pytest.mark.parametrize(
+    "n, non_zero, min_allowed_weights, max_weight_limit, exclude_quantile",
+    [
+        (256, 200, 8, 0.1, 0),
+        (256, 30, 8, 0.05, 0),
+        (256, 100, 8, 0.5, 10_000),
+        # fewer non-zero weights than allowed, everybody gets a little
+        (64, 3, 8, 0.2, 0),
+        # nothing to weigh, or a subnet smaller than the minimum
+        (64, 0, 8, 0.2, 0),
+        (4, 4, 8, 0.2, 0),
+    ],
+)
+@pytest.mark.parametrize("seed", [0, 1])
+def test_matches_bittensor(n, non_zero, min_allowed_weights, max_weight_limit, exclude_quantile, seed):
+    weights = _scores(n, non_zero, seed)
+
+    uids, processed = process_weights(
+        uids=np.arange(n, dtype=np.int64),
+        weights=weights,
+        n=n,
+        min_allowed_weights=min_allowed_weights,
+        max_weight_limit=max_weight_limit,
+        exclude_quantile=exclude_quantile,
+    )
+    legacy_uids, legacy_processed = _legacy(
+        weights, min_allowed_weights, max_weight_limit, exclude_quantile
+    )
+
+    np.testing.assert_array_equal(uids, legacy_uids)
+    np.testing.assert_allclose(processed, legacy_processed, rtol=1e-6)
+    assert convert_weights_for_emit(uids, processed) == tuple(
+        weight_utils.convert_weights_and_uids_for_emit(legacy_uids, legacy_processed)
+    )
+
+
+def test_convert_rejects_bad_input():
+    with pytest.raises(ValueError):
+        convert_weights_for_emit(np.arange(2), np.ones(3))
+    with pytest.raises(ValueError):
+        convert_weights_for_emit(np.arange(2), np.array([1.0, -1.0]))
+    assert convert_weights_for_emit(np.arange(2), np.zeros(2)) == ([], [])
+
+
+def test_scores_follow_their_uid_across_metagraph_changes():
+    engine = WeightsEngine()
+    engine.sync_metagraph(["a", "b", "c"])
+    engine.load_scores({"a": 1, "b": 2, "c": 3, "gone": 9})
+    np.testing.assert_array_equal(engine.scores, [1, 2, 3])
+
+    # b was deregistered and its uid taken by d, a new uid came in for e
+    engine.sync_metagraph(["a", "d", "c", "e"])
+    np.testing.assert_array_equal(engine.scores, [1, 0, 3, 0])
+
+    engine.add_scores({"d": 4, "a": 1})
+    np.testing.assert_array_equal(engine.scores, [2, 4, 3, 0])
+
+
+def test_compute_weighs_active_uids_only():
+    engine = WeightsEngine()
+    engine.sync_metagraph(["a", "b", "c"], active_uids=[0, 2])
+    engine.load_scores({"a": 1, "b": 5, "c": 3})
+
+    uids, weights = engine.compute(min_allowed_weights=1, max_weight_limit=1)
+    np.testing.assert_array_equal(uids, [0, 2])
+    np.testing.assert_allclose(weights, [0.25, 0.75])
+
+    # a what-if leaves the scores alone
+    uids, weights = engine.compute(min_allowed_weights=1, max_weight_limit=1, overrides={"a": 3})
+    np.testing.assert_allclose(weights, [0.5, 0.5])
+    np.testing.assert_array_equal(engine.scores, [1, 5, 3])